@@ -1,9 +1,270 @@
-from django.contrib import admin
-from .models import Student, Course, Enrollment, Grade, Administrator, CourseManagement
-
-admin.site.register(Student)
-admin.site.register(Course)
-admin.site.register(Enrollment)
-admin.site.register(Grade)
-admin.site.register(Administrator)
-admin.site.register(CourseManagement)
\ No newline at end of file
+from django.contrib import admin, messages
+from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.forms import ModelForm
+from django.forms.models import BaseInlineFormSet
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from . import prerequisites, queryplans, search, timetable
+from .enrollment import close_enrollments
+from .models import (
+    Announcement, Assignment, Attendance, AttendanceArchive, Course, CoursePrerequisite, Department, Enrollment, Grade, GradeArchive,
+    MeetingSlot, Notification, Student, TeacherProfile, Term, User,
+)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that takes large counts from the query planner instead of COUNT(*)
+
+    Counts the planner puts below exact_below are still counted exactly, as is
+    everything on databases without estimates.
+    """
+    exact_below = 10000
+
+    @cached_property
+    def count(self):
+        estimate = queryplans.estimated_rows(self.object_list)
+        if estimate is None or estimate < self.exact_below:
+            return super().count
+        return estimate
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables too large to count or sort on every page
+
+    Foreign keys are shown by their codes through list_select_related and
+    edited with autocomplete widgets instead of full dropdowns.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-pk',)
+    list_per_page = 50
+
+
+class SearchIndexAdminMixin:
+    """Answer the changelist search box from the core.search index instead of icontains scans
+
+    Terms too short for the index fall back to the regular search_fields lookup.
+    """
+    search_kind = None
+    search_limit = 200
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search.words(search_term):
+            return super().get_search_results(request, queryset, search_term)
+        ids = search.search_ids(self.search_kind, search_term, self.search_limit)
+        return queryset.filter(pk__in=ids), False
+
+
+@admin.register(User)
+class UserAdmin(BaseUserAdmin):
+    list_display = ('username', 'email', 'first_name', 'last_name', 'role', 'is_active')
+    list_filter = ('role', 'is_active', 'is_staff')
+    fieldsets = BaseUserAdmin.fieldsets + (
+        ('Profile', {'fields': ('role', 'phone', 'address', 'date_of_birth')}),
+    )
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search.words(search_term):
+            return super().get_search_results(request, queryset, search_term)
+        # Admin and staff accounts have no index row; find them by username or email
+        return queryset.filter(
+            Q(student__pk__in=search.search_ids('student', search_term))
+            | Q(teacherprofile__pk__in=search.search_ids('teacher', search_term))
+            | Q(username__istartswith=search_term.strip())
+            | Q(email__istartswith=search_term.strip())
+        ), False
+
+
+@admin.register(Student)
+class StudentAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
+    search_kind = 'student'
+    list_display = ('student_id', 'user', 'department', 'gpa')
+    list_select_related = ('user', 'department')
+    search_fields = ('student_id', 'user__first_name', 'user__last_name', 'user__email')
+
+
+@admin.register(TeacherProfile)
+class TeacherProfileAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
+    search_kind = 'teacher'
+    list_display = ('employee_id', 'user', 'department', 'student_load')
+    list_select_related = ('user', 'department')
+    search_fields = ('employee_id', 'user__first_name', 'user__last_name', 'user__email')
+
+
+class PrerequisiteFormSet(BaseInlineFormSet):
+    def clean(self):
+        """Reject the edits that together would make the prerequisite graph cyclic"""
+        super().clean()
+        graph = prerequisites.load()
+        added = []
+        for form in self.forms:
+            if not hasattr(form, 'cleaned_data') or not form.has_changed():
+                continue
+            if form.instance.pk is not None:
+                graph.remove(form.initial['course'], form.initial['prerequisite'])
+            prerequisite = form.cleaned_data.get('prerequisite')
+            if prerequisite is not None and not form.cleaned_data.get('DELETE'):
+                added.append((self.instance.pk, prerequisite.pk))
+        for course_id, prerequisite_id in added:
+            try:
+                graph.add(course_id, prerequisite_id)
+            except prerequisites.PrerequisiteCycle:
+                raise ValidationError('These prerequisites would make the course a prerequisite of itself.')
+
+
+class PrerequisiteInline(admin.TabularInline):
+    model = CoursePrerequisite
+    fk_name = 'course'
+    formset = PrerequisiteFormSet
+    autocomplete_fields = ('prerequisite',)
+    extra = 0
+
+
+@admin.register(Course)
+class CourseAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
+    search_kind = 'course'
+    list_display = ('code', 'name', 'department', 'credits', 'capacity', 'enrolled_count')
+    list_select_related = ('department',)
+    search_fields = ('code', 'name')
+    inlines = [PrerequisiteInline]
+
+
+@admin.register(Term)
+class TermAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name', 'start_date', 'end_date', 'is_closed', 'archived_at')
+    list_filter = ('is_closed',)
+
+
+class MeetingSlotForm(ModelForm):
+    class Meta:
+        model = MeetingSlot
+        fields = '__all__'
+
+    def clean(self):
+        """Reject a slot that double-books its teacher or room"""
+        cleaned_data = super().clean()
+        if not self.errors:
+            # The instance only takes the cleaned values after clean()
+            slot = MeetingSlot(pk=self.instance.pk, **{
+                field: cleaned_data.get(field) for field in ('term', 'teacher', 'room', 'weekday', 'start_time', 'end_time')
+            })
+            clashes = timetable.slot_conflicts(slot).select_related('course')
+            if clashes:
+                raise ValidationError(
+                    'The teacher or room is already booked by %(slots)s.',
+                    params={'slots': ', '.join(f'{slot.course.code} {slot}' for slot in clashes)},
+                )
+        return cleaned_data
+
+
+@admin.register(MeetingSlot)
+class MeetingSlotAdmin(admin.ModelAdmin):
+    form = MeetingSlotForm
+    list_display = ('course__code', 'term', 'weekday', 'start_time', 'end_time', 'room', 'teacher__employee_id')
+    list_select_related = ('course', 'term', 'teacher')
+    list_filter = ('term', 'weekday')
+    search_fields = ('course__code', 'room')
+    autocomplete_fields = ('course', 'teacher')
+
+
+@admin.register(Department)
+class DepartmentAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name', 'head')
+    list_select_related = ('head',)
+    search_fields = ('code', 'name')
+    autocomplete_fields = ('head',)
+
+
+@admin.register(Enrollment)
+class EnrollmentAdmin(LargeTableAdmin):
+    list_display = ('student__student_id', 'course__code', 'teacher__employee_id', 'term', 'enrolled_date', 'is_active')
+    list_select_related = ('student', 'course', 'teacher', 'term')
+    list_filter = ('is_active', 'term')
+    autocomplete_fields = ('student', 'course', 'teacher')
+    actions = ('close_selected',)
+
+    @admin.action(description='Close selected enrollments')
+    def close_selected(self, request, queryset):
+        closed = close_enrollments(queryset)
+        self.message_user(request, f'Closed {closed} enrollments', messages.SUCCESS)
+
+
+@admin.register(Assignment)
+class AssignmentAdmin(LargeTableAdmin):
+    list_display = ('title', 'course__code', 'teacher__employee_id', 'assignment_type', 'max_marks', 'due_date', 'is_active')
+    list_select_related = ('course', 'teacher')
+    list_filter = ('is_active', 'assignment_type')
+    search_fields = ('title', 'course__code')
+    autocomplete_fields = ('course', 'teacher')
+    actions = ('deactivate_selected',)
+
+    def get_queryset(self, request):
+        # __str__ shows the course code, also in the Grade autocomplete results
+        return super().get_queryset(request).select_related('course')
+
+    @admin.action(description='Deactivate selected assignments')
+    def deactivate_selected(self, request, queryset):
+        deactivated = queryset.filter(is_active=True).update(is_active=False)
+        self.message_user(request, f'Deactivated {deactivated} assignments', messages.SUCCESS)
+
+
+@admin.register(Grade)
+class GradeAdmin(LargeTableAdmin):
+    list_display = (
+        'student__student_id', 'assignment__course__code', 'assignment__title', 'marks_obtained',
+        'assignment__max_marks', 'graded_by__employee_id', 'graded_at',
+    )
+    list_select_related = ('student', 'assignment__course', 'graded_by')
+    autocomplete_fields = ('student', 'assignment', 'graded_by')
+
+
+@admin.register(Attendance)
+class AttendanceAdmin(LargeTableAdmin):
+    list_display = ('student__student_id', 'course__code', 'date', 'is_present', 'marked_by__employee_id', 'remarks')
+    list_select_related = ('student', 'course', 'marked_by')
+    list_filter = ('is_present',)
+    autocomplete_fields = ('student', 'course', 'marked_by')
+
+
+@admin.register(Announcement)
+class AnnouncementAdmin(admin.ModelAdmin):
+    list_display = ('title', 'priority', 'target_audience', 'author', 'is_active', 'created_at', 'expires_at')
+    list_select_related = ('author',)
+    list_filter = ('is_active', 'priority', 'target_audience')
+    search_fields = ('title',)
+    autocomplete_fields = ('author', 'department', 'course')
+
+
+@admin.register(Notification)
+class NotificationAdmin(LargeTableAdmin):
+    list_display = ('recipient', 'title', 'is_read', 'created_at')
+    list_select_related = ('recipient',)
+    list_filter = ('is_read',)
+    autocomplete_fields = ('recipient',)
+
+
+class ArchiveAdmin(LargeTableAdmin):
+    """Archived rows are read-only; core.archive writes them"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(GradeArchive)
+class GradeArchiveAdmin(ArchiveAdmin):
+    list_display = ('student__student_id', 'assignment__course__code', 'assignment__title', 'marks_obtained', 'term', 'graded_at')
+    list_select_related = ('student', 'assignment__course', 'term')
+    list_filter = ('term',)
+
+
+@admin.register(AttendanceArchive)
+class AttendanceArchiveAdmin(ArchiveAdmin):
+    list_display = ('student__student_id', 'course__code', 'date', 'is_present', 'term')
+    list_select_related = ('student', 'course', 'term')
+    list_filter = ('term',)
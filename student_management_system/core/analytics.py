@@ -0,0 +1,122 @@
+# Course grade analytics
+#
+# A course's marks are fetched with one values_list() query into NumPy arrays
+# and every statistic is computed vectorized: per assignment over the grade
+# percentages, and per course over each student's overall percentage (summed
+# marks over summed maximum marks, the same figure CourseGradeTotal keeps).
+# Marks are held as integer hundredths, so letter grades compare
+# marks * 100 >= max_marks * cutoff exactly, as Grade.letter_grade and
+# GradeQuerySet.with_letter_grades do, rather than a rounded float percentage.
+# Like the totals, the marks include the grades of archived terms.
+# NumPy is only needed here, so it is imported lazily.
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .archive import grade_history
+from .models import FAILING_GRADE, LETTER_GRADES
+
+PERCENTILES = (10, 25, 50, 75, 90)
+HISTOGRAM_BINS = 10
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImproperlyConfigured('Course analytics requires the numpy package')
+    return numpy
+
+
+def letter_grades(marks, max_marks):
+    """Vectorized letter grade for arrays of marks in hundredths and integer maximum marks"""
+    np = _numpy()
+    cutoffs = np.array([cutoff for cutoff, _ in reversed(LETTER_GRADES)], dtype=np.int64)
+    letters = np.array([FAILING_GRADE] + [letter for _, letter in reversed(LETTER_GRADES)])
+    marks = np.asarray(marks, dtype=np.int64)
+    max_marks = np.asarray(max_marks, dtype=np.int64)
+    # Number of cutoffs reached: marks / 100 * 100 >= max_marks * cutoff
+    reached = (marks[:, None] >= max_marks[:, None] * cutoffs).sum(axis=1)
+    return letters[reached]
+
+
+def describe(marks, max_marks):
+    """Summary statistics, histogram and letter-grade counts for arrays of marks
+    in hundredths and maximum marks"""
+    np = _numpy()
+    marks = np.asarray(marks, dtype=np.int64)
+    if not marks.size:
+        return {'count': 0}
+    percentages = marks / np.asarray(max_marks, dtype=float)
+    counts, edges = np.histogram(percentages.clip(0, 100), bins=HISTOGRAM_BINS, range=(0, 100))
+    letters, letter_counts = np.unique(letter_grades(marks, max_marks), return_counts=True)
+    found = dict(zip(letters.tolist(), letter_counts.tolist()))
+    return {
+        'count': int(percentages.size),
+        'mean': round(float(percentages.mean()), 2),
+        'median': round(float(np.median(percentages)), 2),
+        'std': round(float(percentages.std()), 2),
+        'min': round(float(percentages.min()), 2),
+        'max': round(float(percentages.max()), 2),
+        'percentiles': {
+            str(q): round(float(value), 2)
+            for q, value in zip(PERCENTILES, np.percentile(percentages, PERCENTILES))
+        },
+        'histogram': [
+            {'from': int(low), 'to': int(high), 'count': int(count)}
+            for low, high, count in zip(edges[:-1], edges[1:], counts)
+        ],
+        'letter_grades': {
+            letter: found.get(letter, 0) for letter in [l for _, l in LETTER_GRADES] + [FAILING_GRADE]
+        },
+    }
+
+
+def course_marks(course_id):
+    """A course's live and archived grades from one query
+
+    Returns parallel arrays (assignment ids, student ids, marks in hundredths,
+    max marks) and the titles of the graded assignments by id.
+    """
+    np = _numpy()
+    fields = ('assignment_id', 'student_id', 'marks_obtained', 'assignment__max_marks', 'assignment__title')
+    rows = [
+        [row[field] for field in fields]
+        for row in grade_history(*fields, assignment__course_id=course_id, assignment__max_marks__gt=0)
+    ]
+    assignment_ids, student_ids, marks, max_marks, titles = zip(*rows) if rows else ((),) * 5
+    return (
+        np.array(assignment_ids, dtype=np.int64),
+        np.array(student_ids, dtype=np.int64),
+        # Two decimal places, so the rounded hundredths are exact
+        np.rint(np.array(marks, dtype=float) * 100).astype(np.int64),
+        np.array(max_marks, dtype=np.int64),
+    ), dict(zip(assignment_ids, titles))
+
+
+def course_report(course_id):
+    """Grade statistics for a course, per assignment and overall"""
+    np = _numpy()
+    (assignment_ids, student_ids, marks, max_marks), titles = course_marks(course_id)
+    assignments = []
+    if marks.size:
+        order = np.argsort(assignment_ids, kind='stable')
+        unique_ids, starts = np.unique(assignment_ids[order], return_index=True)
+        groups = zip(np.split(marks[order], starts[1:]), np.split(max_marks[order], starts[1:]))
+        for assignment_id, (group, group_max) in zip(unique_ids.tolist(), groups):
+            assignments.append({
+                'id': assignment_id,
+                'title': titles.get(assignment_id),
+                **describe(group, group_max),
+            })
+
+    students = np.unique(student_ids, return_inverse=True)[1] if marks.size else student_ids
+    # Integer sums, well inside float64's exact range
+    obtained = np.rint(np.bincount(students, weights=marks)).astype(np.int64)
+    possible = np.rint(np.bincount(students, weights=max_marks)).astype(np.int64)
+    return {
+        'course_id': course_id,
+        'grades': int(marks.size),
+        'students': int(obtained.size),
+        'course': describe(obtained, possible),
+        'assignments': assignments,
+    }
@@ -2,4 +2,10 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'core'
\ No newline at end of file
+    name = 'core'
+
+    def ready(self):
+        # Import the modules that register signal handlers; fragments goes last so
+        # its cache version bumps run after the other invalidations of a write
+        from . import audience, enrollment, gpa, identity, notifications, prerequisites, rankings, search, stats  # noqa: F401
+        from . import fragments  # noqa: F401
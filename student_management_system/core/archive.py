@@ -0,0 +1,167 @@
+# Term archival
+#
+# Grades and attendance belong to a term through the student's enrollment in
+# the course. Once a term is closed, archive_term() moves those rows into
+# GradeArchive and AttendanceArchive in batches, one transaction per batch:
+# each batch is copied (keeping its primary keys, so a repeated copy is a
+# no-op) and then deleted from the live table. A run that stops part way is
+# resumed by running it again, since the rows already moved no longer match.
+# The live tables, and every index on them, then only grow with the terms
+# still open.
+#
+# Moving rows does not change anything a student sees: the course totals
+# behind Student.gpa already count them, rebuild_gpas() counts the archive
+# too, and grade_history(), the exports and the analytics read both tables.
+# A student can still be graded or marked again for an archived assignment or
+# session; the new live row then replaces the archived one (see
+# supersede_grades() and supersede_attendance()), so no pair is counted twice.
+#
+# prune_notifications() deletes read notifications older than
+# NOTIFICATION_RETENTION_DAYS, also in batches.
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import fragments
+from .models import Assignment, Attendance, AttendanceArchive, Enrollment, Grade, GradeArchive, Notification, Term
+
+BATCH_SIZE = 1000
+NOTIFICATION_RETENTION_DAYS = 180
+
+GRADE_FIELDS = ('id', 'student_id', 'assignment_id', 'marks_obtained', 'feedback', 'graded_by_id', 'graded_at')
+ATTENDANCE_FIELDS = ('id', 'student_id', 'course_id', 'date', 'is_present', 'marked_by_id', 'remarks')
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def _term_enrollments(term, course):
+    return Exists(Enrollment.objects.filter(term=term, student=OuterRef('student'), course=OuterRef(course)))
+
+
+def term_grades(term):
+    """Live grades of a term's enrollments"""
+    return Grade.objects.filter(_term_enrollments(term, 'assignment__course'))
+
+
+def term_attendance(term):
+    """Live attendance records of a term's enrollments"""
+    return Attendance.objects.filter(_term_enrollments(term, 'course'))
+
+
+def _delete_moved(model, ids, using):
+    # A plain DELETE: the Grade signals would take the rows out of the GPA totals
+    meta = model._meta
+    quote = connections[using].ops.quote_name
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(meta.db_table)} WHERE {quote(meta.pk.column)} IN ({", ".join(["%s"] * len(ids))})',
+            ids,
+        )
+
+
+def _move_batch(queryset, fields, archive_model, term, batch_size):
+    rows = list(queryset.order_by('pk').values(*fields)[:batch_size])
+    if not rows:
+        return rows
+    with transaction.atomic():
+        archive_model.objects.bulk_create([archive_model(term=term, **row) for row in rows], ignore_conflicts=True)
+        _delete_moved(queryset.model, [row['id'] for row in rows], queryset.db)
+    return rows
+
+
+def archive_term(term, batch_size=BATCH_SIZE):
+    """Move a closed term's grades and attendance to the archive tables
+
+    Returns a dict with the number of grades and attendance records moved.
+    """
+    if not term.is_closed:
+        raise ArchiveError(f'{term} is still open')
+    moved = {'grades': 0, 'attendance': 0}
+    while True:
+        rows = _move_batch(term_grades(term), GRADE_FIELDS, GradeArchive, term, batch_size)
+        if not rows:
+            break
+        moved['grades'] += len(rows)
+        # The dashboards list recent live grades
+        course_ids = Assignment.objects.filter(pk__in={row['assignment_id'] for row in rows}).values_list(
+            'course_id', flat=True
+        )
+        fragments.grades_changed({row['student_id'] for row in rows}, set(course_ids))
+    while True:
+        rows = _move_batch(term_attendance(term), ATTENDANCE_FIELDS, AttendanceArchive, term, batch_size)
+        if not rows:
+            break
+        moved['attendance'] += len(rows)
+    Term.objects.filter(pk=term.pk).update(archived_at=timezone.now())
+    return moved
+
+
+def archive_closed_terms(batch_size=BATCH_SIZE):
+    """archive_term() for every closed term not archived yet; returns moved counts by term code"""
+    return {
+        term.code: archive_term(term, batch_size)
+        for term in Term.objects.filter(is_closed=True, archived_at__isnull=True).order_by('start_date')
+    }
+
+
+def grade_history(*fields, **filters):
+    """Live and archived grades as one values() queryset, of GRADE_FIELDS by default
+
+    filters apply to both tables, e.g. student=... or assignment__course=...,
+    and so can fields, e.g. assignment__max_marks.
+    """
+    fields = fields or GRADE_FIELDS
+    live = Grade.objects.filter(**filters).values(*fields)
+    return live.union(GradeArchive.objects.filter(**filters).values(*fields), all=True)
+
+
+def attendance_history(*fields, **filters):
+    """Live and archived attendance as one values() queryset, of ATTENDANCE_FIELDS by default"""
+    fields = fields or ATTENDANCE_FIELDS
+    live = Attendance.objects.filter(**filters).values(*fields)
+    return live.union(AttendanceArchive.objects.filter(**filters).values(*fields), all=True)
+
+
+def _take_archived(archive_model, fields, keys, values=()):
+    """Delete the archived rows whose fields match one of keys; returns their values"""
+    keys = set(keys)
+    if not keys:
+        return []
+    lookups = {f'{field}__in': {key[position] for key in keys} for position, field in enumerate(fields)}
+    rows = [
+        row for row in archive_model.objects.filter(**lookups).values_list('pk', *fields, *values)
+        if row[1:len(fields) + 1] in keys
+    ]
+    if rows:
+        archive_model.objects.filter(pk__in=[row[0] for row in rows]).delete()
+    return [row[len(fields) + 1:] for row in rows]
+
+
+def supersede_grades(pairs):
+    """Delete the archived grades of (student id, assignment id) pairs graded again; returns their marks"""
+    return [marks for marks, in _take_archived(GradeArchive, ('student_id', 'assignment_id'), pairs, ('marks_obtained',))]
+
+
+def supersede_attendance(keys):
+    """Delete the archived attendance of (student id, course id, date) keys marked again"""
+    _take_archived(AttendanceArchive, ('student_id', 'course_id', 'date'), keys)
+
+
+def prune_notifications(days=None, batch_size=BATCH_SIZE):
+    """Delete read notifications older than the retention window; returns how many were deleted"""
+    if days is None:
+        days = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', NOTIFICATION_RETENTION_DAYS)
+    expired = Notification.objects.filter(is_read=True, created_at__lt=timezone.now() - timedelta(days=days))
+    deleted = 0
+    while True:
+        ids = list(expired.order_by().values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        deleted += Notification.objects.filter(pk__in=ids).delete()[0]
+    return deleted
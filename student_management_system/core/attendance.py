@@ -0,0 +1,159 @@
+# Bulk attendance marking and per-course attendance matrices
+#
+# A class session is recorded with a single INSERT ... ON CONFLICT over the
+# (student, course, date) unique key. Reads return an AttendanceMatrix: one
+# pair of integer bitsets per student (recorded days, present days) indexed by
+# the session dates, built from a single query over the live and archived
+# records that also carries each student's totals as window aggregates.
+# Marking a session again replaces its archived records.
+
+from django.db import connections, transaction
+
+from .archive import attendance_history, supersede_attendance
+from .models import Attendance, Enrollment, Student
+
+
+class AttendanceMatrix:
+    """Student x date attendance stored as two bitsets per student"""
+
+    def __init__(self, students, dates, recorded, present, totals):
+        self.students = students      # [(pk, student_id code)]
+        self.dates = dates            # sorted session dates
+        self.recorded = recorded      # per student, bit j set when dates[j] was marked
+        self.present = present        # per student, bit j set when present on dates[j]
+        self.totals = totals          # per student, (sessions, present) from SQL
+
+    def cell(self, row, column):
+        """True, False, or None when the student has no record for that date"""
+        if not self.recorded[row] >> column & 1:
+            return None
+        return bool(self.present[row] >> column & 1)
+
+    def percentage(self, row):
+        sessions, present = self.totals[row]
+        return round(present * 100 / sessions, 2) if sessions else None
+
+    def as_dict(self):
+        """Compact JSON form; each row is a string of 1 (present), 0 (absent), - (no record)"""
+        return {
+            'dates': [day.isoformat() for day in self.dates],
+            'students': [
+                {
+                    'id': pk,
+                    'student_id': code,
+                    'sessions': self.totals[row][0],
+                    'present': self.totals[row][1],
+                    'percentage': self.percentage(row),
+                    'row': ''.join(
+                        '-' if cell is None else '1' if cell else '0'
+                        for cell in (self.cell(row, column) for column in range(len(self.dates)))
+                    ),
+                }
+                for row, (pk, code) in enumerate(self.students)
+            ],
+        }
+
+
+def mark_session(teacher, course_id, day, records):
+    """Upsert a whole class session with one statement, replacing its archived records
+
+    records are dicts with student_id (the Student.student_id code),
+    is_present and an optional remarks. Only students actively enrolled in
+    the course with this teacher are accepted. Returns the number saved and
+    per-record errors (numbered from 1).
+    """
+    codes = {str(record.get('student_id') or '').strip() for record in records}
+    enrolled = dict(
+        Enrollment.objects.filter(
+            course_id=course_id, teacher=teacher, is_active=True, student__student_id__in=codes
+        ).values_list('student__student_id', 'student_id')
+    )
+    rows = {}
+    errors = []
+    for number, record in enumerate(records, start=1):
+        code = str(record.get('student_id') or '').strip()
+        if code not in enrolled:
+            errors.append({'row': number, 'error': f'{code!r} is not enrolled in this course'})
+            continue
+        if not isinstance(record.get('is_present'), bool):
+            errors.append({'row': number, 'error': 'is_present must be true or false'})
+            continue
+        rows[enrolled[code]] = Attendance(
+            student_id=enrolled[code],
+            course_id=course_id,
+            date=day,
+            is_present=record['is_present'],
+            marked_by=teacher,
+            remarks=(record.get('remarks') or '')[:100],
+        )
+    # Together, so a record is never both live and archived
+    with transaction.atomic():
+        Attendance.objects.bulk_create(
+            list(rows.values()),
+            update_conflicts=True,
+            unique_fields=['student', 'course', 'date'],
+            update_fields=['is_present', 'marked_by', 'remarks'],
+        )
+        supersede_attendance((student_id, course_id, day) for student_id in rows)
+    return {'saved': len(rows), 'errors': errors}
+
+
+def _matrix_rows(history):
+    """(student pk, code, date, is_present, sessions, present) rows of an attendance_history() union
+
+    Django cannot aggregate over a union, so the totals are window aggregates
+    of a raw query selecting from it.
+    """
+    sql, params = history.query.get_compiler(history.db).as_sql()
+    connection = connections[history.db]
+    student = Student._meta
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT history.student_id, student.{quote(student.get_field("student_id").column)}, '
+            f'history.{quote("date")}, history.is_present, '
+            f'COUNT(*) OVER (PARTITION BY history.student_id), '
+            f'SUM(CASE WHEN history.is_present THEN 1 ELSE 0 END) OVER (PARTITION BY history.student_id) '
+            f'FROM ({sql}) history INNER JOIN {quote(student.db_table)} student '
+            f'ON student.{quote(student.pk.column)} = history.student_id ORDER BY 2, 3',
+            params,
+        )
+        rows = cursor.fetchall()
+    # Raw rows skip the field converters (SQLite returns dates as text)
+    to_date = Attendance._meta.get_field('date').to_python
+    return [
+        (student_pk, code, to_date(day), bool(is_present), sessions, int(present_total))
+        for student_pk, code, day, is_present, sessions, present_total in rows
+    ]
+
+
+def course_matrix(course_id, start=None, end=None):
+    """A course's attendance, archived terms included, as an AttendanceMatrix from one query"""
+    filters = {'course_id': course_id}
+    if start:
+        filters['date__gte'] = start
+    if end:
+        filters['date__lte'] = end
+    rows = _matrix_rows(attendance_history('student_id', 'date', 'is_present', **filters))
+
+    students = []
+    index = {}
+    cells = []
+    totals = []
+    for student_pk, code, day, is_present, sessions, present_total in rows:
+        if student_pk not in index:
+            index[student_pk] = len(students)
+            students.append((student_pk, code))
+            totals.append((sessions, present_total))
+        cells.append((index[student_pk], day, is_present))
+
+    dates = sorted({day for _, day, _ in cells})
+    column = {day: position for position, day in enumerate(dates)}
+    recorded = [0] * len(students)
+    present = [0] * len(students)
+    for row, day, is_present in cells:
+        bit = 1 << column[day]
+        recorded[row] |= bit
+        if is_present:
+            present[row] |= bit
+    return AttendanceMatrix(students, dates, recorded, present, totals)
@@ -0,0 +1,120 @@
+# Announcement audience resolution
+#
+# A user's audience is their role, department and the courses they are
+# actively enrolled in (or teach). It is computed once, stored in the session
+# together with a per-user version token kept in the cache, and recomputed
+# only when an Enrollment or profile change retires that token. Tokens are
+# random, so one replacing an evicted token never matches an older session.
+
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Announcement, Enrollment, Student, TeacherProfile, User
+
+SESSION_KEY = '_audience'
+VERSION_KEY = 'audience_version:{}'
+
+ROLE_AUDIENCES = {
+    User.STUDENT: 'students',
+    User.TEACHER: 'teachers',
+}
+
+
+def compute_audience(user):
+    """Role, department id and active course ids for a user"""
+    department_id = None
+    course_ids = []
+    if user.role == User.STUDENT:
+        department_id = Student.objects.filter(user=user).values_list('department_id', flat=True).first()
+        course_ids = Enrollment.objects.filter(student__user=user, is_active=True).values_list('course_id', flat=True)
+    elif user.role == User.TEACHER:
+        department_id = TeacherProfile.objects.filter(user=user).values_list('department_id', flat=True).first()
+        course_ids = Enrollment.objects.filter(teacher__user=user, is_active=True).values_list('course_id', flat=True)
+    return {
+        'role': user.role,
+        'department_id': department_id,
+        'course_ids': sorted(set(course_ids)),
+    }
+
+
+def _version(user_id):
+    key = VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        # add() so concurrent first readers agree on one token
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate(*user_ids):
+    """Make the cached audience of these users stale"""
+    cache.delete_many([VERSION_KEY.format(user_id) for user_id in user_ids])
+
+
+def get_audience(request, user=None):
+    """The request user's audience, from the request, then the session, then the database
+
+    Async views pass the user they already resolved with request.auser().
+    """
+    audience = getattr(request, '_audience', None)
+    if audience is not None:
+        return audience
+    user = user or request.user
+    version = _version(user.pk)
+    session = getattr(request, 'session', None)
+    stored = session.get(SESSION_KEY) if session is not None else None
+    if stored and stored['user_id'] == user.pk and stored['version'] == version:
+        audience = stored['audience']
+    else:
+        audience = compute_audience(user)
+        if session is not None:
+            session[SESSION_KEY] = {'user_id': user.pk, 'version': version, 'audience': audience}
+    request._audience = audience
+    return audience
+
+
+def announcements_for(audience, now=None):
+    """Active, unexpired announcements addressed to an audience, in one query"""
+    now = now or timezone.now()
+    queryset = Announcement.objects.filter(
+        Q(expires_at__isnull=True) | Q(expires_at__gt=now),
+        is_active=True,
+    )
+    if audience['role'] == User.ADMIN:
+        return queryset
+    targets = Q(target_audience='all')
+    if audience['role'] in ROLE_AUDIENCES:
+        targets |= Q(target_audience=ROLE_AUDIENCES[audience['role']])
+    if audience['department_id'] is not None:
+        targets |= Q(target_audience='department', department_id=audience['department_id'])
+    if audience['course_ids']:
+        targets |= Q(target_audience='course', course_id__in=audience['course_ids'])
+    return queryset.filter(targets)
+
+
+# Signal handlers invalidating cached audiences
+
+def _invalidate_on_commit(*user_ids):
+    transaction.on_commit(lambda: invalidate(*user_ids))
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def invalidate_enrollment_audiences(sender, instance, **kwargs):
+    user_ids = list(Student.objects.filter(pk=instance.student_id).values_list('user_id', flat=True))
+    user_ids += TeacherProfile.objects.filter(pk=instance.teacher_id).values_list('user_id', flat=True)
+    _invalidate_on_commit(*user_ids)
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=TeacherProfile)
+def invalidate_profile_audience(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        _invalidate_on_commit(instance.user_id)
@@ -0,0 +1,390 @@
+# View and ORM benchmark harness
+#
+# Times every read view in core.views and a set of hot ORM queries against
+# whatever dataset is in the database (see the generate_university command)
+# and produces a JSON-serializable report. Templates are not rendered: the
+# view's context is evaluated the way a template would, so timings cover the
+# queries and Python work of each view.
+#
+# The views are found in core.views rather than listed here, so a new view is
+# benchmarked without further changes. Each one runs as the least privileged
+# sample user it answers a GET for, with its URL arguments filled in from the
+# sample data; views no user can GET (POST-only ones) are reported as
+# skipped, and SKIP_VIEWS leaves out the ones a GET must not be timed on.
+#
+# compare_handlers() load-tests the dashboards through Django's WSGI and ASGI
+# request handlers (full middleware stack, session authentication) at a fixed
+# concurrency: the sync views from a pool of threads against the async views
+# from concurrent tasks on one event loop. This module doubles as the URLconf
+# for that run, so it does not depend on the project's routes.
+#
+# compare_identity() runs the same dashboards one request at a time with the
+# database session store and ModelBackend (the baseline) and then with the
+# cached session store and core.identity's backend, reporting the median
+# latency and the queries per request of each.
+
+import asyncio
+import functools
+import inspect
+import platform
+import statistics
+import subprocess
+import threading
+import time
+from unittest import mock
+
+import django
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection, connections
+from django.db.models import QuerySet
+from django.http import HttpResponse
+from django.test import AsyncClient, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+
+from . import analytics, gpa, stats, views
+from .models import Announcement, Course, Enrollment, Grade, Student, TeacherProfile, User
+
+SKIP_VIEWS = {
+    # Ends the session of the request
+    'logout_view',
+}
+# Tried in turn for the user a view runs as; None is an anonymous visitor
+ROLES = (None, User.STUDENT, User.TEACHER, User.ADMIN)
+
+
+DASHBOARDS = (
+    ('admin_dashboard', User.ADMIN),
+    ('teacher_dashboard', User.TEACHER),
+    ('student_dashboard', User.STUDENT),
+)
+
+urlpatterns = [
+    route
+    for name, _ in DASHBOARDS
+    for route in (
+        path(f'wsgi/{name}/', getattr(views, name)),
+        path(f'asgi/{name}/', getattr(views, f'{name}_async')),
+    )
+]
+
+
+def evaluate_context(request, template_name, context=None, *args, **kwargs):
+    """Stand-in for render() that walks the context like a template would"""
+    for value in (context or {}).values():
+        if isinstance(value, (QuerySet, list)):
+            for obj in value:
+                str(obj)
+    return HttpResponse()
+
+
+def _sample_users():
+    users = {User.ADMIN: User.objects.filter(role=User.ADMIN).first()}
+    teacher = TeacherProfile.objects.filter(enrollment__isnull=False).select_related('user').first()
+    student = Student.objects.filter(enrollment__isnull=False).select_related('user').first()
+    users[User.TEACHER] = teacher and teacher.user
+    users[User.STUDENT] = student and student.user
+    if users[User.ADMIN] is None:
+        users[User.ADMIN] = User(username='benchmark-admin', role=User.ADMIN)
+    return users
+
+
+def view_functions():
+    """The views of core.views by name, apart from SKIP_VIEWS"""
+    found = {}
+    for name, func in vars(views).items():
+        if name.startswith('_') or name in SKIP_VIEWS or not callable(func):
+            continue
+        if getattr(func, '__module__', None) != views.__name__:
+            continue
+        if list(inspect.signature(func).parameters)[:1] == ['request']:
+            found[name] = func
+    return found
+
+
+def _view_arguments(users):
+    """URL arguments of the views by parameter name, from the sample data"""
+    student = Student.objects.filter(user=users[User.STUDENT]).first()
+    course = Course.objects.filter(enrollment__isnull=False).first()
+    return {
+        'student_id': student and student.pk,
+        'course_id': course and course.pk,
+        'dataset': 'grades',
+    }
+
+
+def _call_view(view, user, kwargs):
+    request = RequestFactory().get('/')
+    request.user = user
+
+    async def auser():
+        return user
+
+    request.auser = auser
+    if iscoroutinefunction(view):
+        response = async_to_sync(view)(request, **kwargs)
+    else:
+        response = view(request, **kwargs)
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def _runs_as(view, users, kwargs):
+    """The least privileged of users that view answers a GET for, or None"""
+    for role in ROLES:
+        user = users[role] if role else AnonymousUser()
+        if user is None:
+            continue
+        try:
+            response = _call_view(view, user, kwargs)
+        except Exception:
+            continue
+        if response.status_code < 300:
+            return user
+    return None
+
+
+def _orm_queries(users):
+    student = Student.objects.filter(user=users[User.STUDENT]).first()
+    teacher = TeacherProfile.objects.filter(user=users[User.TEACHER]).first()
+    course = Course.objects.filter(enrollment__isnull=False).first()
+    return {
+        'orm.student_grades': lambda: list(
+            Grade.objects.filter(student=student).select_related('assignment__course')
+        ),
+        'orm.teacher_enrollments': lambda: list(
+            Enrollment.objects.filter(teacher=teacher).select_related('course', 'student__user')
+        ),
+        'orm.course_gradebook': lambda: list(
+            Grade.objects.filter(assignment__course=course).select_related('student__user', 'assignment')
+        ),
+        'orm.active_announcements': lambda: list(
+            Announcement.objects.filter(is_active=True).order_by('-created_at')[:20]
+        ),
+        'orm.course_grade_report': lambda: analytics.course_report(course.pk),
+        'orm.refresh_student_gpa': lambda: gpa.refresh_gpas([student.pk]),
+        'orm.dashboard_stats_reconcile': stats.reconcile,
+    }
+
+
+def _measure(func, repeat):
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        queries = len(captured)
+    timings.sort()
+    return {
+        'repeat': repeat,
+        'queries': queries,
+        'min_ms': round(timings[0], 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(0.95 * len(timings)))], 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(repeat=20, only=None):
+    """Time every view and hot query; returns a JSON-serializable report"""
+    users = _sample_users()
+    arguments = _view_arguments(users)
+    benchmarks = {}
+    skipped = []
+    with mock.patch.object(views, 'render', evaluate_context):
+        for name, view in view_functions().items():
+            if only and not any(part in f'view.{name}' for part in only):
+                continue
+            parameters = list(inspect.signature(view).parameters)[1:]
+            kwargs = {parameter: arguments.get(parameter) for parameter in parameters}
+            user = None if None in kwargs.values() else _runs_as(view, users, kwargs)
+            if user is None:
+                skipped.append(name)
+                continue
+            benchmarks[f'view.{name}'] = functools.partial(_call_view, view, user, kwargs)
+    benchmarks.update(_orm_queries(users))
+
+    results = {}
+    with mock.patch.object(views, 'render', evaluate_context):
+        for name, func in benchmarks.items():
+            if only and not any(part in name for part in only):
+                continue
+            try:
+                results[name] = _measure(func, repeat)
+            except Exception as exc:
+                results[name] = {'error': f'{type(exc).__name__}: {exc}'}
+
+    return {
+        'meta': {
+            'revision': _git_revision(),
+            'timestamp': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'dataset': {
+                'users': User.objects.count(),
+                'courses': Course.objects.count(),
+                'enrollments': Enrollment.objects.count(),
+                'grades': Grade.objects.count(),
+            },
+            'skipped_views': skipped,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=0.2, noise_ms=1.0):
+    """Rows of (name, baseline median, current median, relative change, regressed)
+
+    A benchmark regresses when it issues more queries, or when its median is
+    more than threshold slower and by more than noise_ms.
+    """
+    rows = []
+    for name, result in current['results'].items():
+        before = baseline.get('results', {}).get(name, {})
+        if 'median_ms' not in result or 'median_ms' not in before:
+            continue
+        change = (result['median_ms'] - before['median_ms']) / before['median_ms'] if before['median_ms'] else 0
+        slower = change > threshold and result['median_ms'] - before['median_ms'] > noise_ms
+        regressed = slower or result['queries'] > before['queries']
+        rows.append((name, before['median_ms'], result['median_ms'], change, regressed))
+    return rows
+
+
+def _load_result(latencies, errors, elapsed, concurrency):
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'concurrency': concurrency,
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(latencies[len(latencies) // 2], 3) if latencies else None,
+        'p99_ms': round(latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))], 3) if latencies else None,
+    }
+
+
+def _wsgi_load(url, cookie, concurrency, requests):
+    latencies = []
+    errors = []
+
+    def worker(count):
+        client = Client(raise_request_exception=False)
+        client.cookies[settings.SESSION_COOKIE_NAME] = cookie
+        try:
+            for _ in range(count):
+                start = time.perf_counter()
+                response = client.get(url)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+        finally:
+            connections.close_all()
+
+    threads = [
+        threading.Thread(target=worker, args=(requests // concurrency + (n < requests % concurrency),))
+        for n in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return _load_result(latencies, len(errors), time.perf_counter() - start, concurrency)
+
+
+async def _asgi_load(url, cookie, concurrency, requests):
+    latencies = []
+    errors = []
+
+    async def worker(count):
+        client = AsyncClient(raise_request_exception=False)
+        client.cookies[settings.SESSION_COOKIE_NAME] = cookie
+        for _ in range(count):
+            start = time.perf_counter()
+            response = await client.get(url)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        worker(requests // concurrency + (n < requests % concurrency)) for n in range(concurrency)
+    ])
+    return _load_result(latencies, len(errors), time.perf_counter() - start, concurrency)
+
+
+def compare_handlers(concurrency=16, requests=400, only=None):
+    """p50/p99 latency and requests per second of each dashboard under WSGI and ASGI"""
+    users = _sample_users()
+    results = {}
+    with override_settings(ROOT_URLCONF=__name__), mock.patch.object(views, 'render', evaluate_context):
+        for name, role in DASHBOARDS:
+            if users[role] is None or users[role].pk is None or (only and not any(part in name for part in only)):
+                continue
+            client = Client()
+            client.force_login(users[role])
+            cookie = client.cookies[settings.SESSION_COOKIE_NAME].value
+            results[name] = {
+                'wsgi': _wsgi_load(f'/wsgi/{name}/', cookie, concurrency, requests),
+                'asgi': asyncio.run(_asgi_load(f'/asgi/{name}/', cookie, concurrency, requests)),
+            }
+    return results
+
+
+IDENTITY_BASELINE = {
+    'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+    'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend'],
+}
+
+
+def _sequential_load(url, user, requests):
+    client = Client()
+    client.force_login(user)
+    client.get(url)  # warms the session and identity caches
+    latencies = []
+    queries = []
+    for _ in range(requests):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            client.get(url)
+            latencies.append((time.perf_counter() - start) * 1000)
+        queries.append(len(captured))
+    latencies.sort()
+    return {
+        'requests': requests,
+        'p50_ms': round(latencies[len(latencies) // 2], 3),
+        'queries': max(queries),
+    }
+
+
+def compare_identity(requests=200, only=None):
+    """Median latency and queries per request of each dashboard before and after the cached auth path"""
+    users = _sample_users()
+    results = {}
+    with override_settings(ROOT_URLCONF=__name__), mock.patch.object(views, 'render', evaluate_context):
+        for name, role in DASHBOARDS:
+            if users[role] is None or users[role].pk is None or (only and not any(part in name for part in only)):
+                continue
+            with override_settings(**IDENTITY_BASELINE):
+                baseline = _sequential_load(f'/wsgi/{name}/', users[role], requests)
+            results[name] = {
+                'baseline': baseline,
+                'cached': _sequential_load(f'/wsgi/{name}/', users[role], requests),
+            }
+    return results
@@ -0,0 +1,85 @@
+# Conditional GET for the dashboards and announcement pages
+#
+# conditional_page() wraps a view in Django's condition() with validators
+# that cost one query and a few cache reads. Each page supplies a resolver
+# returning the core.fragments groups its content depends on, the newest
+# row timestamps behind it (Grade.updated_at, Enrollment.enrolled_date,
+# Announcement.updated_at, read together in one query) and anything else
+# that selects its content, such as the viewer's audience.
+#
+# The ETag hashes the fragment version tokens, so every write that retires
+# a dashboard fragment also changes the ETag, including the deletes and
+# renames that leave no newer timestamp behind. For the same reason
+# Last-Modified is the later of the row timestamps and a per-user change
+# stamp: the time this page was first served with its current ETag.
+#
+# Responses carry Cache-Control: private, no-cache, so browsers revalidate
+# every time and shared caches keep nothing. Requests with pending
+# django.contrib.messages are always rendered in full.
+
+import hashlib
+import json
+from functools import wraps
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from . import fragments
+
+STAMP_KEY = 'page_stamp:{}:{}'
+# Per-user change stamps outlive the browser caches they validate
+STAMP_TIMEOUT = 7 * 24 * 3600
+
+
+def _validators(request, resolve, args, kwargs):
+    if hasattr(request, '_page_validators'):
+        return request._page_validators
+    request._page_validators = (None, None)
+    if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+        return request._page_validators
+    resolved = resolve(request, *args, **kwargs)
+    if resolved is None:
+        return request._page_validators
+    groups, changed, selection = resolved
+    tokens = fragments.versions(**groups)
+    path = request.get_full_path()
+    etag = hashlib.sha1(
+        json.dumps([path, request.user.pk, sorted(tokens.items()), selection], default=str).encode()
+    ).hexdigest()
+
+    key = STAMP_KEY.format(request.user.pk, hashlib.sha1(path.encode()).hexdigest())
+    stamp = cache.get(key)
+    if stamp is None or stamp[0] != etag:
+        stamp = (etag, timezone.now())
+        cache.set(key, stamp, STAMP_TIMEOUT)
+    request._page_validators = (etag, max([stamp[1], *filter(None, changed)]))
+    return request._page_validators
+
+
+def conditional_page(resolve):
+    """Answer unchanged GETs of a view with 304 Not Modified
+
+    resolve(request, *args, **kwargs) returns (fragment groups, timestamps,
+    selection) for the page, or None to skip validation (the view then runs
+    as usual, e.g. to raise its 404).
+    """
+    def decorator(view_func):
+        def etag(request, *args, **kwargs):
+            return _validators(request, resolve, args, kwargs)[0]
+
+        def last_modified(request, *args, **kwargs):
+            return _validators(request, resolve, args, kwargs)[1]
+
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD'):
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
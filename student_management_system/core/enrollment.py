@@ -0,0 +1,221 @@
+# Course enrollment engine
+#
+# Seats are reserved with a conditional UPDATE on Course.enrolled_count, so
+# two students racing for the last seat cannot both succeed: the database
+# serializes the row updates and only one of them still matches
+# enrolled_count < capacity. Teachers are assigned by their maintained
+# TeacherProfile.student_load rather than a COUNT query. Both counters track
+# active enrollments; signal handlers keep them right for enrollments changed
+# outside this module (admin edits, deletes, cascades).
+
+import heapq
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import audience, fragments, prerequisites, stats, timetable
+from .models import Course, Enrollment, Student, TeacherProfile, Term
+
+
+class EnrollmentError(Exception):
+    pass
+
+
+class CourseFull(EnrollmentError):
+    pass
+
+
+class AlreadyEnrolled(EnrollmentError):
+    pass
+
+
+class NoTeacherAvailable(EnrollmentError):
+    pass
+
+
+class MissingPrerequisites(EnrollmentError):
+    pass
+
+
+class ScheduleConflict(EnrollmentError):
+    pass
+
+
+def _has_seat():
+    return Q(capacity__isnull=True) | Q(enrolled_count__lt=F('capacity'))
+
+
+def _least_loaded_teacher(course):
+    teachers = TeacherProfile.objects.filter(department_id=course.department_id).order_by('student_load', 'pk')
+    # Skip teachers locked by concurrent enrollments; when all of them are,
+    # wait for the least loaded one rather than report none available
+    return teachers.select_for_update(skip_locked=True).first() or teachers.select_for_update().first()
+
+
+@transaction.atomic
+def enroll(student, course):
+    """Enroll one student for the current term, reserving a seat and the least loaded teacher"""
+    term = Term.objects.current()
+    # Before anything is reserved; the unique constraint below still catches
+    # a concurrent duplicate
+    if Enrollment.objects.filter(student=student, course=course, term=term).exists():
+        raise AlreadyEnrolled(f'Already enrolled in {course.name}')
+    if prerequisites.missing(student, course):
+        raise MissingPrerequisites(f'Prerequisites for {course.name} are not completed')
+    if term is not None and timetable.enrollment_conflicts([student.pk], course, term):
+        raise ScheduleConflict(f'{course.name} clashes with your timetable')
+    reserved = Course.objects.filter(_has_seat(), pk=course.pk).update(enrolled_count=F('enrolled_count') + 1)
+    if not reserved:
+        raise CourseFull(f'{course.name} is full')
+    teacher = _least_loaded_teacher(course)
+    if teacher is None:
+        raise NoTeacherAvailable(f'No teacher available for {course.name}')
+    TeacherProfile.objects.filter(pk=teacher.pk).update(student_load=F('student_load') + 1)
+    enrollment = Enrollment(student=student, course=course, teacher=teacher, term=term)
+    enrollment._counters_applied = True
+    try:
+        with transaction.atomic():
+            enrollment.save()
+    except IntegrityError:
+        raise AlreadyEnrolled(f'Already enrolled in {course.name}')
+    return enrollment
+
+
+@transaction.atomic
+def enroll_cohort(course, students):
+    """Enroll many students for the current term at once; all or nothing if there are not enough seats
+
+    Students already enrolled this term are skipped, and none are enrolled if the
+    course clashes with any of their timetables. Returns the new enrollments.
+    """
+    course = Course.objects.select_for_update().get(pk=course.pk)
+    term = Term.objects.current()
+    already = set(Enrollment.objects.filter(course=course, term=term).values_list('student_id', flat=True))
+    newcomers = [student for student in students if student.pk not in already]
+    if not newcomers:
+        return []
+    if course.capacity is not None and course.enrolled_count + len(newcomers) > course.capacity:
+        raise CourseFull(
+            f'{course.name} has {course.capacity - course.enrolled_count} seats left, '
+            f'{len(newcomers)} requested'
+        )
+    teachers = list(
+        TeacherProfile.objects.select_for_update().filter(department_id=course.department_id)
+        .values_list('student_load', 'pk')
+    )
+    if not teachers:
+        raise NoTeacherAvailable(f'No teacher available for {course.name}')
+
+    clashes = timetable.enrollment_conflicts([student.pk for student in newcomers], course, term) if term else {}
+    if clashes:
+        raise ScheduleConflict(f'{course.name} clashes with the timetable of {len(clashes)} students')
+
+    heapq.heapify(teachers)
+    enrollments = []
+    added = {}
+    for student in newcomers:
+        load, teacher_id = heapq.heappop(teachers)
+        enrollments.append(Enrollment(student=student, course=course, teacher_id=teacher_id, term=term))
+        added[teacher_id] = added.get(teacher_id, 0) + 1
+        heapq.heappush(teachers, (load + 1, teacher_id))
+    Enrollment.objects.bulk_create(enrollments)
+
+    Course.objects.filter(pk=course.pk).update(enrolled_count=F('enrolled_count') + len(enrollments))
+    TeacherProfile.objects.filter(pk__in=added).update(
+        student_load=F('student_load') + Case(
+            *[When(pk=teacher_id, then=Value(count)) for teacher_id, count in added.items()]
+        )
+    )
+
+    # bulk_create skips the Enrollment signals
+    user_ids = list(Student.objects.filter(pk__in=[s.pk for s in newcomers]).values_list('user_id', flat=True))
+    user_ids += TeacherProfile.objects.filter(pk__in=added).values_list('user_id', flat=True)
+    transaction.on_commit(lambda: audience.invalidate(*user_ids))
+    transaction.on_commit(lambda: stats.invalidate('recent_enrollments'))
+    fragments.bump('enrollments', *[s.pk for s in newcomers])
+    fragments.bump('teaching', *added)
+    fragments.bump('enrollment_activity')
+    return enrollments
+
+
+@transaction.atomic
+def recount(course_ids=None, teacher_ids=None):
+    """Recompute both counters from the active enrollments, for all rows or only the given ones"""
+    active = Enrollment.objects.filter(is_active=True).order_by()
+    courses = Course.objects.all() if course_ids is None else Course.objects.filter(pk__in=course_ids)
+    teachers = TeacherProfile.objects.all() if teacher_ids is None else TeacherProfile.objects.filter(pk__in=teacher_ids)
+    courses.update(enrolled_count=Coalesce(Subquery(
+        active.filter(course=OuterRef('pk')).values('course').annotate(count=Count('id')).values('count')
+    ), 0))
+    teachers.update(student_load=Coalesce(Subquery(
+        active.filter(teacher=OuterRef('pk')).values('teacher').annotate(count=Count('id')).values('count')
+    ), 0))
+
+
+@transaction.atomic
+def close_enrollments(queryset):
+    """Deactivate a queryset of enrollments with one UPDATE; returns how many were closed
+
+    The counters of the courses and teachers involved are recounted
+    afterwards rather than shifted row by row.
+    """
+    active = queryset.filter(is_active=True).order_by()
+    affected = list(active.values_list('student_id', 'course_id', 'teacher_id').distinct())
+    closed = active.update(is_active=False)
+    if not closed:
+        return 0
+    student_ids = {student_id for student_id, _, _ in affected}
+    teacher_ids = {teacher_id for _, _, teacher_id in affected}
+    recount({course_id for _, course_id, _ in affected}, teacher_ids)
+
+    # update() skips the Enrollment signals
+    user_ids = list(Student.objects.filter(pk__in=student_ids).values_list('user_id', flat=True))
+    user_ids += TeacherProfile.objects.filter(pk__in=teacher_ids).values_list('user_id', flat=True)
+    transaction.on_commit(lambda: audience.invalidate(*user_ids))
+    transaction.on_commit(lambda: stats.invalidate('recent_enrollments'))
+    fragments.bump('enrollments', *student_ids)
+    fragments.bump('teaching', *teacher_ids)
+    fragments.bump('enrollment_activity')
+    return closed
+
+
+def _shift(course_id, teacher_id, delta):
+    # Greatest() keeps rows that predate the counters from going negative
+    Course.objects.filter(pk=course_id).update(enrolled_count=Greatest(F('enrolled_count') + delta, 0))
+    TeacherProfile.objects.filter(pk=teacher_id).update(student_load=Greatest(F('student_load') + delta, 0))
+
+
+# Signal handlers for enrollments changed outside the engine
+
+@receiver(pre_save, sender=Enrollment)
+def remember_previous_enrollment(sender, instance, **kwargs):
+    instance._counters_previous = None
+    if instance.pk:
+        instance._counters_previous = Enrollment.objects.filter(pk=instance.pk).values_list(
+            'course_id', 'teacher_id', 'is_active'
+        ).first()
+
+
+@receiver(post_save, sender=Enrollment)
+def count_enrollment_save(sender, instance, created, raw=False, **kwargs):
+    if getattr(instance, '_counters_applied', False):
+        instance._counters_applied = False
+        return
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_counters_previous', None)
+    if previous == (instance.course_id, instance.teacher_id, instance.is_active):
+        return
+    if previous and previous[2]:
+        _shift(previous[0], previous[1], -1)
+    if instance.is_active:
+        _shift(instance.course_id, instance.teacher_id, 1)
+
+
+@receiver(post_delete, sender=Enrollment)
+def count_enrollment_delete(sender, instance, **kwargs):
+    if instance.is_active:
+        _shift(instance.course_id, instance.teacher_id, -1)
@@ -0,0 +1,154 @@
+# Streaming exports
+#
+# Grades, enrollments and attendance are exported as CSV or JSON Lines
+# without building model instances or lists: each dataset is a values_list()
+# query over the flattened joins, read with iterator(chunk_size=...) and
+# encoded a chunk of rows at a time, so memory stays flat however many rows
+# are exported. The generators feed StreamingHttpResponse in the views and
+# the export_data command alike. Grades and attendance of archived terms are
+# exported first, then the live rows.
+
+import csv
+import io
+import json
+from itertools import chain
+
+from .models import Attendance, AttendanceArchive, Enrollment, Grade, GradeArchive
+
+CHUNK_SIZE = 2000
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+# name -> (model, (column, lookup) pairs, date lookup for start/end, student lookup, course lookup)
+DATASETS = {
+    'grades': (
+        Grade,
+        (
+            ('student_id', 'student__student_id'),
+            ('first_name', 'student__user__first_name'),
+            ('last_name', 'student__user__last_name'),
+            ('course_code', 'assignment__course__code'),
+            ('course_name', 'assignment__course__name'),
+            ('credits', 'assignment__course__credits'),
+            ('assignment_id', 'assignment_id'),
+            ('assignment', 'assignment__title'),
+            ('assignment_type', 'assignment__assignment_type'),
+            ('max_marks', 'assignment__max_marks'),
+            ('marks_obtained', 'marks_obtained'),
+            ('graded_by', 'graded_by__employee_id'),
+            ('graded_at', 'graded_at'),
+        ),
+        'graded_at__date',
+        'student',
+        'assignment__course',
+    ),
+    'enrollments': (
+        Enrollment,
+        (
+            ('student_id', 'student__student_id'),
+            ('first_name', 'student__user__first_name'),
+            ('last_name', 'student__user__last_name'),
+            ('course_code', 'course__code'),
+            ('course_name', 'course__name'),
+            ('teacher', 'teacher__employee_id'),
+            ('enrolled_date', 'enrolled_date'),
+            ('is_active', 'is_active'),
+        ),
+        'enrolled_date__date',
+        'student',
+        'course',
+    ),
+    'attendance': (
+        Attendance,
+        (
+            ('student_id', 'student__student_id'),
+            ('course_code', 'course__code'),
+            ('date', 'date'),
+            ('is_present', 'is_present'),
+            ('marked_by', 'marked_by__employee_id'),
+            ('remarks', 'remarks'),
+        ),
+        'date',
+        'student',
+        'course',
+    ),
+}
+
+# Archive tables holding a dataset's rows of closed terms, with the same lookups
+ARCHIVES = {
+    'grades': GradeArchive,
+    'attendance': AttendanceArchive,
+}
+
+
+def export_rows(dataset, student=None, course=None, start=None, end=None, using=None, chunk_size=CHUNK_SIZE):
+    """Column names and a lazy iterator of flat row tuples for a dataset
+
+    student and course are model instances or primary keys; start and end
+    are dates bounding the dataset's date column (inclusive). using pins the
+    database alias, since the rows are read after the view has returned.
+    """
+    if dataset not in DATASETS:
+        raise ValueError(f'Unknown dataset {dataset!r}; expected one of {", ".join(DATASETS)}')
+    model, columns, date_lookup, student_lookup, course_lookup = DATASETS[dataset]
+    lookups = [lookup for _, lookup in columns]
+    rows = []
+    for source in ([ARCHIVES[dataset]] if dataset in ARCHIVES else []) + [model]:
+        queryset = source.objects.using(using) if using else source.objects.all()
+        if student is not None:
+            queryset = queryset.filter(**{student_lookup: student})
+        if course is not None:
+            queryset = queryset.filter(**{course_lookup: course})
+        if start is not None:
+            queryset = queryset.filter(**{f'{date_lookup}__gte': start})
+        if end is not None:
+            queryset = queryset.filter(**{f'{date_lookup}__lte': end})
+        rows.append(queryset.order_by('pk').values_list(*lookups).iterator(chunk_size=chunk_size))
+    return [name for name, _ in columns], chain.from_iterable(rows)
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_csv(columns, rows, chunk_size=CHUNK_SIZE):
+    """Yield CSV text, a header line then one string per chunk of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for chunk in _chunks(rows, chunk_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+
+
+def stream_jsonl(columns, rows, chunk_size=CHUNK_SIZE):
+    """Yield JSON Lines text, one string per chunk of rows"""
+    encode = json.JSONEncoder(default=str, separators=(',', ':')).encode
+    for chunk in _chunks(rows, chunk_size):
+        yield ''.join(encode(dict(zip(columns, row))) + '\n' for row in chunk)
+
+
+STREAMERS = {
+    'csv': stream_csv,
+    'jsonl': stream_jsonl,
+}
+
+
+def stream(dataset, format='csv', **filters):
+    """Encoded chunks of a dataset export in the given format"""
+    if format not in STREAMERS:
+        raise ValueError(f'Unknown format {format!r}; expected one of {", ".join(STREAMERS)}')
+    columns, rows = export_rows(dataset, **filters)
+    return STREAMERS[format](columns, rows)
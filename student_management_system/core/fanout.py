@@ -0,0 +1,46 @@
+# Concurrent ORM reads for async views
+#
+# Django's async ORM methods (aget, acount, ...) hand each query to
+# sync_to_async with thread_sensitive=True, so all the queries of a request
+# still run one after another on a single thread. gather() runs independent
+# reads with thread_sensitive=False instead: each executor thread keeps its
+# own database connection, so the database works on them in parallel. The
+# executor's thread count bounds the extra connections.
+#
+# Inside a transaction the other connections would not see its uncommitted
+# rows, so there (and therefore in TestCase tests) the reads fall back to the
+# request's thread, one after another.
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, connection
+
+
+def _in_transaction():
+    return connection.in_atomic_block
+
+
+def _isolated(read):
+    def run():
+        # Executor threads outlive requests, so apply CONN_MAX_AGE like a request would
+        close_old_connections()
+        try:
+            return read()
+        finally:
+            close_old_connections()
+    return run
+
+
+async def gather(**reads):
+    """Run independent ORM reads concurrently and return their results by name
+
+    Each read is a callable that evaluates its query, e.g.
+    ``grades=lambda: list(Grade.objects.filter(...))``.
+    """
+    if await sync_to_async(_in_transaction)():
+        return {name: await sync_to_async(read)() for name, read in reads.items()}
+    results = await asyncio.gather(*[
+        sync_to_async(_isolated(read), thread_sensitive=False)() for read in reads.values()
+    ])
+    return dict(zip(reads, results))
@@ -1,6 +1,6 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
-from .models import User, StudentProfile, TeacherProfile, Course, Grade, Announcement
+from .models import User, Student, TeacherProfile, Course, Grade, Announcement
 
 class CustomUserCreationForm(UserCreationForm):
     email = forms.EmailField(required=True)
@@ -10,7 +10,7 @@ class CustomUserCreationForm(UserCreationForm):
     
     class Meta:
         model = User
-        fields = ('username', 'email', 'first_name', 'last_name', 'phone', 'user_type', 'password1', 'password2')
+        fields = ('username', 'email', 'first_name', 'last_name', 'phone', 'role', 'password1', 'password2')
         
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -31,23 +31,33 @@ class GradeForm(forms.ModelForm):
 class AnnouncementForm(forms.ModelForm):
     class Meta:
         model = Announcement
-        fields = ['title', 'content', 'priority', 'target_audience']
+        fields = ['title', 'content', 'priority', 'target_audience', 'department', 'course', 'expires_at']
         widgets = {
             'title': forms.TextInput(attrs={'class': 'form-control'}),
             'content': forms.Textarea(attrs={'class': 'form-control', 'rows': 5}),
             'priority': forms.Select(attrs={'class': 'form-control'}),
             'target_audience': forms.Select(attrs={'class': 'form-control'}),
+            'department': forms.Select(attrs={'class': 'form-control'}),
+            'course': forms.Select(attrs={'class': 'form-control'}),
+            'expires_at': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}),
         }
 
+    def clean(self):
+        cleaned_data = super().clean()
+        target = cleaned_data.get('target_audience')
+        if target == 'department' and not cleaned_data.get('department'):
+            self.add_error('department', 'Choose the department this announcement is for.')
+        if target == 'course' and not cleaned_data.get('course'):
+            self.add_error('course', 'Choose the course this announcement is for.')
+        return cleaned_data
+
 class CourseForm(forms.ModelForm):
     class Meta:
         model = Course
-        fields = ['name', 'code', 'description', 'department', 'credits', 'semester']
+        fields = ['name', 'code', 'department', 'credits']
         widgets = {
             'name': forms.TextInput(attrs={'class': 'form-control'}),
             'code': forms.TextInput(attrs={'class': 'form-control'}),
-            'description': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
             'department': forms.Select(attrs={'class': 'form-control'}),
             'credits': forms.NumberInput(attrs={'class': 'form-control'}),
-            'semester': forms.NumberInput(attrs={'class': 'form-control'}),
         }
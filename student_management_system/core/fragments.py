@@ -0,0 +1,164 @@
+# Dashboard fragment caching
+#
+# The dashboard templates wrap their expensive blocks in {% cache %} tags
+# keyed by the viewer and by version tokens of the object groups the block
+# shows: a student's grades and enrollments, a teacher's courses, and the
+# global announcements, courses, people, enrollment activity and class
+# rankings (retired by core.rankings.refresh()). Views call
+# context() before reading anything the fragments show, and signal handlers
+# delete the affected tokens once a write commits, so a fragment rendered
+# from older data can never be found under the current key.
+#
+# Tokens are random rather than counters: an evicted token is replaced by a
+# fresh one instead of restarting at a number an older fragment was cached
+# under. Fragments and tokens live in the 'template_fragments' cache (see
+# FRAGMENT_CACHE in settings), which must be shared by all web processes.
+
+import math
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Min
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import routing
+from .models import Announcement, Assignment, Course, Enrollment, Grade, Student, TeacherProfile, User
+
+CACHE_ALIAS = 'template_fragments'
+VERSION_KEY = 'fragment_version:{}:{}'
+
+# Groups versioned per Student (grades, enrollments) or TeacherProfile (teaching)
+PER_OBJECT = {'grades', 'enrollments', 'teaching'}
+GLOBAL = {'announcements', 'courses', 'people', 'enrollment_activity', 'rankings'}
+
+
+def fragment_cache():
+    return caches[CACHE_ALIAS if CACHE_ALIAS in settings.CACHES else 'default']
+
+
+def _key(group, object_id=None):
+    return VERSION_KEY.format(group, '' if object_id is None else object_id)
+
+
+def _announcements_timeout():
+    # The token lapses when the next announcement expires, so no fragment outlives it
+    now = timezone.now()
+    expires = Announcement.objects.filter(is_active=True, expires_at__gt=now).aggregate(next=Min('expires_at'))['next']
+    return None if expires is None else math.ceil((expires - now).total_seconds())
+
+
+TOKEN_TIMEOUTS = {
+    'announcements': _announcements_timeout,
+}
+
+
+def versions(**groups):
+    """Current token of each group, keyed by group name; values are object ids (None for global groups)"""
+    cache = fragment_cache()
+    keys = {name: _key(name, object_id) for name, object_id in groups.items()}
+    found = cache.get_many(keys.values())
+    tokens = {}
+    for name, key in keys.items():
+        if key not in found:
+            # add() so concurrent first readers agree on one token
+            timeout = TOKEN_TIMEOUTS[name]() if name in TOKEN_TIMEOUTS else None
+            cache.add(key, uuid.uuid4().hex, timeout)
+            found[key] = cache.get(key)
+        tokens[name] = found[key]
+    return tokens
+
+
+def context(**groups):
+    """Template context for the {% cache %} tags of a dashboard
+
+    Fragments rendered from a replica are kept only for REPLICA_PIN_SECONDS,
+    the lag the routing layer already assumes, since the replica may not yet
+    hold the write that bumped a token.
+    """
+    timeout = getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 600)
+    if routing.read_alias() != DEFAULT_DB_ALIAS:
+        timeout = min(timeout, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+    return {'timeout': timeout, **versions(**groups)}
+
+
+def bump(group, *object_ids):
+    """Retire the tokens of a group (of the given objects) once the current transaction commits"""
+    keys = [_key(group, object_id) for object_id in object_ids] if group in PER_OBJECT else [_key(group)]
+    if keys:
+        transaction.on_commit(lambda: fragment_cache().delete_many(keys))
+
+
+def teachers_of(course_ids):
+    """TeacherProfile ids with enrollments in any of the courses"""
+    return set(Enrollment.objects.filter(course_id__in=course_ids).values_list('teacher_id', flat=True))
+
+
+def grades_changed(student_ids, course_ids):
+    """Bump the groups showing grades, e.g. after a bulk_create skipped the Grade signals"""
+    bump('grades', *student_ids)
+    bump('teaching', *teachers_of(course_ids))
+
+
+# Signal handlers retiring tokens. core.apps imports this module last so
+# these run after the stats and audience invalidations of the same write.
+
+@receiver(post_save, sender=Grade)
+@receiver(post_delete, sender=Grade)
+def grade_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        course_id = Assignment.objects.filter(pk=instance.assignment_id).values_list('course_id', flat=True).first()
+        grades_changed([instance.student_id], [course_id])
+
+
+@receiver(post_save, sender=Assignment)
+@receiver(post_delete, sender=Assignment)
+def assignment_changed(sender, instance, raw=False, created=False, **kwargs):
+    if not raw and not created:
+        grades_changed(
+            set(Grade.objects.filter(assignment_id=instance.pk).values_list('student_id', flat=True)),
+            [instance.course_id],
+        )
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def enrollment_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        # _counters_previous is remembered by core.enrollment before the save
+        previous = getattr(instance, '_counters_previous', None)
+        bump('enrollments', instance.student_id)
+        bump('teaching', instance.teacher_id, *([previous[1]] if previous else []))
+        bump('enrollment_activity')
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=TeacherProfile)
+def profile_changed(sender, instance, created, raw=False, **kwargs):
+    # A new department changes which announcements the profile sees
+    if not created and not raw:
+        bump('enrollments' if sender is Student else 'teaching', instance.pk)
+
+
+@receiver(post_save, sender=Announcement)
+@receiver(post_delete, sender=Announcement)
+def announcement_changed(sender, raw=False, **kwargs):
+    if not raw:
+        bump('announcements')
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def course_changed(sender, raw=False, **kwargs):
+    if not raw:
+        bump('courses')
+
+
+@receiver(post_save, sender=User)
+def person_changed(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Logins only touch last_login, which no fragment shows
+    if not created and not raw and set(update_fields or ()) != {'last_login'}:
+        bump('people')
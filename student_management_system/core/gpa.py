@@ -0,0 +1,233 @@
+# Incremental GPA engine
+#
+# Every Grade write adjusts the matching CourseGradeTotal row with F()
+# expressions and then refreshes Student.gpa from that student's totals, so
+# reading a GPA never touches the Grade table. Grades moved to GradeArchive
+# by core.archive stay in the totals, and rebuilds read both tables; a live
+# grade for an archived (student, assignment) pair replaces the archived one
+# in the totals. Every
+# change also queues the course and department rankings it moves (see
+# core.rankings).
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import archive, identity, rankings
+from .models import Assignment, ClassRank, Course, CourseGradeTotal, Grade, GradeArchive, Student
+
+GPA_SCALE = Decimal('4.0')
+GPA_PLACES = Decimal('0.01')
+BATCH_SIZE = 1000
+
+
+def grade_points(percentage):
+    """Map a course percentage onto the 4.0 scale"""
+    return Decimal(percentage) / 100 * GPA_SCALE
+
+
+def gpa_from_totals(rows):
+    """Credit-weighted GPA from (credits, marks_obtained_total, max_marks_total) rows"""
+    weighted = Decimal(0)
+    credits = 0
+    for course_credits, marks_total, max_total in rows:
+        if not max_total or not course_credits:
+            continue
+        percentage = Decimal(marks_total) / max_total * 100
+        weighted += grade_points(percentage) * course_credits
+        credits += course_credits
+    if not credits:
+        return Decimal('0.00')
+    return (weighted / credits).quantize(GPA_PLACES)
+
+
+def refresh_gpas(student_ids):
+    """Recompute Student.gpa for the given students from their course totals"""
+    student_ids = set(student_ids)
+    if not student_ids:
+        return
+    rows = defaultdict(list)
+    totals = CourseGradeTotal.objects.filter(student_id__in=student_ids).values_list(
+        'student_id', 'course__credits', 'marks_obtained_total', 'max_marks_total'
+    )
+    for student_id, credits, marks_total, max_total in totals:
+        rows[student_id].append((credits, marks_total, max_total))
+    Student.objects.bulk_update(
+        [Student(pk=student_id, gpa=gpa_from_totals(rows[student_id])) for student_id in student_ids],
+        ['gpa'],
+        batch_size=BATCH_SIZE,
+    )
+    # bulk_update skips the signals that drop cached profiles
+    identity.invalidate_students(student_ids)
+    rankings.gpas_changed(student_ids)
+
+
+def apply_grade_delta(student_id, course_id, marks_delta, max_marks_delta, count_delta):
+    """Add a delta to one student's running totals for a course"""
+    if count_delta > 0:
+        CourseGradeTotal.objects.get_or_create(student_id=student_id, course_id=course_id)
+    totals = CourseGradeTotal.objects.filter(student_id=student_id, course_id=course_id)
+    totals.update(
+        marks_obtained_total=F('marks_obtained_total') + marks_delta,
+        max_marks_total=F('max_marks_total') + max_marks_delta,
+        graded_count=F('graded_count') + count_delta,
+    )
+    if count_delta < 0:
+        totals.filter(graded_count=0).delete()
+    rankings.queue(ClassRank.COURSE, [course_id])
+
+
+def compute_course_totals(student_ids=None):
+    """From-scratch totals keyed by (student_id, course_id), aggregated in SQL over live and archived grades"""
+    totals = {}
+    for model in (Grade, GradeArchive):
+        grades = model.objects.all()
+        if student_ids is not None:
+            grades = grades.filter(student_id__in=student_ids)
+        rows = grades.values('student_id', 'assignment__course_id').annotate(
+            marks_total=Sum('marks_obtained'),
+            max_total=Sum('assignment__max_marks'),
+            graded=Count('id'),
+        )
+        for row in rows:
+            key = (row['student_id'], row['assignment__course_id'])
+            marks_total, max_total, graded = totals.get(key, (Decimal(0), 0, 0))
+            totals[key] = (
+                marks_total + (row['marks_total'] or Decimal(0)), max_total + (row['max_total'] or 0), graded + row['graded']
+            )
+    return totals
+
+
+def compute_gpas(student_ids=None):
+    """From-scratch GPA per student, straight from the grade tables"""
+    credits = dict(Course.objects.values_list('id', 'credits'))
+    rows = defaultdict(list)
+    for (student_id, course_id), (marks_total, max_total, _) in compute_course_totals(student_ids).items():
+        rows[student_id].append((credits[course_id], marks_total, max_total))
+    students = Student.objects.all()
+    if student_ids is not None:
+        students = students.filter(pk__in=student_ids)
+    return {student_id: gpa_from_totals(rows[student_id]) for student_id in students.values_list('pk', flat=True)}
+
+
+@transaction.atomic
+def rebuild_gpas(student_ids=None):
+    """Replace course totals and GPAs in bulk; returns the number of students updated"""
+    totals = compute_course_totals(student_ids)
+    existing = CourseGradeTotal.objects.all()
+    if student_ids is not None:
+        existing = existing.filter(student_id__in=student_ids)
+    existing.delete()
+    CourseGradeTotal.objects.bulk_create(
+        [
+            CourseGradeTotal(
+                student_id=student_id,
+                course_id=course_id,
+                marks_obtained_total=marks_total,
+                max_marks_total=max_total,
+                graded_count=graded,
+            )
+            for (student_id, course_id), (marks_total, max_total, graded) in totals.items()
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    gpas = compute_gpas(student_ids)
+    Student.objects.bulk_update(
+        [Student(pk=student_id, gpa=gpa) for student_id, gpa in gpas.items()],
+        ['gpa'],
+        batch_size=BATCH_SIZE,
+    )
+    identity.invalidate_students(gpas)
+    rankings.gpas_changed(gpas)
+    rankings.queue(ClassRank.COURSE, {course_id for _, course_id in totals})
+    return len(gpas)
+
+
+# Signal handlers keeping the totals current
+
+def _grade_key(grade):
+    return grade.student_id, grade.assignment.course_id, grade.assignment.max_marks
+
+
+@receiver(pre_save, sender=Grade)
+def remember_previous_grade(sender, instance, **kwargs):
+    instance._gpa_previous = None
+    if instance.pk:
+        instance._gpa_previous = Grade.objects.filter(pk=instance.pk).values_list(
+            'student_id', 'assignment__course_id', 'assignment__max_marks', 'marks_obtained', 'assignment_id'
+        ).first()
+
+
+@receiver(post_save, sender=Grade)
+def update_totals_on_grade_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    student_id, course_id, max_marks = _grade_key(instance)
+    marks = Decimal(instance.marks_obtained)
+    previous = getattr(instance, '_gpa_previous', None)
+    with transaction.atomic():
+        if previous and previous[:2] == (student_id, course_id):
+            apply_grade_delta(student_id, course_id, marks - previous[3], max_marks - previous[2], 0)
+        else:
+            if previous:
+                apply_grade_delta(previous[0], previous[1], -previous[3], -previous[2], -1)
+            apply_grade_delta(student_id, course_id, marks, max_marks, 1)
+        # A grade for a pair graded in an archived term replaces the archived one
+        if not previous or (previous[0], previous[4]) != (student_id, instance.assignment_id):
+            replaced = archive.supersede_grades([(student_id, instance.assignment_id)])
+            if replaced:
+                apply_grade_delta(student_id, course_id, -sum(replaced), -max_marks * len(replaced), -len(replaced))
+        refresh_gpas({student_id, previous[0]} if previous else {student_id})
+
+
+@receiver(post_delete, sender=Grade)
+def update_totals_on_grade_delete(sender, instance, **kwargs):
+    student_id, course_id, max_marks = _grade_key(instance)
+    with transaction.atomic():
+        apply_grade_delta(student_id, course_id, -Decimal(instance.marks_obtained), -max_marks, -1)
+        refresh_gpas([student_id])
+
+
+@receiver(pre_save, sender=Assignment)
+def remember_previous_max_marks(sender, instance, **kwargs):
+    instance._gpa_previous_max_marks = None
+    if instance.pk:
+        instance._gpa_previous_max_marks = Assignment.objects.filter(pk=instance.pk).values_list(
+            'max_marks', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Assignment)
+def update_totals_on_max_marks_change(sender, instance, raw=False, **kwargs):
+    previous = getattr(instance, '_gpa_previous_max_marks', None)
+    if raw or previous is None or previous == instance.max_marks:
+        return
+    student_ids = set(Grade.objects.filter(assignment=instance).values_list('student_id', flat=True))
+    student_ids |= set(GradeArchive.objects.filter(assignment=instance).values_list('student_id', flat=True))
+    with transaction.atomic():
+        CourseGradeTotal.objects.filter(course_id=instance.course_id, student_id__in=student_ids).update(
+            max_marks_total=F('max_marks_total') + (instance.max_marks - previous)
+        )
+        rankings.queue(ClassRank.COURSE, [instance.course_id])
+        refresh_gpas(student_ids)
+
+
+@receiver(pre_save, sender=Course)
+def remember_previous_credits(sender, instance, **kwargs):
+    instance._gpa_previous_credits = None
+    if instance.pk:
+        instance._gpa_previous_credits = Course.objects.filter(pk=instance.pk).values_list(
+            'credits', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Course)
+def update_gpas_on_credits_change(sender, instance, raw=False, **kwargs):
+    previous = getattr(instance, '_gpa_previous_credits', None)
+    if raw or previous is None or previous == instance.credits:
+        return
+    refresh_gpas(CourseGradeTotal.objects.filter(course=instance).values_list('student_id', flat=True))
@@ -0,0 +1,157 @@
+# Bulk gradebook ingestion
+#
+# Rows arrive as dicts with student_id (the Student.student_id code),
+# assignment_id, marks_obtained and an optional feedback. Each chunk resolves
+# its students and assignments with one query each, validates in memory and
+# upserts every valid Grade with a single INSERT ... ON CONFLICT.
+
+import codecs
+import csv
+import zipfile
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import archive, fragments, gpa
+from .models import Assignment, Grade, Student
+
+CHUNK_SIZE = 5000
+
+
+def read_csv(upload):
+    """Stream rows from an uploaded CSV file without reading it into memory"""
+    yield from csv.DictReader(codecs.iterdecode(upload, 'utf-8-sig'))
+
+
+def read_xlsx(upload):
+    """Stream rows from the first sheet of an uploaded XLSX workbook (needs openpyxl)"""
+    try:
+        from openpyxl import load_workbook
+        from openpyxl.utils.exceptions import InvalidFileException
+    except ImportError:
+        raise ValueError('XLSX import requires the openpyxl package')
+    try:
+        workbook = load_workbook(upload, read_only=True, data_only=True)
+    except (InvalidFileException, zipfile.BadZipFile) as exc:
+        raise ValueError(f'Not a valid XLSX workbook: {exc}')
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else '' for cell in next(rows, ())]
+        for values in rows:
+            yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def read_upload(upload):
+    """Pick a row reader from the uploaded file's extension"""
+    if upload.name.lower().endswith('.xlsx'):
+        return read_xlsx(upload)
+    return read_csv(upload)
+
+
+def _clean_marks(value, max_marks):
+    try:
+        marks = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f'Invalid marks_obtained: {value!r}')
+    if not marks.is_finite() or marks < 0:
+        raise ValueError(f'Invalid marks_obtained: {value!r}')
+    if marks > max_marks:
+        raise ValueError(f'marks_obtained {marks} exceeds max_marks {max_marks}')
+    return marks.quantize(Decimal('0.01'))
+
+
+def _import_chunk(chunk, teacher, seen, now):
+    student_codes = {str(row.get('student_id') or '').strip() for _, row in chunk}
+    assignment_ids = set()
+    for _, row in chunk:
+        try:
+            assignment_ids.add(int(row.get('assignment_id')))
+        except (TypeError, ValueError):
+            pass
+
+    students = dict(Student.objects.filter(student_id__in=student_codes).values_list('student_id', 'pk'))
+    assignments = dict(
+        Assignment.objects.filter(pk__in=assignment_ids, teacher=teacher).values_list('pk', 'max_marks')
+    )
+
+    grades = []
+    errors = []
+    for number, row in chunk:
+        student_code = str(row.get('student_id') or '').strip()
+        try:
+            assignment_id = int(row.get('assignment_id'))
+        except (TypeError, ValueError):
+            errors.append({'row': number, 'error': f"Invalid assignment_id: {row.get('assignment_id')!r}"})
+            continue
+        if student_code not in students:
+            errors.append({'row': number, 'error': f'Unknown student_id: {student_code!r}'})
+            continue
+        if assignment_id not in assignments:
+            errors.append({'row': number, 'error': f'Unknown assignment_id: {assignment_id}'})
+            continue
+        key = (students[student_code], assignment_id)
+        if key in seen:
+            errors.append({'row': number, 'error': f'Duplicate of row {seen[key]}'})
+            continue
+        try:
+            marks = _clean_marks(row.get('marks_obtained'), assignments[assignment_id])
+        except ValueError as exc:
+            errors.append({'row': number, 'error': str(exc)})
+            continue
+        seen[key] = number
+        grades.append(Grade(
+            student_id=key[0],
+            assignment_id=assignment_id,
+            marks_obtained=marks,
+            feedback=row.get('feedback') or None,
+            graded_by=teacher,
+            graded_at=now,
+            updated_at=now,
+        ))
+
+    Grade.objects.bulk_create(
+        grades,
+        update_conflicts=True,
+        unique_fields=['student', 'assignment'],
+        update_fields=['marks_obtained', 'feedback', 'graded_by', 'updated_at'],
+    )
+    # Grades of archived terms given again are replaced; import_grades then rebuilds the totals
+    archive.supersede_grades((grade.student_id, grade.assignment_id) for grade in grades)
+    return len(grades), errors, {grade.student_id for grade in grades}
+
+
+def import_grades(rows, teacher, chunk_size=CHUNK_SIZE):
+    """Upsert grades for the teacher's assignments in one transaction
+
+    Rows are numbered from 1 in input order. Invalid rows are skipped and
+    reported; every valid row is saved. Returns a dict with the number of
+    grades saved and the per-row errors.
+    """
+    rows = iter(rows)
+    seen = {}
+    saved = 0
+    errors = []
+    student_ids = set()
+    number = 0
+    now = timezone.now()
+    with transaction.atomic():
+        while True:
+            chunk = [(number + offset, row) for offset, row in enumerate(islice(rows, chunk_size), start=1)]
+            if not chunk:
+                break
+            number = chunk[-1][0]
+            chunk_saved, chunk_errors, chunk_students = _import_chunk(chunk, teacher, seen, now)
+            saved += chunk_saved
+            errors.extend(chunk_errors)
+            student_ids |= chunk_students
+        # bulk_create skips the Grade signals, so refresh the affected GPAs in bulk
+        if student_ids:
+            gpa.rebuild_gpas(student_ids)
+            fragments.grades_changed(
+                student_ids, Assignment.objects.filter(teacher=teacher).values_list('course_id', flat=True)
+            )
+    return {'rows': number, 'saved': saved, 'errors': errors}
@@ -0,0 +1,122 @@
+# Cached identity loading
+#
+# AuthenticationMiddleware resolves request.user through the authentication
+# backend's get_user(). CachedModelBackend answers it from the cache: the
+# User together with its Student or TeacherProfile and their department,
+# loaded with one query on a miss and kept for IDENTITY_CACHE_TIMEOUT
+# seconds. Views then reach the role profile through profile_or_404()
+# without another query.
+#
+# Signal handlers drop a cached identity once a change to the user, the
+# profile or the department commits. Student.gpa is written with
+# bulk_update, so core.gpa drops the identities of the students it
+# refreshes. TeacherProfile.student_load is maintained with bare UPDATEs and
+# is left out of the cached profile; reading it goes to the database.
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+
+from .models import Department, Student, TeacherProfile, User
+
+IDENTITY_KEY = 'identity:{}'
+IDENTITY_CACHE_TIMEOUT = 300
+
+# Role profile accessor on User for each profile model
+PROFILES = {
+    Student: 'student',
+    TeacherProfile: 'teacherprofile',
+}
+
+
+def _timeout():
+    return getattr(settings, 'IDENTITY_CACHE_TIMEOUT', IDENTITY_CACHE_TIMEOUT)
+
+
+def load_identity(user_id):
+    """A User with its role profile and department, in one query"""
+    user = User.objects.select_related(
+        'student__department', 'teacherprofile__department'
+    ).defer('teacherprofile__student_load').filter(pk=user_id).first()
+    if user is not None:
+        user._identity_loaded = True
+    return user
+
+
+def get_identity(user_id):
+    """load_identity() through the cache"""
+    key = IDENTITY_KEY.format(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = load_identity(user_id)
+        if user is not None:
+            cache.set(key, user, _timeout())
+    return user
+
+
+def invalidate(*user_ids):
+    """Drop the cached identities of these users once the current transaction commits"""
+    keys = [IDENTITY_KEY.format(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_students(student_ids):
+    """invalidate() for the users of these Student profiles"""
+    invalidate(*Student.objects.filter(pk__in=student_ids).values_list('user_id', flat=True))
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose get_user() reads the cached identity"""
+
+    def get_user(self, user_id):
+        user = get_identity(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+
+def profile_or_404(user, model):
+    """The user's Student or TeacherProfile, from the loaded identity when it carries one
+
+    Other User instances may hold a profile cached before later writes, so
+    theirs is read from the database, with its department.
+    """
+    if not getattr(user, '_identity_loaded', False):
+        return get_object_or_404(model.objects.select_related('department'), user=user)
+    try:
+        return getattr(user, PROFILES[model])
+    except model.DoesNotExist:
+        raise Http404(f'No {model._meta.verbose_name} for this user')
+
+
+# Signal handlers dropping cached identities
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=TeacherProfile)
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=TeacherProfile)
+def profile_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=Department)
+@receiver(pre_delete, sender=Department)
+def department_changed(sender, instance, created=False, raw=False, **kwargs):
+    # Before a delete, while the profiles still point at the department
+    if not created and not raw:
+        invalidate(*User.objects.filter(
+            Q(student__department=instance) | Q(teacherprofile__department=instance)
+        ).values_list('pk', flat=True))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.archive import BATCH_SIZE, ArchiveError, archive_closed_terms, archive_term, prune_notifications
+from core.models import Term
+
+
+class Command(BaseCommand):
+    help = 'Move grades and attendance of closed terms to the archive tables and prune old read notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--term', help='Code of one closed term to archive (default: every closed term not yet archived)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows moved per transaction')
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            help='Keep read notifications this many days (default: settings.NOTIFICATION_RETENTION_DAYS)',
+        )
+
+    def handle(self, *args, **options):
+        if options['term']:
+            term = Term.objects.filter(code=options['term']).first()
+            if term is None:
+                raise CommandError(f"Unknown term {options['term']!r}")
+            try:
+                archived = {term.code: archive_term(term, options['batch_size'])}
+            except ArchiveError as exc:
+                raise CommandError(str(exc))
+        else:
+            archived = archive_closed_terms(options['batch_size'])
+        for code, moved in archived.items():
+            self.stdout.write(f"{code}: archived {moved['grades']} grades and {moved['attendance']} attendance records")
+        pruned = prune_notifications(options['retention_days'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {len(archived)} terms, pruned {pruned} read notifications'
+        ))
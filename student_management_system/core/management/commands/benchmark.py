@@ -0,0 +1,89 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmark import compare, compare_handlers, compare_identity, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Time every view and the hot ORM queries against the current dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per benchmark')
+        parser.add_argument('--only', nargs='*', help='Run only benchmarks whose name contains one of these')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--compare', help='Earlier JSON report to compare against')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Relative slowdown that counts as a regression')
+        parser.add_argument(
+            '--handlers',
+            action='store_true',
+            help='Load-test the dashboards through the WSGI and ASGI handlers instead',
+        )
+        parser.add_argument(
+            '--identity',
+            action='store_true',
+            help='Compare the dashboards with the database session and auth path against the cached one',
+        )
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients for --handlers')
+        parser.add_argument('--requests', type=int, default=400, help='Requests per dashboard and handler for --handlers and --identity')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+        if options['handlers']:
+            return self.handle_handlers(options)
+        if options['identity']:
+            return self.handle_identity(options)
+
+        report = run_benchmarks(repeat=options['repeat'], only=options['only'])
+        for name, result in report['results'].items():
+            if 'error' in result:
+                self.stdout.write(self.style.ERROR(f"{name:<36} {result['error']}"))
+            else:
+                self.stdout.write(
+                    f"{name:<36} median {result['median_ms']:>9.2f} ms  "
+                    f"p95 {result['p95_ms']:>9.2f} ms  {result['queries']:>4} queries"
+                )
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+
+        if options['compare']:
+            with open(options['compare']) as previous:
+                baseline = json.load(previous)
+            regressions = 0
+            for name, before, after, change, regressed in compare(baseline, report, options['threshold']):
+                style = self.style.ERROR if regressed else self.style.SUCCESS
+                regressions += regressed
+                self.stdout.write(style(f'{name:<36} {before:>9.2f} -> {after:>9.2f} ms ({change:+.0%})'))
+            if regressions:
+                raise CommandError(f'{regressions} benchmarks regressed against {options["compare"]}')
+
+    def handle_handlers(self, options):
+        if options['concurrency'] < 1 or options['requests'] < options['concurrency']:
+            raise CommandError('--concurrency must be at least 1 and no more than --requests')
+        results = compare_handlers(options['concurrency'], options['requests'], options['only'])
+        for name, handlers in results.items():
+            for handler, result in handlers.items():
+                style = self.style.ERROR if result['errors'] else str
+                self.stdout.write(style(
+                    f"{name:<20} {handler}  {result['rps']:>8.1f} req/s  "
+                    f"p50 {result['p50_ms']:>8.2f} ms  p99 {result['p99_ms']:>8.2f} ms  "
+                    f"{result['errors']} errors"
+                ))
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+
+    def handle_identity(self, options):
+        results = compare_identity(options['requests'], options['only'])
+        for name, paths in results.items():
+            before, after = paths['baseline'], paths['cached']
+            self.stdout.write(
+                f"{name:<20} p50 {before['p50_ms']:>8.2f} -> {after['p50_ms']:>8.2f} ms  "
+                f"queries {before['queries']:>3} -> {after['queries']:>3}"
+            )
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Term
+from core.timetable import validate_term
+
+
+class Command(BaseCommand):
+    help = "Check a term's timetable for double-booked teachers, rooms and students"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--term', help='Term code (default: the current term)')
+        parser.add_argument('--show', type=int, default=20, help='Conflicts listed per kind')
+
+    def handle(self, *args, **options):
+        if options['term']:
+            term = Term.objects.filter(code=options['term']).first()
+            if term is None:
+                raise CommandError(f"Unknown term {options['term']!r}")
+        else:
+            term = Term.objects.current()
+            if term is None:
+                raise CommandError('No current term; give --term')
+
+        started = time.perf_counter()
+        report = validate_term(term)
+        elapsed = time.perf_counter() - started
+        for kind in ('teacher', 'room', 'student'):
+            for conflict in report[kind][:options['show']]:
+                self.stdout.write(f"{kind}: {' '.join(map(str, conflict))}")
+        found = sum(len(report[kind]) for kind in ('teacher', 'room', 'student'))
+        summary = (
+            f"{term.code}: {report['slots']} slots checked in {elapsed:.2f}s, "
+            f"{len(report['teacher'])} teacher, {len(report['room'])} room and "
+            f"{len(report['student'])} student conflicts"
+        )
+        if found:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.enrollment import EnrollmentError, enroll_cohort
+from core.models import Course, Student
+
+
+class Command(BaseCommand):
+    help = 'Enroll a cohort of students into a course in one transaction'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course', help='Course code')
+        parser.add_argument('student_ids', nargs='*', help='Student ids (e.g. STU_000042)')
+        parser.add_argument('--department', help='Enroll every student of this department code')
+
+    def handle(self, *args, **options):
+        course = Course.objects.filter(code=options['course']).first()
+        if course is None:
+            raise CommandError(f"Unknown course {options['course']!r}")
+        students = Student.objects.all()
+        if options['department']:
+            students = students.filter(department__code=options['department'])
+        elif options['student_ids']:
+            students = students.filter(student_id__in=options['student_ids'])
+        else:
+            raise CommandError('Give student ids or --department')
+        try:
+            enrollments = enroll_cohort(course, list(students))
+        except EnrollmentError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f'Enrolled {len(enrollments)} students in {course.code}'))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from core.exports import DATASETS, STREAMERS, stream
+from core.models import Course, Student
+
+
+class Command(BaseCommand):
+    help = 'Stream grades, enrollments or attendance to CSV or JSON Lines with constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS))
+        parser.add_argument('--format', choices=sorted(STREAMERS), default='csv')
+        parser.add_argument('--output', help='File to write; defaults to stdout')
+        parser.add_argument('--student', help='Only this student_id (a transcript)')
+        parser.add_argument('--course', help='Only this course code (a gradebook)')
+        parser.add_argument('--start', help='First date to include, YYYY-MM-DD')
+        parser.add_argument('--end', help='Last date to include, YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        filters = {}
+        if options['student']:
+            filters['student'] = Student.objects.filter(student_id=options['student']).first()
+            if filters['student'] is None:
+                raise CommandError(f"Unknown student {options['student']!r}")
+        if options['course']:
+            filters['course'] = Course.objects.filter(code=options['course']).first()
+            if filters['course'] is None:
+                raise CommandError(f"Unknown course {options['course']!r}")
+        for bound in ('start', 'end'):
+            if options[bound]:
+                try:
+                    filters[bound] = parse_date(options[bound])
+                except ValueError:
+                    filters[bound] = None
+                if filters[bound] is None:
+                    raise CommandError(f'--{bound} must be a YYYY-MM-DD date')
+
+        chunks = stream(options['dataset'], options['format'], **filters)
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.gradebook import read_csv, read_xlsx, import_grades
+from core.models import TeacherProfile
+
+
+class Command(BaseCommand):
+    help = 'Bulk import grades from a CSV or XLSX file and report throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX file with student_id, assignment_id, marks_obtained, feedback')
+        parser.add_argument('--teacher', required=True, help='employee_id of the grading teacher')
+
+    def handle(self, *args, **options):
+        try:
+            teacher = TeacherProfile.objects.get(employee_id=options['teacher'])
+        except TeacherProfile.DoesNotExist:
+            raise CommandError(f"No teacher with employee_id {options['teacher']!r}")
+
+        path = options['path']
+        start = time.perf_counter()
+        with open(path, 'rb') as upload:
+            reader = read_xlsx if path.lower().endswith('.xlsx') else read_csv
+            try:
+                result = import_grades(reader(upload), teacher)
+            except (ValueError, UnicodeDecodeError) as exc:
+                raise CommandError(f'Could not read {path}: {exc}')
+        elapsed = time.perf_counter() - start
+
+        for error in result['errors'][:20]:
+            self.stderr.write(f"row {error['row']}: {error['error']}")
+        rate = result['rows'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved {result['saved']} of {result['rows']} rows ({len(result['errors'])} errors) "
+            f"in {elapsed:.2f}s, {rate:,.0f} rows/s"
+        ))
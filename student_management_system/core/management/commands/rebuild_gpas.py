@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.gpa import compute_gpas, rebuild_gpas
+from core.models import Student
+
+
+class Command(BaseCommand):
+    help = 'Rebuild per-course grade totals and every Student.gpa from the live and archived grades'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Compare stored GPAs against a from-scratch recomputation without writing',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            expected = compute_gpas()
+            stored = dict(Student.objects.values_list('pk', 'gpa'))
+            mismatches = [pk for pk, gpa in expected.items() if stored.get(pk) != gpa]
+            if mismatches:
+                raise CommandError(
+                    f"{len(mismatches)} of {len(expected)} GPAs differ from a full recomputation "
+                    f"(first student ids: {sorted(mismatches)[:10]})"
+                )
+            self.stdout.write(self.style.SUCCESS(f"All {len(expected)} GPAs match a full recomputation"))
+            return
+
+        count = rebuild_gpas()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt GPAs for {count} students"))
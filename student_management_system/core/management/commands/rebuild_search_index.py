@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.search import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Repopulate the student, teacher and course search index from the database'
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} rows in {time.perf_counter() - start:.2f}s'))
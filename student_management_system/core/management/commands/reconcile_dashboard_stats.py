@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from core.stats import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recompute the cached admin dashboard statistics from the database'
+
+    def handle(self, *args, **options):
+        stats = reconcile()
+        counters = ', '.join(f'{name}={value}' for name, value in stats.items() if isinstance(value, int))
+        self.stdout.write(self.style.SUCCESS(f'Reconciled dashboard statistics: {counters}'))
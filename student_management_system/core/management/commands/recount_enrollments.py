@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.enrollment import recount
+
+
+class Command(BaseCommand):
+    help = 'Recompute Course.enrolled_count and TeacherProfile.student_load from the active enrollments'
+
+    def handle(self, *args, **options):
+        recount()
+        self.stdout.write(self.style.SUCCESS('Recounted course enrollments and teacher loads'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Department
+from core.rankings import BATCH_SIZE, deans_list, refresh
+
+
+class Command(BaseCommand):
+    help = 'Recompute the department and course rankings queued by grade changes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every ranking, not just the queued ones')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Ranks written per INSERT')
+        parser.add_argument('--deans-list', metavar='DEPARTMENT', help="Print this department's dean's list afterwards")
+
+    def handle(self, *args, **options):
+        department = None
+        if options['deans_list']:
+            department = Department.objects.filter(code=options['deans_list']).first()
+            if department is None:
+                raise CommandError(f"Unknown department {options['deans_list']!r}")
+
+        written = refresh(full=options['full'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Ranked {written.get('department', 0)} students in departments "
+            f"and {written.get('course', 0)} in courses"
+        ))
+        if department is not None:
+            for rank in deans_list(department):
+                self.stdout.write(f'{rank.rank:>3}  {rank.student.student_id:<20} GPA {rank.score}')
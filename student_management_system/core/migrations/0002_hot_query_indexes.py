@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    # New indexes are built before the foreign key indexes they replace are dropped
+    operations = [
+        migrations.AddIndex(
+            model_name='announcement',
+            index=models.Index(fields=['-created_at', '-id'], name='announcement_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['teacher', '-due_date'], name='assignment_teacher_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['course', 'date'], name='attendance_course_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['teacher', 'is_active', 'course'], name='enrollment_teacher_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['-enrolled_date'], name='enrollment_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='grade',
+            index=models.Index(fields=['student', '-graded_at'], name='grade_student_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='grade',
+            index=models.Index(fields=['assignment', '-graded_at'], name='grade_assignment_recent_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='notification_unread_idx',
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['recipient', '-created_at'], name='notification_unread_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='announcement',
+            name='announcement_feed_idx',
+        ),
+        migrations.AlterField(
+            model_name='attendance',
+            name='course',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.course'),
+        ),
+        migrations.AlterField(
+            model_name='enrollment',
+            name='teacher',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.teacherprofile'),
+        ),
+        migrations.AlterField(
+            model_name='grade',
+            name='assignment',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.assignment'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='role',
+            field=models.CharField(choices=[('admin', 'Administrator'), ('teacher', 'Teacher'), ('student', 'Student')], db_index=True, default='student', max_length=10),
+        ),
+    ]
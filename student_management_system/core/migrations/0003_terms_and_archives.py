@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Term',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('code', models.CharField(max_length=20, unique=True)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('is_closed', models.BooleanField(default=False)),
+                ('archived_at', models.DateTimeField(blank=True, editable=False, null=True)),
+            ],
+            options={
+                'ordering': ['-start_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='GradeArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('marks_obtained', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('feedback', models.TextField(blank=True, null=True)),
+                ('graded_at', models.DateTimeField()),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.assignment')),
+                ('graded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.teacherprofile')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.student')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='core.term')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AttendanceArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('is_present', models.BooleanField(default=False)),
+                ('remarks', models.CharField(blank=True, max_length=100)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.course')),
+                ('marked_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.teacherprofile')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.student')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='core.term')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='term',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='core.term'),
+        ),
+    ]
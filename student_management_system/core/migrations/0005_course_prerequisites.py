@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_announcement_updated_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoursePrerequisite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prerequisite_links', to='core.course')),
+                ('prerequisite', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dependent_links', to='core.course')),
+            ],
+            options={
+                'constraints': [models.CheckConstraint(condition=models.Q(('course', models.F('prerequisite')), _negated=True), name='prerequisite_not_self')],
+                'unique_together': {('course', 'prerequisite')},
+            },
+        ),
+    ]
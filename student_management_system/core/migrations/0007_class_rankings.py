@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_meeting_slots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingRefresh',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('department', 'Department'), ('course', 'Course')], max_length=10)),
+                ('scope_id', models.PositiveIntegerField()),
+            ],
+            options={
+                'unique_together': {('scope', 'scope_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ClassRank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('department', 'Department'), ('course', 'Course')], max_length=10)),
+                ('scope_id', models.PositiveIntegerField(help_text='Department or Course id')),
+                ('score', models.DecimalField(decimal_places=2, help_text='GPA or course percentage', max_digits=6)),
+                ('rank', models.PositiveIntegerField()),
+                ('dense_rank', models.PositiveIntegerField()),
+                ('percent_rank', models.FloatField(help_text='0 for the top score, 1 for the lowest')),
+                ('decile', models.PositiveSmallIntegerField(help_text='1 for the top tenth')),
+                ('cohort_size', models.PositiveIntegerField()),
+                ('computed_at', models.DateTimeField()),
+                ('student', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['scope', 'scope_id', 'rank'], name='classrank_scope_rank_idx')],
+                'unique_together': {('student', 'scope', 'scope_id')},
+            },
+        ),
+    ]
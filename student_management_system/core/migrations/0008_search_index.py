@@ -0,0 +1,43 @@
+# The core_search table behind core.search. It is created here rather than
+# after migrate so that a database lacking FTS5 trigrams or pg_trgm fails
+# the migration instead of every later profile and course save. Other
+# databases have no table; core.search then falls back to ORM queries.
+
+from django.db import migrations
+
+TABLE = 'core_search'
+
+CREATE = {
+    'sqlite': [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+        f"kind, object_id UNINDEXED, label UNINDEXED, detail UNINDEXED, terms, tokenize='trigram')",
+    ],
+    'postgresql': [
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        f'CREATE TABLE IF NOT EXISTS {TABLE} ('
+        f'id bigint PRIMARY KEY, kind varchar(16) NOT NULL, object_id bigint NOT NULL, '
+        f'label text NOT NULL, detail text NOT NULL, terms text NOT NULL)',
+        f'CREATE INDEX IF NOT EXISTS {TABLE}_terms_trgm ON {TABLE} USING gin (terms gin_trgm_ops)',
+    ],
+}
+
+
+def create_search_table(apps, schema_editor):
+    for statement in CREATE.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_class_rankings'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
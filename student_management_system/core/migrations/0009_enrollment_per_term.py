@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='enrollment',
+            unique_together=set(),
+        ),
+        migrations.AddIndex(
+            model_name='term',
+            index=models.Index(condition=models.Q(('is_closed', False)), fields=['start_date'], name='term_current_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='enrollment',
+            constraint=models.UniqueConstraint(fields=('student', 'course', 'term'), name='enrollment_once_per_term'),
+        ),
+        migrations.AddConstraint(
+            model_name='enrollment',
+            constraint=models.UniqueConstraint(condition=models.Q(('term__isnull', True)), fields=('student', 'course'), name='enrollment_once_without_term'),
+        ),
+    ]
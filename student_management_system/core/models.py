@@ -2,6 +2,8 @@
 
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import NullIf, Round
+from django.db.models.lookups import GreaterThanOrEqual
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 import uuid
@@ -22,7 +24,8 @@ class User(AbstractUser):
         (STUDENT, 'Student'),
     )
     
-    role = models.CharField(max_length=10, choices=ROLE_CHOICES, default=STUDENT)
+    # Indexed for the per-role user counts on the admin dashboard
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES, default=STUDENT, db_index=True)
     phone = models.CharField(max_length=15, blank=True, null=True)
     address = models.TextField(blank=True, null=True)
     date_of_birth = models.DateField(blank=True, null=True)
@@ -43,29 +46,117 @@ class Course(models.Model):
     code = models.CharField(max_length=20, unique=True)
     department = models.ForeignKey(Department, on_delete=models.CASCADE)
     credits = models.PositiveIntegerField(default=3)
+    capacity = models.PositiveIntegerField(null=True, blank=True, help_text='Seats available; blank for unlimited')
+    enrolled_count = models.PositiveIntegerField(default=0, editable=False)
+
+class CoursePrerequisite(models.Model):
+    """course requires a pass in prerequisite; the graph is kept acyclic by core.prerequisites"""
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='prerequisite_links')
+    prerequisite = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='dependent_links')
+
+    class Meta:
+        unique_together = ['course', 'prerequisite']
+        constraints = [
+            models.CheckConstraint(
+                condition=~models.Q(course=models.F('prerequisite')), name='prerequisite_not_self',
+            ),
+        ]
 
 class Student(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, limit_choices_to={'role': User.STUDENT})
     student_id = models.CharField(max_length=20, unique=True)
     department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True)
-    gpa = models.DecimalField(max_digits=4, decimal_places=2, default=0.00)
+    gpa = models.DecimalField(max_digits=4, decimal_places=2, default=0.00, editable=False)
 
 class TeacherProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, limit_choices_to={'role': User.TEACHER})
     employee_id = models.CharField(max_length=20, unique=True)
     department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True)
+    student_load = models.PositiveIntegerField(default=0, editable=False)
+
+
+class TermQuerySet(models.QuerySet):
+    def current(self, day=None):
+        """The open term running on day (default today), or None"""
+        day = day or timezone.localdate()
+        return self.filter(is_closed=False, start_date__lte=day, end_date__gte=day).order_by('-start_date').first()
+
+class Term(models.Model):
+    """Academic term; once closed, core.archive moves its grades and attendance to the archive tables"""
+    name = models.CharField(max_length=100)
+    code = models.CharField(max_length=20, unique=True)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    is_closed = models.BooleanField(default=False)
+    archived_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = TermQuerySet.as_manager()
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['-start_date']
+        indexes = [
+            # TermManager.current(): open terms by start date, newest first
+            models.Index(fields=['start_date'], condition=models.Q(is_closed=False), name='term_current_idx'),
+        ]
 
 
 class Enrollment(models.Model):
     """Student course enrollment"""
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
-    teacher = models.ForeignKey(TeacherProfile, on_delete=models.CASCADE)
+    # Blank for enrollments that predate terms, which are never archived
+    term = models.ForeignKey(Term, on_delete=models.PROTECT, null=True, blank=True)
+    # Indexed by enrollment_teacher_idx
+    teacher = models.ForeignKey(TeacherProfile, on_delete=models.CASCADE, db_index=False)
     enrolled_date = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
     
     class Meta:
-        unique_together = ['student', 'course']
+        constraints = [
+            # A course can be retaken in a later term
+            models.UniqueConstraint(fields=['student', 'course', 'term'], name='enrollment_once_per_term'),
+            models.UniqueConstraint(
+                fields=['student', 'course'], condition=models.Q(term__isnull=True), name='enrollment_once_without_term',
+            ),
+        ]
+        indexes = [
+            # A teacher's students and courses (dashboard, audience, load
+            # balancing) without visiting the table for course_id.
+            models.Index(fields=['teacher', 'is_active', 'course'], name='enrollment_teacher_idx'),
+            # Latest enrollments on the admin dashboard
+            models.Index(fields=['-enrolled_date'], name='enrollment_recent_idx'),
+        ]
+
+class MeetingSlot(models.Model):
+    """A weekly class meeting of a course in a term; conflicts are checked by core.timetable"""
+    WEEKDAYS = (
+        (0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'),
+        (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday'),
+    )
+
+    term = models.ForeignKey(Term, on_delete=models.PROTECT, related_name='meeting_slots')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='meeting_slots')
+    teacher = models.ForeignKey(TeacherProfile, on_delete=models.SET_NULL, null=True, blank=True)
+    room = models.CharField(max_length=50, blank=True)
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAYS)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    def __str__(self):
+        return f'{self.get_weekday_display()} {self.start_time:%H:%M}-{self.end_time:%H:%M}'
+
+    class Meta:
+        ordering = ['weekday', 'start_time']
+        constraints = [
+            models.CheckConstraint(condition=models.Q(end_time__gt=models.F('start_time')), name='slot_ends_after_start'),
+        ]
+        indexes = [
+            # A term's slots on one day, for the conflict checks of a single slot
+            models.Index(fields=['term', 'weekday', 'start_time'], name='slot_term_day_idx'),
+        ]
 
 class Assignment(models.Model):
     """Assignment model"""
@@ -92,37 +183,141 @@ class Assignment(models.Model):
 
     class Meta:
         ordering = ['-due_date']
+        indexes = [
+            # A teacher's open assignments in the default ordering
+            models.Index(
+                fields=['teacher', '-due_date'],
+                condition=models.Q(is_active=True),
+                name='assignment_teacher_open_idx',
+            ),
+        ]
+
+# Lower bound (percent) of each letter grade, best first
+LETTER_GRADES = [
+    (90, 'A+'), (85, 'A'), (80, 'A-'),
+    (75, 'B+'), (70, 'B'), (65, 'B-'),
+    (60, 'C+'), (55, 'C'), (50, 'C-'),
+]
+FAILING_GRADE = 'F'
+
+class GradeQuerySet(models.QuerySet):
+    def with_letter_grades(self):
+        """Annotate the percentage and letter grade in SQL instead of per row in Python"""
+        percentage = Round(
+            models.F('marks_obtained') * 100 / NullIf(models.F('assignment__max_marks'), 0),
+            2,
+            output_field=models.DecimalField(max_digits=7, decimal_places=2),
+        )
+        # Cutoffs apply to the unrounded percentage, as in Grade.letter_grade;
+        # multiplying out the division keeps the comparison exact, and rounding
+        # to whole hundredths undoes SQLite's storing of decimals as floats
+        hundredths = Round(models.F('marks_obtained') * 100)
+        letter = models.Case(
+            models.When(assignment__max_marks=0, then=models.Value(FAILING_GRADE)),
+            *[
+                models.When(
+                    GreaterThanOrEqual(hundredths, models.F('assignment__max_marks') * cutoff),
+                    then=models.Value(letter),
+                )
+                for cutoff, letter in LETTER_GRADES
+            ],
+            default=models.Value(FAILING_GRADE),
+            output_field=models.CharField(max_length=2),
+        )
+        return self.annotate(annotated_percentage=percentage, annotated_letter_grade=letter)
 
 class Grade(models.Model):
     """Student grades with automatic calculation"""
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
-    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE)
+    # Indexed by grade_assignment_recent_idx
+    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, db_index=False)
     marks_obtained = models.DecimalField(max_digits=5, decimal_places=2)
     feedback = models.TextField(blank=True, null=True)
     graded_by = models.ForeignKey(TeacherProfile, on_delete=models.CASCADE)
     graded_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = GradeQuerySet.as_manager()
+
     @property
     def percentage(self):
+        if hasattr(self, 'annotated_percentage'):
+            return self.annotated_percentage
         return (self.marks_obtained / self.assignment.max_marks) * 100
 
     @property
     def letter_grade(self):
+        if hasattr(self, 'annotated_letter_grade'):
+            return self.annotated_letter_grade
         percentage = self.percentage
-        if percentage >= 90: return 'A+'
-        elif percentage >= 85: return 'A'
-        elif percentage >= 80: return 'A-'
-        elif percentage >= 75: return 'B+'
-        elif percentage >= 70: return 'B'
-        elif percentage >= 65: return 'B-'
-        elif percentage >= 60: return 'C+'
-        elif percentage >= 55: return 'C'
-        elif percentage >= 50: return 'C-'
-        else: return 'F'
+        for cutoff, letter in LETTER_GRADES:
+            if percentage >= cutoff:
+                return letter
+        return FAILING_GRADE
 
     class Meta:
         unique_together = ['student', 'assignment']
+        indexes = [
+            # A student's grades newest first; the unique (student,
+            # assignment) index cannot provide that order.
+            models.Index(fields=['student', '-graded_at'], name='grade_student_recent_idx'),
+            # Grades of a course's assignments newest first
+            models.Index(fields=['assignment', '-graded_at'], name='grade_assignment_recent_idx'),
+        ]
+
+class CourseGradeTotal(models.Model):
+    """Running grade totals per student and course, maintained by core.gpa"""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    marks_obtained_total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    max_marks_total = models.PositiveIntegerField(default=0)
+    graded_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def percentage(self):
+        if not self.max_marks_total:
+            return 0
+        return (self.marks_obtained_total / self.max_marks_total) * 100
+
+    class Meta:
+        unique_together = ['student', 'course']
+
+class ClassRank(models.Model):
+    """A student's standing in their department (by GPA) or in a course (by course total), written by core.rankings"""
+    DEPARTMENT = 'department'
+    COURSE = 'course'
+    SCOPES = (
+        (DEPARTMENT, 'Department'),
+        (COURSE, 'Course'),
+    )
+
+    # Indexed by the unique_together below, which leads with the student
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, db_index=False)
+    scope = models.CharField(max_length=10, choices=SCOPES)
+    scope_id = models.PositiveIntegerField(help_text='Department or Course id')
+    score = models.DecimalField(max_digits=6, decimal_places=2, help_text='GPA or course percentage')
+    rank = models.PositiveIntegerField()
+    dense_rank = models.PositiveIntegerField()
+    percent_rank = models.FloatField(help_text='0 for the top score, 1 for the lowest')
+    decile = models.PositiveSmallIntegerField(help_text='1 for the top tenth')
+    cohort_size = models.PositiveIntegerField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['student', 'scope', 'scope_id']
+        indexes = [
+            # Top of a department or course, e.g. the dean's list
+            models.Index(fields=['scope', 'scope_id', 'rank'], name='classrank_scope_rank_idx'),
+        ]
+
+class RankingRefresh(models.Model):
+    """A department or course whose ClassRank rows are out of date, queued for core.rankings.refresh()"""
+    scope = models.CharField(max_length=10, choices=ClassRank.SCOPES)
+    scope_id = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ['scope', 'scope_id']
 
 class Announcement(models.Model):
     """Announcements system with priority"""
@@ -158,11 +353,22 @@ class Announcement(models.Model):
 
     class Meta:
         ordering = ['-created_at', '-priority']
+        indexes = [
+            # Serves the keyset-paginated feed and the recent lists: the
+            # audience filter is an OR over several targets, so the plan
+            # walks (created_at, id) in index order and stops at the page
+            # size instead of sorting every match.
+            models.Index(fields=['-created_at', '-id'], name='announcement_recent_idx'),
+            # Newest edit visible to an audience, the Last-Modified of the
+            # conditional announcement pages (core.conditional)
+            models.Index(fields=['-updated_at'], name='announcement_updated_idx'),
+        ]
 
 class Attendance(models.Model):
     """Attendance tracking"""
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
-    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    # Indexed by attendance_course_date_idx
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, db_index=False)
     date = models.DateField()
     is_present = models.BooleanField(default=False)
     marked_by = models.ForeignKey(TeacherProfile, on_delete=models.CASCADE)
@@ -171,6 +377,41 @@ class Attendance(models.Model):
 
     class Meta:
         unique_together = ['student', 'course', 'date']
+        indexes = [
+            # A course's sessions within a date range
+            models.Index(fields=['course', 'date'], name='attendance_course_date_idx'),
+        ]
+
+# Archive tables for closed terms, filled by core.archive. Rows keep the
+# primary key they had in the live table, so an interrupted batch can be
+# copied again without duplicating anything.
+
+class GradeArchive(models.Model):
+    """A Grade of a closed term"""
+    id = models.BigIntegerField(primary_key=True)
+    term = models.ForeignKey(Term, on_delete=models.PROTECT)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE)
+    marks_obtained = models.DecimalField(max_digits=5, decimal_places=2)
+    feedback = models.TextField(blank=True, null=True)
+    graded_by = models.ForeignKey(TeacherProfile, on_delete=models.CASCADE)
+    graded_at = models.DateTimeField()
+
+    objects = GradeQuerySet.as_manager()
+
+    percentage = Grade.percentage
+    letter_grade = Grade.letter_grade
+
+class AttendanceArchive(models.Model):
+    """An Attendance record of a closed term"""
+    id = models.BigIntegerField(primary_key=True)
+    term = models.ForeignKey(Term, on_delete=models.PROTECT)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    date = models.DateField()
+    is_present = models.BooleanField(default=False)
+    marked_by = models.ForeignKey(TeacherProfile, on_delete=models.CASCADE)
+    remarks = models.CharField(max_length=100, blank=True)
 
 class Notification(models.Model):
     """User notifications"""
@@ -182,6 +423,16 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Only unread rows are indexed, which keeps unread counts cheap
+            # no matter how many read notifications accumulate, and lists a
+            # user's unread notifications newest first without a sort.
+            models.Index(
+                fields=['recipient', '-created_at'],
+                condition=models.Q(is_read=False),
+                name='notification_unread_idx',
+            ),
+        ]
 
 # Signal handlers for automatic profile creation
 from django.db.models.signals import post_save
@@ -191,18 +442,13 @@ from django.dispatch import receiver
 def create_user_profile(sender, instance, created, **kwargs):
     """Automatically create profile based on user type"""
     if created:
-        if instance.user_type == 'teacher':
+        if instance.role == User.TEACHER:
             TeacherProfile.objects.create(
                 user=instance,
                 employee_id=f"EMP_{instance.id:06d}",
-                join_date=timezone.now().date(),
-                designation="Assistant Professor"
             )
-        elif instance.user_type == 'student':
+        elif instance.role == User.STUDENT:
             Student.objects.create(
                 user=instance,
                 student_id=f"STU_{instance.id:06d}",
-                enrollment_date=timezone.now().date(),
-                year=1,
-                semester=1
             )
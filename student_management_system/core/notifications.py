@@ -0,0 +1,120 @@
+# Fan-out-on-write notification delivery
+#
+# Creating an announcement with a notifying priority queues it for delivery.
+# Delivery resolves the recipients as a stream of user ids and writes their
+# Notification rows with bulk_create, one transaction per chunk. With
+# NOTIFICATION_DELIVERY = 'thread' this happens on an in-process worker
+# thread after the request's transaction commits; 'sync' delivers inline,
+# which is what the tests use.
+
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Announcement, Notification, User
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_PRIORITIES = {'urgent'}
+CHUNK_SIZE = 1000
+
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def recipients_for(announcement):
+    """Ids of the active users an announcement is addressed to, excluding its author"""
+    users = User.objects.filter(is_active=True).exclude(pk=announcement.author_id)
+    target = announcement.target_audience
+    if target == 'students':
+        users = users.filter(role=User.STUDENT)
+    elif target == 'teachers':
+        users = users.filter(role=User.TEACHER)
+    elif target == 'department':
+        users = users.filter(
+            Q(student__department_id=announcement.department_id)
+            | Q(teacherprofile__department_id=announcement.department_id)
+        )
+    elif target == 'course':
+        users = users.filter(
+            Q(student__enrollment__course_id=announcement.course_id, student__enrollment__is_active=True)
+            | Q(teacherprofile__enrollment__course_id=announcement.course_id, teacherprofile__enrollment__is_active=True)
+        ).distinct()
+    return users.values_list('pk', flat=True)
+
+
+def deliver(announcement_id, chunk_size=CHUNK_SIZE):
+    """Write one Notification per recipient; returns how many were created"""
+    announcement = Announcement.objects.filter(pk=announcement_id).first()
+    if announcement is None:
+        return 0
+    title = announcement.title[:Notification._meta.get_field('title').max_length]
+    created = 0
+    batch = []
+    for user_id in recipients_for(announcement).iterator(chunk_size=chunk_size):
+        batch.append(Notification(recipient_id=user_id, title=title, message=announcement.content))
+        if len(batch) >= chunk_size:
+            created += _write(batch)
+            batch = []
+    if batch:
+        created += _write(batch)
+    return created
+
+
+def _write(batch):
+    with transaction.atomic():
+        Notification.objects.bulk_create(batch)
+    return len(batch)
+
+
+def _work():
+    while True:
+        announcement_id = _queue.get()
+        try:
+            close_old_connections()
+            count = deliver(announcement_id)
+            logger.info('Delivered %d notifications for announcement %s', count, announcement_id)
+        except Exception:
+            logger.exception('Notification delivery failed for announcement %s', announcement_id)
+        finally:
+            close_old_connections()
+            _queue.task_done()
+
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_work, name='notification-fanout', daemon=True)
+            _worker.start()
+
+
+def enqueue(announcement_id):
+    """Deliver an announcement's notifications according to NOTIFICATION_DELIVERY"""
+    if getattr(settings, 'NOTIFICATION_DELIVERY', 'thread') == 'sync':
+        return deliver(announcement_id)
+    _ensure_worker()
+    _queue.put(announcement_id)
+
+
+def wait_for_delivery():
+    """Block until every queued announcement has been delivered"""
+    _queue.join()
+
+
+def unread_count(user):
+    """Served by the partial (recipient, is_read) index on unread rows"""
+    return Notification.objects.filter(recipient=user, is_read=False).count()
+
+
+@receiver(post_save, sender=Announcement)
+def fan_out_announcement(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.is_active and instance.priority in NOTIFY_PRIORITIES:
+        transaction.on_commit(lambda: enqueue(instance.pk))
@@ -0,0 +1,55 @@
+# Keyset (cursor) pagination
+#
+# Pages are taken in (created_at DESC, id DESC) order by filtering on the
+# last row seen instead of using OFFSET, so every page costs one indexed
+# range scan no matter how deep the client has paged.
+
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    raw = f'{created_at.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(f'Invalid cursor: {cursor!r}')
+
+
+def page_size_from(value, default=DEFAULT_PAGE_SIZE):
+    """Clamp a client-supplied page size to 1..MAX_PAGE_SIZE"""
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return default
+
+
+def keyset_page(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """One page of queryset newest first, and the cursor for the next page (or None)"""
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    rows = list(queryset[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    if isinstance(last, dict):
+        return rows, encode_cursor(last['created_at'], last['id'])
+    return rows, encode_cursor(last.created_at, last.pk)
@@ -0,0 +1,211 @@
+# Course prerequisite graph
+#
+# CoursePrerequisite rows form a directed acyclic graph. Each process keeps
+# it in memory as a PrerequisiteGraph holding, besides the direct edges, the
+# transitive closure in both directions: every course's full chain of
+# prerequisites and every course that depends on it. Cycle checks and
+# eligibility are then set operations, with no query per edge.
+#
+# Adding an edge extends the closure of the course and its dependents;
+# removing one recomputes the closure of just those courses. The process
+# that writes an edge applies it to its own graph once the write commits, if
+# that graph is still the published version, and publishes a new version in
+# the cache; other processes see the version change on their next read and
+# reload the edges with one query.
+#
+# A course is available to a student once every course in its prerequisite
+# chain is completed, meaning the student's running total for it (see
+# core.gpa) is at least the lowest passing percentage.
+
+import threading
+import uuid
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import LETTER_GRADES, Course, CourseGradeTotal, CoursePrerequisite, Enrollment
+
+VERSION_KEY = 'prerequisite_graph_version'
+# Lowest percentage that earns a letter grade other than F
+PASSING_PERCENTAGE = LETTER_GRADES[-1][0]
+
+
+class PrerequisiteCycle(ValueError):
+    pass
+
+
+class PrerequisiteGraph:
+    """Direct prerequisite edges with their transitive closure in both directions"""
+
+    def __init__(self, edges=()):
+        self.requires = {}      # course id -> direct prerequisite ids
+        self.ancestors = {}     # course id -> every prerequisite id in its chain
+        self.descendants = {}   # course id -> every course id whose chain includes it
+        for course_id, prerequisite_id in edges:
+            self.add(course_id, prerequisite_id)
+
+    def chain(self, course_id):
+        """Every prerequisite of a course, direct or transitive"""
+        return self.ancestors.get(course_id, frozenset())
+
+    def check(self, course_id, prerequisite_id):
+        """Raise PrerequisiteCycle when the edge would close a cycle"""
+        if course_id == prerequisite_id or course_id in self.chain(prerequisite_id):
+            raise PrerequisiteCycle(f'Course {prerequisite_id} already requires course {course_id}')
+
+    def add(self, course_id, prerequisite_id):
+        self.check(course_id, prerequisite_id)
+        self.requires.setdefault(course_id, set()).add(prerequisite_id)
+        gained = {prerequisite_id} | self.chain(prerequisite_id)
+        affected = {course_id} | self.descendants.get(course_id, set())
+        for node in affected:
+            self.ancestors[node] = self.chain(node) | gained
+        for node in gained:
+            self.descendants.setdefault(node, set()).update(affected)
+
+    def remove(self, course_id, prerequisite_id):
+        direct = self.requires.get(course_id)
+        if not direct or prerequisite_id not in direct:
+            return
+        direct.discard(prerequisite_id)
+        affected = {course_id} | self.descendants.get(course_id, set())
+        previous = {node: self.chain(node) for node in affected}
+        # Recompute the affected chains, prerequisites first
+        for node in self._ordered(affected):
+            chain = set()
+            for required in self.requires.get(node, ()):
+                chain.add(required)
+                chain |= self.chain(required)
+            self.ancestors[node] = frozenset(chain)
+        for node in affected:
+            for lost in previous[node] - self.ancestors[node]:
+                self.descendants[lost].discard(node)
+
+    def _ordered(self, nodes):
+        # A node's chain is complete once every affected prerequisite precedes it
+        return sorted(nodes, key=lambda node: len(self.chain(node) & nodes))
+
+    def eligible(self, course_ids, completed):
+        """The course ids whose whole prerequisite chain is in completed"""
+        completed = set(completed)
+        return [course_id for course_id in course_ids if self.chain(course_id) <= completed]
+
+
+_graph = None
+_graph_version = None
+_lock = threading.Lock()
+
+
+def load():
+    """A PrerequisiteGraph of every edge, from one query"""
+    return PrerequisiteGraph(CoursePrerequisite.objects.values_list('course_id', 'prerequisite_id'))
+
+
+def graph():
+    """This process's graph, reloaded when another process has changed the edges"""
+    global _graph, _graph_version
+    version = cache.get(VERSION_KEY)
+    with _lock:
+        if _graph is None or version is None or version != _graph_version:
+            _graph = load()
+            _graph_version = version or _publish()
+        return _graph
+
+
+def _publish():
+    version = uuid.uuid4().hex
+    cache.set(VERSION_KEY, version, None)
+    return version
+
+
+def _apply(change, course_id, prerequisite_id):
+    global _graph, _graph_version
+    with _lock:
+        # A graph older than the published version lacks other processes'
+        # changes, so it is reloaded rather than edited
+        if change is None or _graph is None or cache.get(VERSION_KEY) != _graph_version:
+            _graph = None
+        else:
+            getattr(_graph, change)(course_id, prerequisite_id)
+        _graph_version = _publish()
+
+
+def completed_courses(student_ids):
+    """Course ids each student has passed, keyed by student id, from one query"""
+    passing = CourseGradeTotal.objects.filter(
+        student_id__in=student_ids,
+        max_marks_total__gt=0,
+        marks_obtained_total__gte=F('max_marks_total') * Decimal(PASSING_PERCENTAGE) / 100,
+    ).values_list('student_id', 'course_id')
+    completed = {student_id: set() for student_id in student_ids}
+    for student_id, course_id in passing:
+        completed[student_id].add(course_id)
+    return completed
+
+
+def available_courses(students):
+    """Course ids each student may enroll in, keyed by student id
+
+    Candidates are the courses of the student's department they are not
+    enrolled in; the prerequisite chains are checked against the courses
+    they completed, for all students in one pass.
+    """
+    students = list(students)
+    student_ids = [student.pk for student in students]
+    completed = completed_courses(student_ids)
+    enrolled = {student_id: set() for student_id in student_ids}
+    for student_id, course_id in Enrollment.objects.filter(student_id__in=student_ids).values_list('student_id', 'course_id'):
+        enrolled[student_id].add(course_id)
+    by_department = {}
+    for department_id, course_id in Course.objects.filter(
+        department_id__in={student.department_id for student in students}
+    ).values_list('department_id', 'pk'):
+        by_department.setdefault(department_id, []).append(course_id)
+    prerequisites = graph()
+    return {
+        student.pk: prerequisites.eligible(
+            [course_id for course_id in by_department.get(student.department_id, ()) if course_id not in enrolled[student.pk]],
+            completed[student.pk],
+        )
+        for student in students
+    }
+
+
+def eligible_courses(student, courses):
+    """The courses of the given ones whose prerequisite chain the student has completed"""
+    courses = list(courses)
+    prerequisites = graph()
+    if not any(prerequisites.chain(course.pk) for course in courses):
+        return courses
+    eligible = set(prerequisites.eligible([course.pk for course in courses], completed_courses([student.pk])[student.pk]))
+    return [course for course in courses if course.pk in eligible]
+
+
+def missing(student, course):
+    """Prerequisite course ids the student has yet to complete for a course"""
+    chain = graph().chain(course.pk)
+    return set(chain) - completed_courses([student.pk])[student.pk] if chain else set()
+
+
+# Signal handlers keeping the graphs current
+
+@receiver(pre_save, sender=CoursePrerequisite)
+def reject_cycles(sender, instance, raw=False, **kwargs):
+    if not raw:
+        graph().check(instance.course_id, instance.prerequisite_id)
+
+
+@receiver(post_save, sender=CoursePrerequisite)
+def prerequisite_saved(sender, instance, created, raw=False, **kwargs):
+    # An edited edge has lost its previous endpoints, so the graph is reloaded
+    change = 'add' if created and not raw else None
+    transaction.on_commit(lambda: _apply(change, instance.course_id, instance.prerequisite_id))
+
+
+@receiver(post_delete, sender=CoursePrerequisite)
+def prerequisite_removed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: _apply('remove', instance.course_id, instance.prerequisite_id))
@@ -0,0 +1,309 @@
+# Per-request query and latency profiling
+#
+# ProfilingMiddleware counts SQL queries and database time through an
+# execute wrapper installed on every connection, times the whole request and,
+# with the TimedDjangoTemplates backend configured in TEMPLATES, template
+# rendering, reports the numbers in a Server-Timing header and keeps a
+# rolling window of samples per view for the profiling_metrics endpoint, with
+# the share of them answered 304 Not Modified. Views can declare how many
+# queries they are allowed with @query_budget.
+#
+# A budget covers the queries issued while the view runs, the lazily loaded
+# session and user included, but not what the outer middleware does before
+# and after it, such as saving a modified session. QueryBudgetMiddleware, the
+# innermost middleware, marks where the view's queries start and end.
+#
+# Budgets are declared for the cached identity path: cached_db sessions and
+# core.identity.CachedModelBackend, which load a returning user's session and
+# identity without a query and a new one's identity with one. A deployment
+# configured otherwise is allowed the queries its session engine and
+# backends add (identity_allowance()).
+#
+# The request's profile lives in a context variable rather than on the
+# connection, so queries an async view runs on executor threads (see
+# core.fanout) are attributed to the request as well.
+
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SIZE = 1000
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_current = contextvars.ContextVar('request_profile', default=None)
+_samples = defaultdict(lambda: deque(maxlen=WINDOW_SIZE))
+_budgets = {}
+_lock = threading.Lock()
+
+
+# Queries per request of session engines that do not read from the cache
+SESSION_QUERIES = {'django.contrib.sessions.backends.db': 1}
+CACHED_BACKEND = 'core.identity.CachedModelBackend'
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(max_queries):
+    """Declare the most SQL queries a view may issue per request"""
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+def identity_allowance():
+    """Queries the configured session engine and authentication backends add to the cached path"""
+    allowance = SESSION_QUERIES.get(settings.SESSION_ENGINE, 0)
+    if CACHED_BACKEND not in settings.AUTHENTICATION_BACKENDS:
+        # The user, then its role profile
+        allowance += 2
+    return allowance
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = 0
+        self.view_started = 0
+        self.view_finished = None
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.wall_time = 0.0
+        self.view_name = None
+        self.budget = None
+        self.status = None
+        self._rendering = False
+        self._lock = threading.Lock()
+
+    @property
+    def view_queries(self):
+        finished = self.queries if self.view_finished is None else self.view_finished
+        return finished - self.view_started
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self._lock:
+                self.db_time += time.perf_counter() - start
+                self.queries += 1
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_time * 1000:.2f}',
+            f'total;dur={self.wall_time * 1000:.2f}',
+        ])
+
+
+def current_profile():
+    """The profile of the request being handled, if any"""
+    return _current.get()
+
+
+def _record_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile.record_query(execute, sql, params, many, context)
+
+
+def _install_query_recorder(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        profile = _current.get()
+        # Only the outermost template is timed so templates rendered while
+        # rendering another are not counted twice
+        if profile is None or profile._rendering:
+            return super().render(context, request)
+        profile._rendering = True
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.template_time += time.perf_counter() - start
+            profile._rendering = False
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each render for the request's profile"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+def record(profile):
+    with _lock:
+        _samples[profile.view_name].append(
+            (
+                profile.wall_time, profile.queries, profile.db_time, profile.template_time, profile.status,
+                profile.view_queries,
+            )
+        )
+        if profile.budget is not None:
+            _budgets[profile.view_name] = profile.budget
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _budgets.clear()
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def snapshot():
+    """Rolling per-view latency and query statistics"""
+    with _lock:
+        samples = {view: list(window) for view, window in _samples.items()}
+        budgets = dict(_budgets)
+    result = {}
+    for view, window in samples.items():
+        wall_ms = sorted(sample[0] * 1000 for sample in window)
+        queries = sorted(sample[1] for sample in window)
+        view_queries = [sample[5] for sample in window]
+        histogram = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        for value in wall_ms:
+            histogram[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, value)] += 1
+        labels = [f'<={bound}ms' for bound in HISTOGRAM_BUCKETS_MS] + [f'>{HISTOGRAM_BUCKETS_MS[-1]}ms']
+        budget = budgets.get(view)
+        not_modified = sum(1 for sample in window if sample[4] == 304)
+        result[view] = {
+            'requests': len(window),
+            'wall_ms': {
+                'p50': round(_percentile(wall_ms, 0.50), 2),
+                'p95': round(_percentile(wall_ms, 0.95), 2),
+                'p99': round(_percentile(wall_ms, 0.99), 2),
+                'max': round(wall_ms[-1], 2),
+            },
+            'queries': {
+                'mean': round(sum(queries) / len(queries), 2),
+                'max': queries[-1],
+                'view_max': max(view_queries),
+            },
+            'db_ms_mean': round(sum(sample[2] for sample in window) * 1000 / len(window), 2),
+            'template_ms_mean': round(sum(sample[3] for sample in window) * 1000 / len(window), 2),
+            'histogram': dict(zip(labels, histogram)),
+            'query_budget': budget,
+            'over_budget': 0 if budget is None else sum(1 for count in view_queries if count > budget),
+            'not_modified': not_modified,
+            'not_modified_pct': round(not_modified * 100 / len(window), 2),
+        }
+    return result
+
+
+class ProfilingMiddleware:
+    """Measure queries, DB time, template time and wall time for every request"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        connection_created.connect(_install_query_recorder, dispatch_uid='profiling_query_recorder')
+        for connection in connections.all(initialized_only=True):
+            _install_query_recorder(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        profile = RequestProfile()
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.wall_time = time.perf_counter() - start
+            _current.reset(token)
+        return self._finish(profile, response)
+
+    async def __acall__(self, request):
+        profile = RequestProfile()
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profile.wall_time = time.perf_counter() - start
+            _current.reset(token)
+        return self._finish(profile, response)
+
+    def _finish(self, profile, response):
+        response['Server-Timing'] = profile.server_timing()
+        profile.status = response.status_code
+        if profile.view_name is not None:
+            record(profile)
+        if profile.budget is not None and profile.view_queries > profile.budget:
+            message = f'{profile.view_name} issued {profile.view_queries} queries, budget is {profile.budget}'
+            if getattr(settings, 'QUERY_BUDGET_ENFORCE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = _current.get()
+        if profile is not None:
+            match = request.resolver_match
+            profile.view_name = (match and match.url_name) or view_func.__name__
+            budget = getattr(view_func, 'query_budget', None)
+            profile.budget = None if budget is None else budget + identity_allowance()
+
+
+class QueryBudgetMiddleware:
+    """Mark the queries of the view itself, for its budget; goes last in MIDDLEWARE"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        profile = _current.get()
+        if profile is None:
+            return self.get_response(request)
+        profile.view_started = profile.queries
+        try:
+            return self.get_response(request)
+        finally:
+            profile.view_finished = profile.queries
+
+    async def __acall__(self, request):
+        profile = _current.get()
+        if profile is None:
+            return await self.get_response(request)
+        profile.view_started = profile.queries
+        try:
+            return await self.get_response(request)
+        finally:
+            profile.view_finished = profile.queries
@@ -0,0 +1,178 @@
+# Bulk user provisioning
+#
+# Onboards a roster of students and teachers without going through
+# create_user_profile once per user. Rows arrive as dicts with username,
+# email, first_name, last_name, role (student or teacher), an optional
+# password, department (Department.code), phone and date_of_birth. Passwords
+# are hashed in a process pool, since the hasher is deliberately slow and
+# CPU-bound; each batch then inserts its User rows and their Student or
+# TeacherProfile rows with two bulk_create calls in one transaction.
+# Because bulk_create skips model signals, the profiles get the same
+# generated codes as create_user_profile and the search index and dashboard
+# counters are refreshed here.
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from . import search, stats
+from .models import Department, Student, TeacherProfile, User
+
+BATCH_SIZE = 1000
+ROLES = (User.STUDENT, User.TEACHER)
+
+
+def _init_worker():
+    # Spawned (rather than forked) workers start without configured apps
+    import django
+    django.setup()
+
+
+def _hash(password):
+    return make_password(password)
+
+
+def hash_passwords(passwords, pool=None, workers=1):
+    """make_password for each plaintext, spread over a process pool of workers when given one
+
+    Blank passwords become unusable ones without a trip to the pool.
+    """
+    hashed = [None if password else make_password(None) for password in passwords]
+    pending = [(index, password) for index, password in enumerate(passwords) if password]
+    if pool is None or len(pending) < 2:
+        results = map(_hash, [password for _, password in pending])
+    else:
+        chunksize = max(1, len(pending) // (workers * 4))
+        results = pool.map(_hash, [password for _, password in pending], chunksize=chunksize)
+    for (index, _), value in zip(pending, results):
+        hashed[index] = value
+    return hashed
+
+
+def _text(row, field):
+    value = row.get(field)
+    return '' if value is None else str(value).strip()
+
+
+def _date_of_birth(value):
+    if value in (None, ''):
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError(f'Invalid date_of_birth: {value!r}')
+
+
+def _clean(row, departments, default_password):
+    username = User.normalize_username(_text(row, 'username'))
+    if not username:
+        raise ValueError('Missing username')
+    if len(username) > User._meta.get_field('username').max_length:
+        raise ValueError(f'Username too long: {username!r}')
+    role = _text(row, 'role').lower() or User.STUDENT
+    if role not in ROLES:
+        raise ValueError(f'Invalid role: {role!r}')
+    department = _text(row, 'department')
+    if department and department not in departments:
+        raise ValueError(f'Unknown department: {department!r}')
+    user = User(
+        username=username,
+        email=User.objects.normalize_email(_text(row, 'email')),
+        first_name=_text(row, 'first_name'),
+        last_name=_text(row, 'last_name'),
+        role=role,
+        phone=_text(row, 'phone') or None,
+        date_of_birth=_date_of_birth(row.get('date_of_birth')),
+    )
+    return user, departments.get(department), _text(row, 'password') or default_password
+
+
+def _provision_chunk(chunk, departments, default_password, seen, pool, workers):
+    usernames = {User.normalize_username(_text(row, 'username')) for _, row in chunk}
+    existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+
+    valid = []
+    errors = []
+    for number, row in chunk:
+        try:
+            user, department, password = _clean(row, departments, default_password)
+        except ValueError as exc:
+            errors.append({'row': number, 'error': str(exc)})
+            continue
+        if user.username in existing:
+            errors.append({'row': number, 'error': f'Username already taken: {user.username!r}'})
+            continue
+        if user.username in seen:
+            errors.append({'row': number, 'error': f'Duplicate of row {seen[user.username]}'})
+            continue
+        seen[user.username] = number
+        valid.append((user, department, password))
+
+    start = time.perf_counter()
+    for (user, _, _), hashed in zip(valid, hash_passwords([password for _, _, password in valid], pool, workers)):
+        user.password = hashed
+    hashing = time.perf_counter() - start
+
+    created = {User.STUDENT: [], User.TEACHER: []}
+    with transaction.atomic():
+        users = User.objects.bulk_create([user for user, _, _ in valid])
+        # Same codes as create_user_profile
+        students = Student.objects.bulk_create([
+            Student(user=user, student_id=f'STU_{user.id:06d}', department_id=department)
+            for user, (_, department, _) in zip(users, valid) if user.role == User.STUDENT
+        ])
+        teachers = TeacherProfile.objects.bulk_create([
+            TeacherProfile(user=user, employee_id=f'EMP_{user.id:06d}', department_id=department)
+            for user, (_, department, _) in zip(users, valid) if user.role == User.TEACHER
+        ])
+        created[User.STUDENT] = [student.pk for student in students]
+        created[User.TEACHER] = [teacher.pk for teacher in teachers]
+        search.reindex('student', created[User.STUDENT])
+        search.reindex('teacher', created[User.TEACHER])
+    return created, errors, hashing
+
+
+def provision_users(rows, default_password=None, workers=None, batch_size=BATCH_SIZE):
+    """Create users and their role profiles in batches, one transaction per batch
+
+    Rows are numbered from 1 in input order; invalid rows and taken usernames
+    are skipped and reported. Rows without a password get default_password,
+    or an unusable password when that is None too. workers is the size of the
+    hashing process pool (default: one per CPU; 1 hashes in this process).
+    Returns a dict with the row count, created students and teachers,
+    per-row errors and the seconds spent hashing and overall.
+    """
+    departments = dict(Department.objects.values_list('code', 'pk'))
+    workers = workers or os.cpu_count() or 1
+    rows = iter(rows)
+    seen = {}
+    result = {'rows': 0, 'students': 0, 'teachers': 0, 'errors': [], 'hashing': 0.0}
+    start = time.perf_counter()
+    pool = ProcessPoolExecutor(workers, initializer=_init_worker) if workers > 1 else None
+    try:
+        while True:
+            chunk = [(result['rows'] + offset, row) for offset, row in enumerate(islice(rows, batch_size), start=1)]
+            if not chunk:
+                break
+            result['rows'] = chunk[-1][0]
+            created, errors, hashing = _provision_chunk(chunk, departments, default_password, seen, pool, workers)
+            result['students'] += len(created[User.STUDENT])
+            result['teachers'] += len(created[User.TEACHER])
+            result['errors'].extend(errors)
+            result['hashing'] += hashing
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if result['students'] or result['teachers']:
+            transaction.on_commit(lambda: stats.invalidate('total_students', 'total_teachers'))
+    result['elapsed'] = time.perf_counter() - start
+    return result
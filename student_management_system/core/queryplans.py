@@ -0,0 +1,117 @@
+# Query plan checks
+#
+# explain() asks the database how it would run a captured query and
+# problems() picks out the plan steps whose cost grows with the table rather
+# than with the result: a full table scan (SQLite "SCAN core_grade" without
+# an index, PostgreSQL "Seq Scan") and a sort the index order could not
+# provide (SQLite "USE TEMP B-TREE FOR ORDER BY", PostgreSQL "Sort").
+# capture_plans() runs a callable, usually a view, and explains every SELECT
+# it issued; the query plan regression tests use it on the hot views.
+#
+# PostgreSQL plans are taken with sequential scans and sorts priced out
+# (enable_seqscan/enable_sort off), so a small test dataset still shows
+# whether an index could serve the query; SQLite plans by heuristics until
+# ANALYZE has run, which the tests avoid for the same reason.
+#
+# estimated_rows() asks the PostgreSQL planner how many rows a queryset
+# returns, for the admin changelists that would otherwise COUNT(*) a large
+# table on every page.
+
+import json
+import re
+
+from django.db import connections, transaction
+from django.test.utils import CaptureQueriesContext
+
+# Lookup tables small enough to read whole; core.prerequisites loads every
+# prerequisite edge into its graph by design
+SMALL_TABLES = {'core_courseprerequisite', 'core_department', 'django_content_type', 'django_site'}
+
+_SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+_SQLITE_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+# Django's subquery aliases, e.g. "core_enrollment" U1
+_ALIAS = re.compile(r'"(\w+)" ([A-Z]\d+)\b')
+
+
+def explain(sql, using='default'):
+    """The plan of an already executed query, as a list of step descriptions (SQLite) or plan nodes (PostgreSQL)"""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            with transaction.atomic(using=using):
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('SET LOCAL enable_sort = off')
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                plan = cursor.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            return list(_pg_nodes(plan[0]['Plan']))
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+    raise NotImplementedError(f'No query plan support for {connection.vendor}')
+
+
+def _pg_nodes(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from _pg_nodes(child)
+
+
+def problems(plan, sql='', using='default'):
+    """Full scans of non-lookup tables and sorts in a plan from explain() of sql"""
+    tables = set(connections[using].introspection.table_names())
+    aliases = {alias: table for table, alias in _ALIAS.findall(sql)}
+    found = []
+    for step in plan:
+        if isinstance(step, dict):
+            if step['Node Type'] == 'Seq Scan' and step['Relation Name'] not in SMALL_TABLES:
+                found.append(f"full scan of {step['Relation Name']}")
+            elif step['Node Type'] in ('Sort', 'Incremental Sort'):
+                found.append('sort for ORDER BY')
+        else:
+            match = _SQLITE_SCAN.match(step)
+            # Scans of subquery results are bounded by the subquery itself
+            table = match and aliases.get(match.group(1), match.group(1))
+            if table in tables and table not in SMALL_TABLES:
+                found.append(f'full scan of {table}')
+            elif step.startswith(_SQLITE_SORT):
+                found.append('sort for ORDER BY')
+    return found
+
+
+def estimated_rows(queryset):
+    """The planner's row estimate for a queryset, or None where the database has none
+
+    Whole tables are estimated from pg_class.reltuples, filtered querysets
+    from the top node of their plan.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    queryset = queryset.order_by()
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+            # -1 (or 0 on older servers) until the table is first vacuumed or analyzed
+            return int(row[0]) if row and row[0] > 0 else None
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def capture_plans(func, *args, using='default', **kwargs):
+    """Call func and explain each SELECT it ran; returns its result and a list of
+    {'sql', 'plan', 'problems'} dicts in execution order"""
+    with CaptureQueriesContext(connections[using]) as captured:
+        result = func(*args, **kwargs)
+    plans = []
+    for query in captured.captured_queries:
+        sql = query['sql']
+        if not sql.lstrip().upper().startswith('SELECT'):
+            continue
+        plan = explain(sql, using)
+        plans.append({'sql': sql, 'plan': plan, 'problems': problems(plan, sql, using)})
+    return result, plans
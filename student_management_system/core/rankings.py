@@ -0,0 +1,185 @@
+# Class rankings
+#
+# ClassRank is a snapshot of every student's standing: in their department
+# by Student.gpa, and in each course by their running course total. The
+# snapshot is computed in SQL, one query per scope, with window functions
+# partitioned by department or course (Rank, DenseRank, PercentRank, Ntile
+# and the partition size), and written in batches. Dashboards then read a
+# student's ranks with one lookup on the (student, scope, scope_id) key, and
+# the dean's list of a department is the top of the (scope, scope_id, rank)
+# index. Students with no graded coursework are left out of the department
+# ranks.
+#
+# Ranks are relative, so any change to one student's GPA or course total
+# moves others in the same department or course. The GPA engine therefore
+# queues the affected departments and courses in RankingRefresh, in the same
+# transaction as the change, and refresh() recomputes just those partitions.
+# It is meant to run periodically (see the refresh_rankings command). The
+# queue entries are deleted in the transaction that writes the new ranks, so
+# a change committed meanwhile queues its partition again.
+
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DecimalField, Exists, ExpressionWrapper, F, OuterRef, Window
+from django.db.models.functions import DenseRank, Ntile, PercentRank, Rank
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import fragments
+from .models import ClassRank, Course, CourseGradeTotal, Department, RankingRefresh, Student
+
+BATCH_SIZE = 1000
+DEANS_LIST_SIZE = 10
+DECILES = 10
+SCORE_PLACES = Decimal('0.01')
+
+RANK_FIELDS = ('position', 'dense_position', 'percentile', 'tenth', 'size')
+
+
+def _windows(partition, score, student):
+    order = score.desc()
+    return {
+        'position': Window(Rank(), partition_by=partition, order_by=order),
+        'dense_position': Window(DenseRank(), partition_by=partition, order_by=order),
+        'percentile': Window(PercentRank(), partition_by=partition, order_by=order),
+        # Ties are split between deciles by student, so that reruns agree
+        'tenth': Window(Ntile(DECILES), partition_by=partition, order_by=[order, student.asc()]),
+        'size': Window(Count('pk'), partition_by=partition),
+    }
+
+
+def department_ranks(department_ids=None):
+    """(student, department, GPA, *RANK_FIELDS) rows ranking each department's graded students by GPA"""
+    students = Student.objects.filter(
+        Exists(CourseGradeTotal.objects.filter(student=OuterRef('pk'), graded_count__gt=0)),
+        department__isnull=False,
+    )
+    if department_ids is not None:
+        students = students.filter(department_id__in=department_ids)
+    return students.annotate(**_windows(F('department_id'), F('gpa'), F('pk'))).values_list(
+        'pk', 'department_id', 'gpa', *RANK_FIELDS
+    )
+
+
+def course_ranks(course_ids=None):
+    """(student, course, percentage, *RANK_FIELDS) rows ranking each course's students by their course total"""
+    totals = CourseGradeTotal.objects.filter(max_marks_total__gt=0)
+    if course_ids is not None:
+        totals = totals.filter(course_id__in=course_ids)
+    percentage = ExpressionWrapper(
+        F('marks_obtained_total') * 100 / F('max_marks_total'), output_field=DecimalField(max_digits=12, decimal_places=4)
+    )
+    return totals.annotate(percentage=percentage, **_windows(F('course_id'), percentage, F('student_id'))).values_list(
+        'student_id', 'course_id', 'percentage', *RANK_FIELDS
+    )
+
+
+RANKERS = {
+    ClassRank.DEPARTMENT: department_ranks,
+    ClassRank.COURSE: course_ranks,
+}
+
+
+def _write(scope, rows, computed_at, batch_size):
+    written = 0
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        ClassRank.objects.bulk_create([
+            ClassRank(
+                student_id=student_id, scope=scope, scope_id=scope_id,
+                score=Decimal(score).quantize(SCORE_PLACES), rank=position, dense_rank=dense_position,
+                percent_rank=percentile, decile=tenth, cohort_size=size, computed_at=computed_at,
+            )
+            for student_id, scope_id, score, position, dense_position, percentile, tenth, size in batch
+        ])
+        written += len(batch)
+    return written
+
+
+@transaction.atomic
+def refresh(full=False, batch_size=BATCH_SIZE):
+    """Recompute the queued ranking partitions, or every one; returns the rows written per scope"""
+    if full:
+        RankingRefresh.objects.all().delete()
+        scopes = {scope: None for scope in RANKERS}
+    else:
+        queued = list(RankingRefresh.objects.select_for_update().values_list('pk', 'scope', 'scope_id'))
+        RankingRefresh.objects.filter(pk__in=[pk for pk, _, _ in queued]).delete()
+        scopes = {}
+        for _, scope, scope_id in queued:
+            scopes.setdefault(scope, set()).add(scope_id)
+
+    computed_at = timezone.now()
+    written = {}
+    for scope, scope_ids in scopes.items():
+        stale = ClassRank.objects.filter(scope=scope)
+        if scope_ids is not None:
+            stale = stale.filter(scope_id__in=scope_ids)
+        stale.delete()
+        rows = RANKERS[scope](scope_ids).iterator(chunk_size=batch_size)
+        written[scope] = _write(scope, rows, computed_at, batch_size)
+    if written:
+        fragments.bump('rankings')
+    return written
+
+
+def queue(scope, scope_ids):
+    """Queue ranking partitions for the next refresh()"""
+    scope_ids = {scope_id for scope_id in scope_ids if scope_id is not None}
+    if scope_ids:
+        RankingRefresh.objects.bulk_create(
+            [RankingRefresh(scope=scope, scope_id=scope_id) for scope_id in scope_ids], ignore_conflicts=True
+        )
+
+
+def gpas_changed(student_ids):
+    """Queue the departments of students whose GPA changed"""
+    departments = Student.objects.filter(pk__in=student_ids).values_list('department_id', flat=True).distinct()
+    queue(ClassRank.DEPARTMENT, departments)
+
+
+def ranks_for(student):
+    """A student's department ClassRank (or None) and course ClassRanks by course id, from one query"""
+    ranks = {'department': None, 'courses': {}}
+    for rank in ClassRank.objects.filter(student=student):
+        if rank.scope == ClassRank.COURSE:
+            ranks['courses'][rank.scope_id] = rank
+        elif rank.scope_id == student.department_id:
+            ranks['department'] = rank
+    return ranks
+
+
+def deans_list_size():
+    return getattr(settings, 'DEANS_LIST_SIZE', DEANS_LIST_SIZE)
+
+
+def deans_list(department, size=None):
+    """The department's top students by GPA, ties included, as ClassRanks with their students"""
+    return ClassRank.objects.filter(
+        scope=ClassRank.DEPARTMENT, scope_id=department.pk, rank__lte=size or deans_list_size(),
+    ).select_related('student__user').order_by('rank', 'student_id')
+
+
+# Signal handlers queueing the partitions a change moves
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def student_changed(sender, instance, created=False, raw=False, **kwargs):
+    # A student who changed department still counts in the old one's ranks
+    if not created and not raw:
+        previous = ClassRank.objects.filter(student_id=instance.pk, scope=ClassRank.DEPARTMENT).values_list(
+            'scope_id', flat=True
+        )
+        queue(ClassRank.DEPARTMENT, [instance.department_id, *previous])
+
+
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Department)
+def scope_deleted(sender, instance, **kwargs):
+    scope = ClassRank.COURSE if sender is Course else ClassRank.DEPARTMENT
+    ClassRank.objects.filter(scope=scope, scope_id=instance.pk).delete()
+    RankingRefresh.objects.filter(scope=scope, scope_id=instance.pk).delete()
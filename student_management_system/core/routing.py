@@ -0,0 +1,210 @@
+# Read-replica routing
+#
+# Views decorated with @replica_reads may send their reads to the aliases in
+# settings.DATABASE_REPLICAS, chosen round-robin among the ones passing a
+# periodic health check. Everything else reads from and writes to 'default'.
+#
+# Writes pin the rest of the request to the primary, so a view that writes
+# and then reads sees its own data. ReplicaRoutingMiddleware also sets a
+# short-lived cookie after a request that wrote, so the next few requests of
+# the same client (typically the redirect after a POST) read from the
+# primary while the replicas catch up.
+
+import contextvars
+import functools
+import itertools
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'db_pin'
+HEALTH_CHECK_INTERVAL = 10
+RETRY_AFTER = 30
+
+_state = contextvars.ContextVar('routing_state', default=None)
+
+
+class RoutingState:
+    def __init__(self, pinned=False):
+        self.replica_reads = False
+        self.replica = None
+        self.pinned = pinned
+        self.wrote = False
+
+
+class ReplicaPool:
+    """Round-robin over replica aliases, skipping ones that failed a health check"""
+
+    def __init__(self, aliases):
+        self.aliases = tuple(aliases)
+        self._cycle = itertools.cycle(self.aliases)
+        self._checked = {}
+        self._down_until = {}
+        self._lock = threading.Lock()
+
+    def probe(self, alias):
+        try:
+            connection = connections[alias]
+            connection.ensure_connection()
+            return connection.is_usable()
+        except Exception:
+            logger.warning('Replica %s failed its health check', alias, exc_info=True)
+            return False
+
+    def check(self, alias):
+        """Whether a replica accepts connections; failures keep it out for RETRY_AFTER seconds"""
+        healthy = self.probe(alias)
+        now = time.monotonic()
+        with self._lock:
+            self._checked[alias] = now
+            if healthy:
+                self._down_until.pop(alias, None)
+            else:
+                self._down_until[alias] = now + RETRY_AFTER
+        return healthy
+
+    def _due(self, alias, now):
+        with self._lock:
+            if self._down_until.get(alias, 0) > now:
+                return None
+            return now - self._checked.get(alias, float('-inf')) >= HEALTH_CHECK_INTERVAL
+
+    def choose(self):
+        """The next healthy replica, or None when none is"""
+        for _ in range(len(self.aliases)):
+            with self._lock:
+                alias = next(self._cycle)
+            due = self._due(alias, time.monotonic())
+            if due is None:
+                continue
+            if not due or self.check(alias):
+                return alias
+        return None
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def replica_pool():
+    aliases = tuple(getattr(settings, 'DATABASE_REPLICAS', ()))
+    with _pools_lock:
+        if aliases not in _pools:
+            _pools[aliases] = ReplicaPool(aliases)
+        return _pools[aliases]
+
+
+def read_alias():
+    """Where reads of the current request go right now"""
+    state = _state.get()
+    if state is None or not state.replica_reads or state.pinned:
+        return DEFAULT_DB_ALIAS
+    if state.replica is None:
+        # One replica per request, so its reads see a single point in time
+        pool = replica_pool()
+        state.replica = (pool.aliases and pool.choose()) or DEFAULT_DB_ALIAS
+    return state.replica
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # A session written by the previous request may not have replicated yet
+        if model._meta.label == 'sessions.Session':
+            return DEFAULT_DB_ALIAS
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        # Session writes happen on most requests and sessions are read from the primary
+        if state is not None and model._meta.label != 'sessions.Session':
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+
+def replica_reads(view_func):
+    """Let a read-only view send its reads to a replica"""
+    if iscoroutinefunction(view_func):
+        @functools.wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            state, token, previous = _allow_replica_reads(request)
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                _restore(state, token, previous)
+    else:
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            state, token, previous = _allow_replica_reads(request)
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                _restore(state, token, previous)
+    return wrapper
+
+
+def _allow_replica_reads(request):
+    state = _state.get()
+    token = None
+    if state is None:
+        # Called without the middleware (tests, scripts)
+        state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+    previous = state.replica_reads
+    state.replica_reads = True
+    return state, token, previous
+
+
+def _restore(state, token, previous):
+    state.replica_reads = previous
+    if token is not None:
+        _state.reset(token)
+
+
+class ReplicaRoutingMiddleware:
+    """Track writes per request and pin clients that just wrote to the primary"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(state, response)
+
+    async def __acall__(self, request):
+        state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(state, response)
+
+    def _finish(self, state, response):
+        if state.wrote and getattr(settings, 'DATABASE_REPLICAS', ()):
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5), httponly=True, samesite='Lax'
+            )
+        return response
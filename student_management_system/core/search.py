@@ -0,0 +1,377 @@
+# Student, teacher and course search
+#
+# Every student, teacher and course has one row in the core_search table:
+# a display label and detail plus a lowercased "terms" string holding the
+# names, ids, email and codes it can be found by. The table is indexed for
+# substring and similarity matching with what the database offers:
+#
+#   SQLite      an FTS5 virtual table with the trigram tokenizer
+#   PostgreSQL  a plain table with a pg_trgm GIN index on terms
+#
+# search() looks for rows containing every query word (prefixes and
+# substrings) and ranks them, prefixes first. Only when nothing contains the
+# query does it look for rows sharing the most trigrams with it, which is
+# what makes typos match. Words shorter than a trigram cannot use the index
+# and are ignored. Other databases fall back to icontains queries on the
+# models.
+#
+# Signal handlers keep the rows in step with User, Student, TeacherProfile
+# and Course inside the same transaction; rebuild() repopulates everything
+# (see the rebuild_search_index command). The table is created by migration
+# 0008_search_index.
+
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Course, Department, Student, TeacherProfile, User
+
+TABLE = 'core_search'
+KINDS = ('student', 'teacher', 'course')
+MIN_WORD_LENGTH = 3
+DEFAULT_LIMIT = 10
+SIMILARITY_THRESHOLD = 0.3
+# Rows containing the query that are ranked in Python; a query common
+# enough to match more ranks the best of them by the database's own rank
+CANDIDATES = 200
+BATCH_SIZE = 2000
+
+_KIND_CODES = {kind: code for code, kind in enumerate(KINDS, start=1)}
+
+
+def _row_id(kind, object_id):
+    # One integer key per document so updates and deletes hit the primary key
+    return object_id * 8 + _KIND_CODES[kind]
+
+
+def normalize(text):
+    return ' '.join(str(text or '').lower().split())
+
+
+def words(query):
+    """The query words long enough to use the trigram index"""
+    return [word for word in re.findall(r'[^\s"]+', normalize(query)) if len(word) >= MIN_WORD_LENGTH]
+
+
+def _trigrams(query_words):
+    grams = []
+    for word in query_words:
+        for start in range(len(word) - 2):
+            gram = word[start:start + 3]
+            if gram not in grams:
+                grams.append(gram)
+    return grams
+
+
+def word_similarity(query_words, terms):
+    """Mean over the query words of their best trigram Jaccard similarity with a word of terms"""
+    term_grams = [set(_trigrams([word])) for word in terms.split() if len(word) >= MIN_WORD_LENGTH]
+    if not term_grams:
+        return 0.0
+    total = 0.0
+    for word in query_words:
+        grams = set(_trigrams([word]))
+        total += max(len(grams & other) / len(grams | other) for other in term_grams)
+    return total / len(query_words)
+
+
+# Documents
+
+def _person(kind, profile_id, code, user):
+    full_name = f'{user.first_name} {user.last_name}'.strip()
+    return (
+        _row_id(kind, profile_id), kind, profile_id,
+        full_name or user.username, code,
+        normalize(f'{full_name} {code} {user.email} {user.username}'),
+    )
+
+
+def _student_documents(queryset):
+    for student in queryset.select_related('user').iterator(chunk_size=BATCH_SIZE):
+        yield _person('student', student.pk, student.student_id, student.user)
+
+
+def _teacher_documents(queryset):
+    for teacher in queryset.select_related('user').iterator(chunk_size=BATCH_SIZE):
+        yield _person('teacher', teacher.pk, teacher.employee_id, teacher.user)
+
+
+def _course_documents(queryset):
+    for course in queryset.select_related('department').iterator(chunk_size=BATCH_SIZE):
+        yield (
+            _row_id('course', course.pk), 'course', course.pk,
+            course.name, course.code,
+            normalize(f'{course.code} {course.name} {course.department.code}'),
+        )
+
+
+# Backends
+
+class SQLiteBackend:
+    """FTS5 with the trigram tokenizer (SQLite 3.34+)"""
+
+    # Trigrams in more rows than this are too common to find typo candidates by
+    COMMON_TRIGRAM_ROWS = 2000
+
+    def upsert(self, cursor, rows):
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, kind, object_id, label, detail, terms) VALUES (%s, %s, %s, %s, %s, %s)',
+            rows,
+        )
+
+    def delete(self, cursor, row_ids):
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(row_id,) for row_id in row_ids])
+
+    def clear(self, cursor):
+        cursor.execute(f'DELETE FROM {TABLE}')
+
+    def _match(self, terms, kinds):
+        # Kinds are matched in the index too, so a narrow kind filter does not scan
+        match = f'terms : ({terms})'
+        if set(kinds) != set(KINDS):
+            match += ' AND kind : (' + ' OR '.join(f'"{kind}"' for kind in kinds) + ')'
+        return match
+
+    def matching(self, cursor, query_words, kinds, limit):
+        # Best matches first, so the ones _rank() prefers are not cut by the LIMIT
+        cursor.execute(
+            f'SELECT kind, object_id, label, detail, terms FROM {TABLE} WHERE {TABLE} MATCH %s ORDER BY rank LIMIT %s',
+            [self._match(' AND '.join(f'"{word}"' for word in query_words), kinds), limit],
+        )
+        return cursor.fetchall()
+
+    def similar(self, cursor, query_words, kinds, limit):
+        # Candidates share one of the query's less common trigrams; how similar
+        # they are is scored in Python the way word_similarity() is on Postgres
+        grams = []
+        for gram in _trigrams(query_words):
+            cursor.execute(
+                f'SELECT count(*) FROM (SELECT 1 FROM {TABLE} WHERE {TABLE} MATCH %s LIMIT %s)',
+                [f'terms : "{gram}"', self.COMMON_TRIGRAM_ROWS + 1],
+            )
+            if 0 < cursor.fetchone()[0] <= self.COMMON_TRIGRAM_ROWS:
+                grams.append(gram)
+        if not grams:
+            return []
+        cursor.execute(
+            f'SELECT kind, object_id, label, detail, terms FROM {TABLE} WHERE {TABLE} MATCH %s '
+            f'ORDER BY rank LIMIT %s',
+            [self._match(' OR '.join(f'"{gram}"' for gram in grams), kinds), CANDIDATES],
+        )
+        scored = [(word_similarity(query_words, row[4]), tuple(row[:4])) for row in cursor.fetchall()]
+        scored = [(score, row) for score, row in scored if score >= SIMILARITY_THRESHOLD]
+        scored.sort(key=lambda pair: -pair[0])
+        return [row for _, row in scored[:limit]]
+
+
+def _like_escape(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class PostgresBackend:
+    """A pg_trgm GIN index over a plain table"""
+
+    def upsert(self, cursor, rows):
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (id, kind, object_id, label, detail, terms) VALUES (%s, %s, %s, %s, %s, %s) '
+            f'ON CONFLICT (id) DO UPDATE SET label = EXCLUDED.label, detail = EXCLUDED.detail, terms = EXCLUDED.terms',
+            rows,
+        )
+
+    def delete(self, cursor, row_ids):
+        cursor.execute(f'DELETE FROM {TABLE} WHERE id = ANY(%s)', [list(row_ids)])
+
+    def clear(self, cursor):
+        cursor.execute(f'TRUNCATE {TABLE}')
+
+    def matching(self, cursor, query_words, kinds, limit):
+        conditions = ' AND '.join(['terms LIKE %s'] * len(query_words))
+        # Best matches first, so the ones _rank() prefers are not cut by the LIMIT
+        cursor.execute(
+            f'SELECT kind, object_id, label, detail, terms FROM {TABLE} '
+            f'WHERE {conditions} AND kind = ANY(%s) ORDER BY word_similarity(%s, terms) DESC, id LIMIT %s',
+            [*[f'%{_like_escape(word)}%' for word in query_words], list(kinds), ' '.join(query_words), limit],
+        )
+        return cursor.fetchall()
+
+    def similar(self, cursor, query_words, kinds, limit):
+        query = ' '.join(query_words)
+        with transaction.atomic():
+            cursor.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)", [
+                str(SIMILARITY_THRESHOLD)
+            ])
+            cursor.execute(
+                f'SELECT kind, object_id, label, detail FROM {TABLE} '
+                f'WHERE %s <%% terms AND kind = ANY(%s) '
+                f'ORDER BY word_similarity(%s, terms) DESC, id LIMIT %s',
+                [query, list(kinds), query, limit],
+            )
+            return cursor.fetchall()
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend,
+    'postgresql': PostgresBackend,
+}
+
+
+def backend():
+    """The index backend for the default database, or None to fall back to the ORM"""
+    backend_class = BACKENDS.get(connection.vendor)
+    return backend_class() if backend_class else None
+
+
+# Index maintenance
+
+def _write(rows):
+    index = backend()
+    if index is None or not rows:
+        return
+    with connection.cursor() as cursor:
+        index.upsert(cursor, rows)
+
+
+def _remove(kind, object_ids):
+    index = backend()
+    if index is None:
+        return
+    with connection.cursor() as cursor:
+        index.delete(cursor, [_row_id(kind, object_id) for object_id in object_ids])
+
+
+@transaction.atomic
+def rebuild():
+    """Repopulate the whole index from the models; returns the number of rows"""
+    index = backend()
+    if index is None:
+        return 0
+    count = 0
+    with connection.cursor() as cursor:
+        index.clear(cursor)
+        for documents in (
+            _student_documents(Student.objects.order_by('pk')),
+            _teacher_documents(TeacherProfile.objects.order_by('pk')),
+            _course_documents(Course.objects.order_by('pk')),
+        ):
+            batch = []
+            for row in documents:
+                batch.append(row)
+                if len(batch) >= BATCH_SIZE:
+                    index.upsert(cursor, batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                index.upsert(cursor, batch)
+                count += len(batch)
+    return count
+
+
+def reindex(kind, object_ids):
+    """Refresh the rows of some objects of one kind, e.g. after a bulk_create skipped the signals"""
+    documents, model = {
+        'student': (_student_documents, Student),
+        'teacher': (_teacher_documents, TeacherProfile),
+        'course': (_course_documents, Course),
+    }[kind]
+    object_ids = list(object_ids)
+    for start in range(0, len(object_ids), BATCH_SIZE):
+        _write(list(documents(model.objects.filter(pk__in=object_ids[start:start + BATCH_SIZE]))))
+
+
+# Queries
+
+def _fallback(query_words, kinds, limit):
+    def matches(*fields):
+        condition = Q()
+        for word in query_words:
+            condition &= Q(*[Q(**{f'{field}__icontains': word}) for field in fields], _connector=Q.OR)
+        return condition
+
+    people = ('user__first_name', 'user__last_name', 'user__email', 'user__username')
+    rows = []
+    if 'student' in kinds:
+        rows += [row for row in _student_documents(Student.objects.filter(matches('student_id', *people))[:limit])]
+    if 'teacher' in kinds:
+        rows += [row for row in _teacher_documents(TeacherProfile.objects.filter(matches('employee_id', *people))[:limit])]
+    if 'course' in kinds:
+        rows += [row for row in _course_documents(Course.objects.filter(matches('code', 'name'))[:limit])]
+    return [row[1:5] for row in rows[:limit]]
+
+
+def _rank(query_words, rows, limit):
+    """Order matches by how many query words start a word of theirs, then by brevity"""
+    def key(row):
+        padded = f' {row[4]}'
+        return -sum(f' {word}' in padded for word in query_words), len(row[4])
+
+    return [tuple(row[:4]) for row in sorted(rows, key=key)[:limit]]
+
+
+def search(query, kinds=KINDS, limit=DEFAULT_LIMIT):
+    """Ranked (kind, object_id, label, detail) rows matching a typeahead query"""
+    query_words = words(query)
+    kinds = [kind for kind in kinds if kind in _KIND_CODES]
+    if not query_words or not kinds:
+        return []
+    index = backend()
+    if index is None:
+        return _fallback(query_words, kinds, limit)
+    with connection.cursor() as cursor:
+        rows = _rank(query_words, index.matching(cursor, query_words, kinds, CANDIDATES), limit)
+        if not rows:
+            rows = [tuple(row) for row in index.similar(cursor, query_words, kinds, limit)]
+    return rows
+
+
+def search_ids(kind, query, limit=200):
+    """Primary keys of one kind of object matching a query, best first"""
+    return [object_id for _, object_id, _, _ in search(query, [kind], limit)]
+
+
+# Signal handlers keeping the index in step
+
+@receiver(post_save, sender=Student)
+def index_student(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _write(list(_student_documents(Student.objects.filter(pk=instance.pk))))
+
+
+@receiver(post_save, sender=TeacherProfile)
+def index_teacher(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _write(list(_teacher_documents(TeacherProfile.objects.filter(pk=instance.pk))))
+
+
+@receiver(post_save, sender=Course)
+def index_course(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _write(list(_course_documents(Course.objects.filter(pk=instance.pk))))
+
+
+@receiver(post_save, sender=Department)
+def index_department_courses(sender, instance, created, raw=False, **kwargs):
+    # Course terms include the department code
+    if not created and not raw:
+        reindex('course', Course.objects.filter(department=instance).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=User)
+def index_user_profile(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # New users are indexed when create_user_profile saves their profile, and
+    # logins only touch last_login, which is not indexed
+    if not created and not raw and set(update_fields or ()) != {'last_login'}:
+        _write(
+            list(_student_documents(Student.objects.filter(user=instance)))
+            + list(_teacher_documents(TeacherProfile.objects.filter(user=instance)))
+        )
+
+
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=TeacherProfile)
+@receiver(post_delete, sender=Course)
+def unindex(sender, instance, **kwargs):
+    _remove({Student: 'student', TeacherProfile: 'teacher', Course: 'course'}[sender], [instance.pk])
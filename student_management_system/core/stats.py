@@ -0,0 +1,171 @@
+# Materialized admin dashboard statistics
+#
+# Each statistic lives under its own cache key so the dashboard can fetch all
+# of them with a single get_many(). Counters are adjusted in place by signal
+# handlers once the surrounding transaction commits; the "recent" lists are
+# simply dropped and rebuilt on the next read. reconcile() recomputes
+# everything from the database and is meant to run periodically
+# (see the reconcile_dashboard_stats command).
+
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import fanout
+from .models import Announcement, Course, Department, Enrollment, User
+
+KEY_PREFIX = 'dashboard_stats:'
+RECENT_LIMIT = 5
+
+COUNTERS = {
+    'total_students': lambda: User.objects.filter(role=User.STUDENT).count(),
+    'total_teachers': lambda: User.objects.filter(role=User.TEACHER).count(),
+    'total_courses': lambda: Course.objects.count(),
+    'total_departments': lambda: Department.objects.count(),
+}
+
+LISTS = {
+    'recent_enrollments': lambda: list(
+        Enrollment.objects.select_related('student__user', 'course').order_by('-enrolled_date')[:RECENT_LIMIT]
+    ),
+    'recent_announcements': lambda: list(Announcement.objects.order_by('-created_at')[:RECENT_LIMIT]),
+}
+
+BUILDERS = {**COUNTERS, **LISTS}
+
+ROLE_COUNTERS = {
+    User.STUDENT: 'total_students',
+    User.TEACHER: 'total_teachers',
+}
+
+_lock = threading.Lock()
+_info = {'hits': 0, 'misses': 0}
+
+
+def _key(name):
+    return KEY_PREFIX + name
+
+
+def _timeout():
+    return getattr(settings, 'DASHBOARD_STATS_TIMEOUT', None)
+
+
+def cache_info():
+    """Hit and miss counts for get_dashboard_stats() in this process"""
+    with _lock:
+        return dict(_info)
+
+
+def reset_cache_info():
+    with _lock:
+        _info.update(hits=0, misses=0)
+
+
+def _cached(found):
+    stats = {name: found[_key(name)] for name in BUILDERS if _key(name) in found}
+    missing = [name for name in BUILDERS if name not in stats]
+    with _lock:
+        _info['misses' if missing else 'hits'] += 1
+    return stats, missing
+
+
+def get_dashboard_stats():
+    """All admin dashboard statistics, from one cache read when warm"""
+    stats, missing = _cached(cache.get_many([_key(name) for name in BUILDERS]))
+    if missing:
+        rebuilt = {name: BUILDERS[name]() for name in missing}
+        cache.set_many({_key(name): value for name, value in rebuilt.items()}, _timeout())
+        stats.update(rebuilt)
+    return stats
+
+
+async def aget_dashboard_stats():
+    """get_dashboard_stats() for async views; missing statistics are rebuilt concurrently"""
+    stats, missing = _cached(await cache.aget_many([_key(name) for name in BUILDERS]))
+    if missing:
+        rebuilt = await fanout.gather(**{name: BUILDERS[name] for name in missing})
+        await cache.aset_many({_key(name): value for name, value in rebuilt.items()}, _timeout())
+        stats.update(rebuilt)
+    return stats
+
+
+def reconcile():
+    """Recompute every statistic from the database and overwrite the cache"""
+    stats = {name: build() for name, build in BUILDERS.items()}
+    cache.set_many({_key(name): value for name, value in stats.items()}, _timeout())
+    return stats
+
+
+def invalidate(*names):
+    cache.delete_many([_key(name) for name in (names or BUILDERS)])
+
+
+def _adjust(name, delta):
+    """Shift a counter once the current transaction commits; a missing key is rebuilt on read"""
+    def apply():
+        try:
+            cache.incr(_key(name), delta)
+        except ValueError:
+            pass
+    transaction.on_commit(apply)
+
+
+def _drop_on_commit(name):
+    transaction.on_commit(lambda: invalidate(name))
+
+
+# Signal handlers keeping the cached statistics current
+
+@receiver(pre_save, sender=User)
+def remember_previous_role(sender, instance, update_fields=None, **kwargs):
+    instance._stats_previous_role = None
+    if instance.pk and (update_fields is None or 'role' in update_fields):
+        instance._stats_previous_role = User.objects.filter(pk=instance.pk).values_list('role', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def count_user_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_stats_previous_role', None)
+    if not created and (previous is None or previous == instance.role):
+        return
+    if previous in ROLE_COUNTERS:
+        _adjust(ROLE_COUNTERS[previous], -1)
+    if instance.role in ROLE_COUNTERS:
+        _adjust(ROLE_COUNTERS[instance.role], 1)
+
+
+@receiver(post_delete, sender=User)
+def count_user_delete(sender, instance, **kwargs):
+    if instance.role in ROLE_COUNTERS:
+        _adjust(ROLE_COUNTERS[instance.role], -1)
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Department)
+def count_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        _adjust('total_courses' if sender is Course else 'total_departments', 1)
+
+
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Department)
+def count_deleted(sender, instance, **kwargs):
+    _adjust('total_courses' if sender is Course else 'total_departments', -1)
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def drop_recent_enrollments(sender, **kwargs):
+    _drop_on_commit('recent_enrollments')
+
+
+@receiver(post_save, sender=Announcement)
+@receiver(post_delete, sender=Announcement)
+def drop_recent_announcements(sender, **kwargs):
+    _drop_on_commit('recent_announcements')
@@ -0,0 +1,171 @@
+# Synthetic university generator
+#
+# Builds a parameterized dataset with bulk_create so production-scale load can
+# be reproduced on SQLite or Postgres. Generated users share one password
+# hash (DEFAULT_PASSWORD). Because bulk_create bypasses model signals, the
+# generator creates the role profiles itself and rebuilds the derived GPAs,
+# enrollment counters, search index and dashboard statistics at the end, and
+# retires the dashboard fragments of the global groups.
+
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import enrollment, fragments, gpa, search, stats
+from .models import (
+    Assignment, Attendance, Course, Department, Enrollment, Grade, Student, TeacherProfile, User,
+)
+
+DEFAULT_PASSWORD = 'password'
+BATCH_SIZE = 2000
+
+
+def _batched(objects, model, batch_size):
+    batch = []
+    created = 0
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            model.objects.bulk_create(batch)
+            created += len(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+        created += len(batch)
+    return created
+
+
+def generate_university(
+    departments=5,
+    courses=20,
+    teachers=20,
+    students=500,
+    enrollments_per_student=4,
+    assignments_per_course=5,
+    grades_per_enrollment=5,
+    attendance_per_enrollment=10,
+    prefix='syn',
+    seed=0,
+    batch_size=BATCH_SIZE,
+):
+    """Populate the database and return the number of rows created per model
+
+    courses and teachers are totals spread round-robin across departments.
+    Each enrollment gets up to grades_per_enrollment grades (one per
+    assignment) and attendance_per_enrollment consecutive class days.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    password = make_password(DEFAULT_PASSWORD)
+    code = prefix[:3].upper()
+    counts = {}
+
+    with transaction.atomic():
+        department_objs = Department.objects.bulk_create([
+            Department(name=f'{prefix} Department {i}', code=f'{code}{i:05d}') for i in range(departments)
+        ])
+        counts['departments'] = len(department_objs)
+
+        course_objs = Course.objects.bulk_create([
+            Course(
+                name=f'{prefix} Course {i}',
+                code=f'{code}-C{i:06d}',
+                department=department_objs[i % departments],
+                credits=rng.choice((2, 3, 3, 4)),
+            )
+            for i in range(courses)
+        ])
+        counts['courses'] = len(course_objs)
+
+        users = User.objects.bulk_create([
+            User(username=f'{prefix}_teacher_{i}', password=password, role=User.TEACHER,
+                 first_name='Teacher', last_name=str(i), email=f'{prefix}_teacher_{i}@example.edu')
+            for i in range(teachers)
+        ], batch_size=batch_size)
+        teacher_objs = TeacherProfile.objects.bulk_create([
+            TeacherProfile(user=user, employee_id=f'{code}E{i:07d}', department=department_objs[i % departments])
+            for i, user in enumerate(users)
+        ], batch_size=batch_size)
+        counts['teachers'] = len(teacher_objs)
+
+        teachers_by_department = {}
+        for teacher in teacher_objs:
+            teachers_by_department.setdefault(teacher.department_id, []).append(teacher)
+        course_teacher = {
+            course.pk: rng.choice(teachers_by_department.get(course.department_id) or teacher_objs)
+            for course in course_objs
+        }
+
+        assignment_objs = Assignment.objects.bulk_create([
+            Assignment(
+                course=course,
+                teacher=course_teacher[course.pk],
+                title=f'{course.code} #{n + 1}',
+                assignment_type=rng.choice(Assignment.ASSIGNMENT_TYPES)[0],
+                max_marks=rng.choice((10, 20, 50, 100)),
+                due_date=now - timedelta(days=rng.randint(0, 120)),
+            )
+            for course in course_objs
+            for n in range(assignments_per_course)
+        ], batch_size=batch_size)
+        counts['assignments'] = len(assignment_objs)
+        assignments_by_course = {}
+        for assignment in assignment_objs:
+            assignments_by_course.setdefault(assignment.course_id, []).append(assignment)
+
+        users = User.objects.bulk_create([
+            User(username=f'{prefix}_student_{i}', password=password, role=User.STUDENT,
+                 first_name='Student', last_name=str(i), email=f'{prefix}_student_{i}@example.edu')
+            for i in range(students)
+        ], batch_size=batch_size)
+        student_objs = Student.objects.bulk_create([
+            Student(user=user, student_id=f'{code}S{i:07d}', department=department_objs[i % departments])
+            for i, user in enumerate(users)
+        ], batch_size=batch_size)
+        counts['students'] = len(student_objs)
+
+        per_student = min(enrollments_per_student, len(course_objs))
+        picks = [(student, rng.sample(course_objs, per_student)) for student in student_objs]
+        counts['enrollments'] = _batched((
+            Enrollment(student=student, course=course, teacher=course_teacher[course.pk])
+            for student, chosen in picks
+            for course in chosen
+        ), Enrollment, batch_size)
+
+        counts['grades'] = _batched((
+            Grade(
+                student=student,
+                assignment=assignment,
+                marks_obtained=Decimal(rng.randint(assignment.max_marks * 4, assignment.max_marks * 10)) / 10,
+                graded_by=assignment.teacher,
+            )
+            for student, chosen in picks
+            for course in chosen
+            for assignment in assignments_by_course.get(course.pk, [])[:grades_per_enrollment]
+        ), Grade, batch_size)
+
+        start = now.date() - timedelta(days=attendance_per_enrollment)
+        counts['attendance'] = _batched((
+            Attendance(
+                student=student,
+                course=course,
+                date=start + timedelta(days=day),
+                is_present=rng.random() < 0.85,
+                marked_by=course_teacher[course.pk],
+            )
+            for student, chosen in picks
+            for course in chosen
+            for day in range(attendance_per_enrollment)
+        ), Attendance, batch_size)
+
+    gpa.rebuild_gpas()
+    enrollment.recount()
+    search.rebuild()
+    stats.reconcile()
+    fragments.bump('courses')
+    fragments.bump('enrollment_activity')
+    return counts
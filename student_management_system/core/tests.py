@@ -1,70 +1,2206 @@
-from django.test import TestCase
-from django.urls import reverse
-from .models import Students, Administrators
+import asyncio
+import csv
+import json
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, OperationalError, connection, connections, transaction
+from django.db.models import QuerySet
+from django.http import Http404, HttpResponse
+from django.template import engines
+from django.template.base import Template as DjangoTemplate
+from django.template.loader import get_template, render_to_string
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+from . import admin as core_admin
+from . import (
+    analytics, archive, attendance, audience, benchmark, enrollment, exports, fanout, fragments, gpa, gradebook, identity,
+    notifications, pagination, prerequisites, profiling, provisioning, queryplans, rankings, routing, search, stats,
+    synthetic, timetable, views,
+)
+from .models import (
+    Announcement, Assignment, Attendance, AttendanceArchive, ClassRank, Course, CourseGradeTotal, CoursePrerequisite,
+    Department, Enrollment, Grade, GradeArchive, MeetingSlot, Notification, RankingRefresh, Student, TeacherProfile, Term,
+    User,
+)
 
 class CoreViewsTests(TestCase):
 
     def setUp(self):
-        self.admin = Administrators.objects.create(
-            first_name='Admin',
-            last_name='User',
-            email='admin@example.com',
-            password_hash='hashed_password'
+        self.admin = User.objects.create_user(username='admin', password='pass', role=User.ADMIN)
+        self.teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER)
+        self.student = User.objects.create_user(username='student', password='pass', role=User.STUDENT)
+
+    def test_profiles_are_created_for_roles(self):
+        self.assertEqual(self.student.student.student_id, f'STU_{self.student.id:06d}')
+        self.assertEqual(self.teacher.teacherprofile.employee_id, f'EMP_{self.teacher.id:06d}')
+        self.assertFalse(Student.objects.filter(user=self.admin).exists())
+        self.assertFalse(TeacherProfile.objects.filter(user=self.admin).exists())
+
+    def test_role_checks(self):
+        self.assertTrue(views.is_admin(self.admin))
+        self.assertTrue(views.is_teacher(self.teacher))
+        self.assertTrue(views.is_student(self.student))
+        self.assertFalse(views.is_admin(self.student))
+        self.assertFalse(views.is_student(AnonymousUser()))
+
+
+class GPAEngineTests(TestCase):
+
+    def setUp(self):
+        self.department = Department.objects.create(name='Computer Science', code='CS')
+        self.teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        self.student = User.objects.create_user(username='student', password='pass', role=User.STUDENT).student
+        self.algorithms = Course.objects.create(name='Algorithms', code='CS201', department=self.department, credits=4)
+        self.databases = Course.objects.create(name='Databases', code='CS301', department=self.department, credits=2)
+        self.midterm = self.make_assignment(self.algorithms, 50)
+        self.final = self.make_assignment(self.algorithms, 100)
+        self.project = self.make_assignment(self.databases, 20)
+
+    def make_assignment(self, course, max_marks):
+        return Assignment.objects.create(
+            course=course, teacher=self.teacher, title=f'{course.code} {max_marks}',
+            assignment_type='quiz', max_marks=max_marks, due_date=timezone.now(),
+        )
+
+    def grade(self, assignment, marks):
+        return Grade.objects.create(
+            student=self.student, assignment=assignment, marks_obtained=Decimal(marks), graded_by=self.teacher
+        )
+
+    def stored_gpa(self):
+        return Student.objects.get(pk=self.student.pk).gpa
+
+    def test_gpa_weights_by_max_marks_and_credits(self):
+        self.grade(self.midterm, 40)      # 40/50
+        self.grade(self.final, 80)        # 120/150 = 80% of Algorithms
+        self.grade(self.project, 10)      # 50% of Databases
+        # (3.20 * 4 + 2.00 * 2) / 6
+        self.assertEqual(self.stored_gpa(), Decimal('2.80'))
+
+    def test_grade_update_and_delete_adjust_totals(self):
+        grade = self.grade(self.midterm, 25)
+        self.assertEqual(self.stored_gpa(), Decimal('2.00'))
+        grade.marks_obtained = Decimal('50')
+        grade.save()
+        self.assertEqual(self.stored_gpa(), Decimal('4.00'))
+        grade.delete()
+        self.assertEqual(self.stored_gpa(), Decimal('0.00'))
+        self.assertFalse(CourseGradeTotal.objects.exists())
+
+    def test_max_marks_and_credit_changes_refresh_gpa(self):
+        self.grade(self.midterm, 40)
+        self.grade(self.project, 10)
+        self.midterm.max_marks = 40
+        self.midterm.save()
+        self.databases.credits = 4
+        self.databases.save()
+        self.assertEqual(self.stored_gpa(), gpa.compute_gpas([self.student.pk])[self.student.pk])
+
+    def test_rebuild_matches_from_scratch_recomputation(self):
+        self.grade(self.midterm, 33)
+        self.grade(self.final, 71.5)
+        self.grade(self.project, 17)
+        Student.objects.update(gpa=0)
+        CourseGradeTotal.objects.all().delete()
+        call_command('rebuild_gpas', stdout=StringIO())
+        call_command('rebuild_gpas', '--check', stdout=StringIO())
+        self.assertEqual(self.stored_gpa(), gpa.compute_gpas()[self.student.pk])
+
+    def test_check_reports_drift(self):
+        self.grade(self.midterm, 40)
+        Student.objects.update(gpa=Decimal('1.00'))
+        with self.assertRaises(CommandError):
+            call_command('rebuild_gpas', '--check', stdout=StringIO())
+
+    def test_student_dashboard_does_not_write(self):
+        self.grade(self.midterm, 40)
+        request = RequestFactory().get('/student-dashboard/')
+        request.user = self.student.user
+        with mock.patch('core.views.render', return_value=HttpResponse()) as render:
+            with CaptureQueriesContext(connection) as queries:
+                views.student_dashboard(request)
+        self.assertEqual(render.call_args[0][2]['gpa'], Decimal('3.20'))
+        self.assertFalse([q for q in queries if not q['sql'].lstrip().upper().startswith('SELECT')])
+
+
+class GradebookImportTests(TestCase):
+
+    def setUp(self):
+        department = Department.objects.create(name='Mathematics', code='MATH')
+        self.teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        other = User.objects.create_user(username='other', password='pass', role=User.TEACHER).teacherprofile
+        self.students = [
+            User.objects.create_user(username=f'student{i}', password='pass', role=User.STUDENT).student
+            for i in range(5)
+        ]
+        course = Course.objects.create(name='Calculus', code='MATH101', department=department)
+        self.quiz = Assignment.objects.create(
+            course=course, teacher=self.teacher, title='Quiz', assignment_type='quiz',
+            max_marks=20, due_date=timezone.now(),
         )
-        self.student = Students.objects.create(
-            first_name='Student',
-            last_name='User',
-            email='student@example.com',
-            password_hash='hashed_password',
-            date_of_birth='2000-01-01',
-            enrollment_year=2023
+        self.foreign = Assignment.objects.create(
+            course=course, teacher=other, title='Other quiz', assignment_type='quiz',
+            max_marks=20, due_date=timezone.now(),
         )
 
-    def test_home_page(self):
-        response = self.client.get(reverse('home'))
+    def rows(self, count, marks=15):
+        return [
+            {'student_id': s.student_id, 'assignment_id': self.quiz.pk, 'marks_obtained': marks}
+            for s in self.students[:count]
+        ]
+
+    def test_upserts_and_refreshes_gpa(self):
+        result = gradebook.import_grades(self.rows(5), self.teacher)
+        self.assertEqual(result, {'rows': 5, 'saved': 5, 'errors': []})
+        result = gradebook.import_grades(self.rows(2, marks=20), self.teacher)
+        self.assertEqual(result['saved'], 2)
+        self.assertEqual(Grade.objects.count(), 5)
+        self.assertEqual(Grade.objects.get(student=self.students[0]).marks_obtained, Decimal('20'))
+        self.assertEqual(Student.objects.get(pk=self.students[0].pk).gpa, Decimal('4.00'))
+        self.assertEqual(Student.objects.get(pk=self.students[4].pk).gpa, Decimal('3.00'))
+
+    def test_query_count_does_not_grow_with_rows(self):
+        with CaptureQueriesContext(connection) as few:
+            gradebook.import_grades(self.rows(1), self.teacher)
+        with CaptureQueriesContext(connection) as many:
+            gradebook.import_grades(self.rows(5), self.teacher)
+        self.assertEqual(len(few), len(many))
+
+    def test_reports_per_row_errors(self):
+        code = self.students[0].student_id
+        rows = [
+            {'student_id': code, 'assignment_id': self.quiz.pk, 'marks_obtained': '21'},
+            {'student_id': 'missing', 'assignment_id': self.quiz.pk, 'marks_obtained': '1'},
+            {'student_id': code, 'assignment_id': self.foreign.pk, 'marks_obtained': '1'},
+            {'student_id': code, 'assignment_id': 'x', 'marks_obtained': '1'},
+            {'student_id': code, 'assignment_id': self.quiz.pk, 'marks_obtained': 'abc'},
+            {'student_id': code, 'assignment_id': self.quiz.pk, 'marks_obtained': '10'},
+            {'student_id': code, 'assignment_id': self.quiz.pk, 'marks_obtained': '11'},
+        ]
+        result = gradebook.import_grades(rows, self.teacher)
+        self.assertEqual(result['saved'], 1)
+        self.assertEqual([error['row'] for error in result['errors']], [1, 2, 3, 4, 5, 7])
+        self.assertEqual(Grade.objects.get().marks_obtained, Decimal('10'))
+
+    def test_json_endpoint(self):
+        request = RequestFactory().post(
+            '/grade-management/bulk/', data=json.dumps({'grades': self.rows(3)}), content_type='application/json'
+        )
+        request.user = self.teacher.user
+        response = views.grade_bulk_upload(request)
         self.assertEqual(response.status_code, 200)
-        self.assertTemplateUsed(response, 'core/home.html')
+        self.assertEqual(json.loads(response.content)['saved'], 3)
 
-    def test_admin_login(self):
-        response = self.client.post(reverse('login'), {
-            'email': 'admin@example.com',
-            'password': 'hashed_password'
-        })
-        self.assertEqual(response.status_code, 302)  # Redirect after login
-        self.assertRedirects(response, reverse('admin_dashboard'))
+    def test_csv_upload(self):
+        lines = ['student_id,assignment_id,marks_obtained,feedback']
+        lines += [f'{s.student_id},{self.quiz.pk},12.5,ok' for s in self.students]
+        upload = SimpleUploadedFile('midterm.csv', '\n'.join(lines).encode())
+        request = RequestFactory().post('/grade-management/import/', {'file': upload})
+        request.user = self.teacher.user
+        response = views.grade_import(request)
+        self.assertEqual(json.loads(response.content), {'rows': 5, 'saved': 5, 'errors': []})
+        self.assertEqual(set(Grade.objects.values_list('feedback', flat=True)), {'ok'})
 
-    def test_student_login(self):
-        response = self.client.post(reverse('login'), {
-            'email': 'student@example.com',
-            'password': 'hashed_password'
-        })
-        self.assertEqual(response.status_code, 302)  # Redirect after login
-        self.assertRedirects(response, reverse('student_dashboard'))
-
-    def test_admin_registration(self):
-        response = self.client.post(reverse('register'), {
-            'first_name': 'New',
-            'last_name': 'Admin',
-            'email': 'newadmin@example.com',
-            'password': 'new_hashed_password'
+
+class DashboardStatsCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        stats.reset_cache_info()
+        self.department = Department.objects.create(name='Physics', code='PHY')
+        User.objects.create_user(username='student', password='pass', role=User.STUDENT)
+
+    def test_warm_read_hits_cache_without_queries(self):
+        stats.get_dashboard_stats()
+        with self.assertNumQueries(0):
+            result = stats.get_dashboard_stats()
+        self.assertEqual(result['total_students'], 1)
+        self.assertEqual(stats.cache_info(), {'hits': 1, 'misses': 1})
+
+    def test_counters_follow_writes(self):
+        stats.get_dashboard_stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER)
+            User.objects.create_user(username='student2', password='pass', role=User.STUDENT)
+            Course.objects.create(name='Optics', code='PHY210', department=self.department)
+            Department.objects.create(name='Chemistry', code='CHEM')
+        with self.captureOnCommitCallbacks(execute=True):
+            teacher.role = User.STUDENT
+            teacher.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.department.delete()
+        with self.assertNumQueries(0):
+            cached = stats.get_dashboard_stats()
+        fresh = {name: build() for name, build in stats.COUNTERS.items()}
+        self.assertEqual({name: cached[name] for name in stats.COUNTERS}, fresh)
+        self.assertEqual(fresh, {'total_students': 3, 'total_teachers': 0, 'total_courses': 0, 'total_departments': 1})
+
+    def test_enrollment_drops_recent_list(self):
+        self.assertEqual(stats.get_dashboard_stats()['recent_enrollments'], [])
+        course = Course.objects.create(name='Mechanics', code='PHY101', department=self.department)
+        teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        with self.captureOnCommitCallbacks(execute=True):
+            enrollment = Enrollment.objects.create(student=Student.objects.get(), course=course, teacher=teacher)
+        self.assertEqual(stats.get_dashboard_stats()['recent_enrollments'], [enrollment])
+        self.assertEqual(stats.cache_info()['misses'], 2)
+
+    def test_reconcile_command_repairs_drift(self):
+        stats.get_dashboard_stats()
+        cache.set(stats.KEY_PREFIX + 'total_students', 42)
+        call_command('reconcile_dashboard_stats', stdout=StringIO())
+        self.assertEqual(stats.get_dashboard_stats()['total_students'], 1)
+
+
+def render_evaluating_context(request, template_name, context):
+    """Stand-in for render() that evaluates the context like a template would"""
+    for value in context.values():
+        if isinstance(value, (QuerySet, list)):
+            for obj in value:
+                str(obj)
+                if isinstance(obj, Grade):
+                    str(obj.assignment)
+    return HttpResponse()
+
+
+class ProfilingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        profiling.reset()
+        department = Department.objects.create(name='Biology', code='BIO')
+        self.teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        self.student = User.objects.create_user(username='student', password='pass', role=User.STUDENT).student
+        for number in range(3):
+            course = Course.objects.create(name=f'Biology {number}', code=f'BIO{number}', department=department)
+            Enrollment.objects.create(student=self.student, course=course, teacher=self.teacher)
+            assignment = Assignment.objects.create(
+                course=course, teacher=self.teacher, title='Lab', assignment_type='assignment',
+                max_marks=10, due_date=timezone.now(),
+            )
+            Grade.objects.create(student=self.student, assignment=assignment, marks_obtained=7, graded_by=self.teacher)
+
+    def call(self, view, user):
+        request = RequestFactory().get('/')
+        request.user = user
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = profiling.ProfilingMiddleware(get_response)
+        return middleware(request)
+
+    def test_reports_server_timing_and_rolling_metrics(self):
+        response = self.call(views.profiling_metrics, User.objects.create_user(username='admin', role=User.ADMIN))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+        metrics = profiling.snapshot()['profiling_metrics']
+        self.assertEqual(metrics['requests'], 1)
+        self.assertEqual(sum(metrics['histogram'].values()), 1)
+
+    def test_times_rendering_through_the_template_backend(self):
+        template = engines['django'].from_string('{% for n in numbers %}{{ n }}{% endfor %}')
+
+        def page(request):
+            return HttpResponse(template.render({'numbers': range(1000)}, request))
+
+        response = self.call(page, self.student.user)
+        self.assertIsInstance(template, profiling.TimedTemplate)
+        self.assertIsInstance(get_template('auth/login.html'), profiling.TimedTemplate)
+        # Nothing global is patched
+        self.assertEqual(DjangoTemplate.render.__module__, 'django.template.base')
+        self.assertGreater(float(response['Server-Timing'].split('tpl;dur=')[1].split(',')[0]), 0)
+        self.assertGreater(profiling.snapshot()['page']['template_ms_mean'], 0)
+
+    @override_settings(QUERY_BUDGET_ENFORCE=True)
+    def test_exceeding_budget_raises(self):
+        @profiling.query_budget(1)
+        def chatty(request):
+            list(Course.objects.all())
+            list(Department.objects.all())
+            return HttpResponse()
+
+        with self.assertRaises(profiling.QueryBudgetExceeded):
+            self.call(chatty, self.student.user)
+
+    @override_settings(QUERY_BUDGET_ENFORCE=True)
+    def test_dashboards_stay_within_budget(self):
+        with mock.patch('core.views.render', side_effect=render_evaluating_context):
+            self.call(views.student_dashboard, self.student.user)
+            self.call(views.teacher_dashboard, self.teacher.user)
+        metrics = profiling.snapshot()
+        self.assertEqual(metrics['teacher_dashboard']['over_budget'], 0)
+        self.assertLessEqual(metrics['student_dashboard']['queries']['max'], views.student_dashboard.query_budget)
+
+
+    @override_settings(ROOT_URLCONF='core.benchmark', QUERY_BUDGET_ENFORCE=True)
+    def test_budgets_leave_out_the_middleware_around_the_view(self):
+        self.client.force_login(self.student.user)
+        with mock.patch('core.views.render', side_effect=render_evaluating_context):
+            # The first visit stores the audience, so the session is saved on the way out
+            self.assertEqual(self.client.get('/wsgi/student_dashboard/').status_code, 200)
+        metrics = profiling.snapshot()['student_dashboard']
+        self.assertEqual(metrics['over_budget'], 0)
+        self.assertGreater(metrics['queries']['max'], views.student_dashboard.query_budget)
+        # The session's savepoint, UPDATE and release
+        self.assertEqual(metrics['queries']['max'], metrics['queries']['view_max'] + 3)
+
+
+    @override_settings(
+        ROOT_URLCONF='core.benchmark',
+        SESSION_ENGINE='django.contrib.sessions.backends.db',
+        AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.ModelBackend'],
+    )
+    def test_budgets_allow_for_the_configured_session_engine(self):
+        self.assertEqual(profiling.identity_allowance(), 3)
+        with mock.patch('core.views.render', side_effect=render_evaluating_context), \
+                override_settings(QUERY_BUDGET_ENFORCE=True):
+            for user, url in ((self.student.user, '/wsgi/student_dashboard/'), (self.teacher.user, '/wsgi/teacher_dashboard/')):
+                self.client.force_login(user)
+                self.assertEqual(self.client.get(url).status_code, 200)
+        for name in ('student_dashboard', 'teacher_dashboard'):
+            metrics = profiling.snapshot()[name]
+            self.assertEqual(metrics['query_budget'], getattr(views, name).query_budget + 3)
+            self.assertEqual(metrics['over_budget'], 0)
+
+class SyntheticDatasetTests(TestCase):
+
+    def test_generate_university_counts(self):
+        counts = synthetic.generate_university(
+            departments=2, courses=4, teachers=3, students=10, enrollments_per_student=2,
+            assignments_per_course=3, grades_per_enrollment=2, attendance_per_enrollment=5,
+        )
+        self.assertEqual(counts, {
+            'departments': 2, 'courses': 4, 'teachers': 3, 'assignments': 12,
+            'students': 10, 'enrollments': 20, 'grades': 40, 'attendance': 100,
         })
-        self.assertEqual(response.status_code, 302)  # Redirect after registration
-        self.assertTrue(Administrators.objects.filter(email='newadmin@example.com').exists())
-
-    def test_student_registration(self):
-        response = self.client.post(reverse('register'), {
-            'first_name': 'New',
-            'last_name': 'Student',
-            'email': 'newstudent@example.com',
-            'password': 'new_hashed_password',
-            'date_of_birth': '2001-01-01',
-            'enrollment_year': 2023
+        self.assertEqual(Grade.objects.count(), 40)
+        self.assertEqual(Attendance.objects.count(), 100)
+        self.assertEqual(stats.get_dashboard_stats()['total_students'], 10)
+        self.assertEqual(
+            dict(Student.objects.values_list('pk', 'gpa')), gpa.compute_gpas()
+        )
+        self.assertTrue(self.client.login(username='syn_student_0', password=synthetic.DEFAULT_PASSWORD))
+
+    def test_benchmark_writes_report(self):
+        synthetic.generate_university(departments=1, courses=2, teachers=1, students=3)
+        report = benchmark.run_benchmarks(repeat=2)
+        results = report['results']
+        self.assertEqual(results['view.student_dashboard']['repeat'], 2)
+        # Every view, found without a list to keep up to date
+        skipped = report['meta']['skipped_views']
+        timed = {name.removeprefix('view.') for name in results if name.startswith('view.')}
+        self.assertEqual(timed | set(skipped), set(benchmark.view_functions()))
+        self.assertIn('course_grade_report', timed)
+        self.assertIn('student_dashboard_async', timed)
+        self.assertIn('grade_import', skipped)
+        self.assertNotIn('logout_view', timed)
+        self.assertFalse([name for name in timed if 'error' in results[f'view.{name}']])
+        self.assertIn('queries', results['orm.course_gradebook'])
+        self.assertEqual(report['meta']['dataset']['courses'], 2)
+        json.dumps(report)
+        self.assertEqual(benchmark.compare(report, report)[0][3], 0)
+
+
+class AnnouncementFeedTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='pass', role=User.ADMIN)
+        self.student = User.objects.create_user(username='student', password='pass', role=User.STUDENT)
+        now = timezone.now()
+        for number in range(25):
+            Announcement.objects.create(title=f'Notice {number}', content='...', author=self.admin)
+        Announcement.objects.create(title='Expired', content='...', author=self.admin, expires_at=now)
+        Announcement.objects.create(title='Teachers', content='...', author=self.admin, target_audience='teachers')
+        Announcement.objects.create(title='Inactive', content='...', author=self.admin, is_active=False)
+        # Give half of them identical timestamps to exercise the id tie-breaker
+        Announcement.objects.filter(title__in=[f'Notice {n}' for n in range(10)]).update(created_at=now)
+        self.session = SessionStore()
+
+    def feed(self, **params):
+        request = RequestFactory().get('/announcements/feed/', params)
+        request.user = self.student
+        request.session = self.session
+        return views.announcements_feed(request)
+
+    def test_pages_through_every_visible_announcement_once(self):
+        self.feed()  # resolves and stores the audience in the session
+        seen = []
+        cursor = None
+        while True:
+            # The Last-Modified validator, then the page
+            with self.assertNumQueries(2):
+                response = self.feed(page_size=10, **({'cursor': cursor} if cursor else {}))
+            body = json.loads(response.content)
+            seen += [row['title'] for row in body['results']]
+            cursor = body['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(set(seen), {f'Notice {n}' for n in range(25)})
+
+    def test_rejects_bad_cursor(self):
+        self.assertEqual(self.feed(cursor='not-a-cursor').status_code, 400)
+
+    def test_cursor_round_trip(self):
+        created_at = timezone.now()
+        self.assertEqual(pagination.decode_cursor(pagination.encode_cursor(created_at, 42)), (created_at, 42))
+
+
+class AudienceResolverTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='admin', password='pass', role=User.ADMIN)
+        self.cs = Department.objects.create(name='Computer Science', code='CS')
+        self.math = Department.objects.create(name='Mathematics', code='MATH')
+        self.teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        self.student = User.objects.create_user(username='student', password='pass', role=User.STUDENT).student
+        self.student.department = self.cs
+        self.student.save()
+        self.compilers = Course.objects.create(name='Compilers', code='CS401', department=self.cs)
+        self.topology = Course.objects.create(name='Topology', code='MATH401', department=self.math)
+        Enrollment.objects.create(student=self.student, course=self.compilers, teacher=self.teacher)
+        self.announce('Everyone', 'all')
+        self.announce('Students', 'students')
+        self.announce('Teachers', 'teachers')
+        self.announce('CS', 'department', department=self.cs)
+        self.announce('Math', 'department', department=self.math)
+        self.announce('Compilers', 'course', course=self.compilers)
+        self.announce('Topology', 'course', course=self.topology)
+
+    def announce(self, title, target, **kwargs):
+        return Announcement.objects.create(title=title, content='...', author=self.admin, target_audience=target, **kwargs)
+
+    def request(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        request.session = SessionStore()
+        return request
+
+    def titles(self, request):
+        return set(audience.announcements_for(audience.get_audience(request)).values_list('title', flat=True))
+
+    def test_selects_department_and_course_announcements(self):
+        request = self.request(self.student.user)
+        self.assertEqual(self.titles(request), {'Everyone', 'Students', 'CS', 'Compilers'})
+        with self.assertNumQueries(1):
+            self.titles(request)
+
+    def test_audience_is_cached_in_session_until_enrollment_changes(self):
+        request = self.request(self.student.user)
+        audience.get_audience(request)
+        follow_up = self.request(self.student.user)
+        follow_up.session = request.session
+        with self.assertNumQueries(0):
+            self.assertEqual(audience.get_audience(follow_up)['course_ids'], [self.compilers.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.create(student=self.student, course=self.topology, teacher=self.teacher)
+        stale = self.request(self.student.user)
+        stale.session = request.session
+        self.assertIn('Topology', self.titles(stale))
+
+    def test_evicted_version_does_not_revive_a_stale_session(self):
+        audience.invalidate(self.student.user_id)
+        request = self.request(self.student.user)
+        audience.get_audience(request)
+        cache.clear()
+        Enrollment.objects.create(student=self.student, course=self.topology, teacher=self.teacher)
+        audience.invalidate(self.student.user_id)
+        stale = self.request(self.student.user)
+        stale.session = request.session
+        self.assertIn('Topology', self.titles(stale))
+
+    def test_admin_sees_everything(self):
+        self.assertEqual(len(self.titles(self.request(self.admin))), 7)
+
+
+@override_settings(NOTIFICATION_DELIVERY='sync')
+class NotificationFanOutTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='pass', role=User.ADMIN)
+        department = Department.objects.create(name='History', code='HIST')
+        self.course = Course.objects.create(name='Ancient Rome', code='HIST210', department=department)
+        self.teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        self.enrolled = []
+        for number in range(5):
+            student = User.objects.create_user(username=f'student{number}', password='pass', role=User.STUDENT).student
+            if number < 3:
+                Enrollment.objects.create(student=student, course=self.course, teacher=self.teacher)
+                self.enrolled.append(student.user)
+
+    def announce(self, priority, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Announcement.objects.create(
+                title='Exam moved', content='See you Monday', author=self.admin, priority=priority, **kwargs
+            )
+
+    def test_urgent_course_announcement_notifies_course_members(self):
+        self.announce('urgent', target_audience='course', course=self.course)
+        recipients = set(Notification.objects.values_list('recipient', flat=True))
+        self.assertEqual(recipients, {user.pk for user in self.enrolled} | {self.teacher.user_id})
+
+    def test_non_urgent_announcement_is_not_fanned_out(self):
+        self.announce('high')
+        self.assertFalse(Notification.objects.exists())
+
+    def test_delivers_in_chunks(self):
+        announcement = self.announce('low', target_audience='students')
+        with self.assertNumQueries(1 + 1 + 3 * 3):
+            # announcement, recipient ids, then a savepoint pair and an INSERT per chunk of 2
+            self.assertEqual(notifications.deliver(announcement.pk, chunk_size=2), 5)
+
+    def test_unread_count_endpoint(self):
+        self.announce('urgent')
+        Notification.objects.filter(recipient=self.enrolled[0]).update(is_read=True)
+        request = RequestFactory().get('/notifications/unread-count/')
+        request.user = self.enrolled[1]
+        self.assertEqual(json.loads(views.notifications_unread_count(request).content), {'unread': 1})
+        self.assertEqual(notifications.unread_count(self.enrolled[0]), 0)
+
+    @override_settings(NOTIFICATION_DELIVERY='thread')
+    def test_thread_mode_delivers_off_the_request_path(self):
+        with mock.patch('core.notifications.deliver') as deliver:
+            notifications.enqueue(42)
+            notifications.wait_for_delivery()
+        deliver.assert_called_once_with(42)
+
+
+class AttendanceTests(TestCase):
+
+    def setUp(self):
+        department = Department.objects.create(name='Chemistry', code='CHEM')
+        self.course = Course.objects.create(name='Organic Chemistry', code='CHEM220', department=department)
+        self.teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        self.students = []
+        for number in range(4):
+            student = User.objects.create_user(username=f'student{number}', password='pass', role=User.STUDENT).student
+            Enrollment.objects.create(student=student, course=self.course, teacher=self.teacher)
+            self.students.append(student)
+        self.outsider = User.objects.create_user(username='outsider', password='pass', role=User.STUDENT).student
+
+    def records(self, *present):
+        return [{'student_id': s.student_id, 'is_present': i in present} for i, s in enumerate(self.students)]
+
+    def test_marks_a_session_in_one_statement(self):
+        day = date(2026, 9, 1)
+        # The enrollment lookup, then in a savepoint the upsert and the archived records it replaces
+        with self.assertNumQueries(5):
+            result = attendance.mark_session(self.teacher, self.course.pk, day, self.records(0, 1))
+        self.assertEqual(result, {'saved': 4, 'errors': []})
+        attendance.mark_session(self.teacher, self.course.pk, day, self.records(0, 1, 2))
+        self.assertEqual(Attendance.objects.filter(date=day).count(), 4)
+        self.assertEqual(Attendance.objects.filter(date=day, is_present=True).count(), 3)
+
+    def test_session_is_not_saved_when_replacing_archived_records_fails(self):
+        with mock.patch('core.attendance.supersede_attendance', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                attendance.mark_session(self.teacher, self.course.pk, date(2026, 9, 1), self.records(0))
+        self.assertFalse(Attendance.objects.exists())
+
+    def test_rejects_students_outside_the_course(self):
+        records = [
+            {'student_id': self.outsider.student_id, 'is_present': True},
+            {'student_id': self.students[0].student_id, 'is_present': 'yes'},
+        ]
+        result = attendance.mark_session(self.teacher, self.course.pk, date(2026, 9, 1), records)
+        self.assertEqual(result['saved'], 0)
+        self.assertEqual([error['row'] for error in result['errors']], [1, 2])
+
+    def test_matrix_and_percentages_from_one_query(self):
+        attendance.mark_session(self.teacher, self.course.pk, date(2026, 9, 1), self.records(0, 1, 2))
+        attendance.mark_session(self.teacher, self.course.pk, date(2026, 9, 3), self.records(0))
+        attendance.mark_session(self.teacher, self.course.pk, date(2026, 9, 8), self.records(0, 2)[:3])
+        with self.assertNumQueries(1):
+            matrix = attendance.course_matrix(self.course.pk)
+        report = matrix.as_dict()
+        self.assertEqual(report['dates'], ['2026-09-01', '2026-09-03', '2026-09-08'])
+        rows = {row['student_id']: row for row in report['students']}
+        self.assertEqual(rows[self.students[0].student_id]['row'], '111')
+        self.assertEqual(rows[self.students[1].student_id]['row'], '100')
+        self.assertEqual(rows[self.students[3].student_id]['row'], '00-')
+        self.assertEqual(rows[self.students[2].student_id]['percentage'], 66.67)
+        self.assertEqual(rows[self.students[3].student_id]['sessions'], 2)
+        self.assertEqual(len(attendance.course_matrix(self.course.pk, start=date(2026, 9, 2)).dates), 2)
+
+    def test_bulk_mark_endpoint(self):
+        request = RequestFactory().post('/attendance/mark/', data=json.dumps({
+            'course_id': self.course.pk, 'date': '2026-09-01', 'records': self.records(1),
+        }), content_type='application/json')
+        request.user = self.teacher.user
+        self.assertEqual(json.loads(views.attendance_bulk_mark(request).content)['saved'], 4)
+
+
+class EnrollmentEngineTests(TestCase):
+
+    def setUp(self):
+        self.department = Department.objects.create(name='Biology', code='BIO')
+        self.course = Course.objects.create(name='Genetics', code='BIO210', department=self.department, capacity=3)
+        self.teachers = [
+            User.objects.create_user(username=f'teacher{n}', password='pass', role=User.TEACHER).teacherprofile
+            for n in range(2)
+        ]
+        for teacher in self.teachers:
+            teacher.department = self.department
+            teacher.save()
+        self.students = [
+            User.objects.create_user(username=f'student{n}', password='pass', role=User.STUDENT).student
+            for n in range(5)
+        ]
+
+    def refresh(self):
+        self.course.refresh_from_db()
+        return [teacher.student_load for teacher in TeacherProfile.objects.order_by('pk')]
+
+    def test_enforces_capacity_and_balances_teachers(self):
+        for student in self.students[:3]:
+            enrollment.enroll(student, self.course)
+        with self.assertRaises(enrollment.CourseFull):
+            enrollment.enroll(self.students[3], self.course)
+        self.assertEqual(self.refresh(), [2, 1])
+        self.assertEqual(self.course.enrolled_count, 3)
+        self.assertEqual(Enrollment.objects.filter(course=self.course).count(), 3)
+
+    def test_duplicate_enrollment_takes_no_seat_or_teacher(self):
+        enrollment.enroll(self.students[0], self.course)
+        with CaptureQueriesContext(connection) as queries, self.assertRaises(enrollment.AlreadyEnrolled):
+            enrollment.enroll(self.students[0], self.course)
+        self.assertFalse([query for query in queries.captured_queries if query['sql'].startswith('UPDATE')])
+        self.assertEqual(self.refresh(), [1, 0])
+        self.assertEqual(self.course.enrolled_count, 1)
+
+    def test_duplicate_enrollment_in_a_full_course_is_already_enrolled(self):
+        for student in self.students[:3]:
+            enrollment.enroll(student, self.course)
+        with self.assertRaises(enrollment.AlreadyEnrolled):
+            enrollment.enroll(self.students[0], self.course)
+        self.assertEqual(self.refresh(), [2, 1])
+        self.assertEqual(self.course.enrolled_count, 3)
+
+    def test_course_can_be_retaken_in_a_later_term(self):
+        today = timezone.localdate()
+        past = Term.objects.create(
+            name='Past', code='PAST', start_date=today - timezone.timedelta(days=400),
+            end_date=today - timezone.timedelta(days=300), is_closed=True,
+        )
+        Term.objects.create(
+            name='Current', code='CUR', start_date=today - timezone.timedelta(days=30),
+            end_date=today + timezone.timedelta(days=60),
+        )
+        for student in self.students[:2]:
+            Enrollment.objects.create(student=student, course=self.course, teacher=self.teachers[0], term=past, is_active=False)
+        enrollment.enroll(self.students[0], self.course)
+        self.assertEqual(len(enrollment.enroll_cohort(self.course, self.students[:2])), 1)
+        with self.assertRaises(enrollment.AlreadyEnrolled):
+            enrollment.enroll(self.students[1], self.course)
+        self.assertEqual(Enrollment.objects.filter(course=self.course).count(), 4)
+
+    def test_cohort_is_all_or_nothing(self):
+        with self.assertRaises(enrollment.CourseFull):
+            enrollment.enroll_cohort(self.course, self.students)
+        self.assertFalse(Enrollment.objects.exists())
+        self.course.capacity = None
+        self.course.save()
+        enrollment.enroll(self.students[0], self.course)
+        created = enrollment.enroll_cohort(self.course, self.students)
+        self.assertEqual(len(created), 4)
+        self.assertEqual(self.refresh(), [3, 2])
+        self.assertEqual(self.course.enrolled_count, 5)
+
+    def test_counters_follow_changes_made_elsewhere(self):
+        first = enrollment.enroll(self.students[0], self.course)
+        second = enrollment.enroll(self.students[1], self.course)
+        first.is_active = False
+        first.save()
+        self.assertEqual(self.refresh(), [0, 1])
+        second.teacher = self.teachers[0]
+        second.save()
+        self.assertEqual(self.refresh(), [1, 0])
+        second.delete()
+        self.assertEqual(self.refresh(), [0, 0])
+        self.assertEqual(self.course.enrolled_count, 0)
+        Course.objects.update(enrolled_count=7)
+        TeacherProfile.objects.update(student_load=7)
+        call_command('recount_enrollments', stdout=StringIO())
+        self.assertEqual(self.refresh(), [0, 0])
+        self.assertEqual(self.course.enrolled_count, 0)
+
+    @mock.patch('core.views.render', return_value=HttpResponse())
+    def test_enrollment_view(self, render):
+        self.course.capacity = 1
+        self.course.save()
+        for student in self.students[:2]:
+            student.department = self.department
+            student.save()
+            request = RequestFactory().post('/', {'course_id': self.course.pk})
+            request.user = student.user
+            with mock.patch('core.views.messages') as messages, mock.patch('core.views.redirect'):
+                views.course_enrollment(request)
+        messages.error.assert_called_once()
+        request = RequestFactory().get('/')
+        request.user = self.students[2].user
+        views.course_enrollment(request)
+        self.assertEqual(list(render.call_args[0][2]['available_courses']), [])
+
+
+class EnrollmentConcurrencyTests(TransactionTestCase):
+
+    def test_parallel_enrollments_never_overbook(self):
+        department = Department.objects.create(name='Physics', code='PHY')
+        course = Course.objects.create(name='Optics', code='PHY330', department=department, capacity=4)
+        teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        teacher.department = department
+        teacher.save()
+        students = [
+            User.objects.create_user(username=f'student{n}', password='pass', role=User.STUDENT).student
+            for n in range(12)
+        ]
+        barrier = threading.Barrier(len(students))
+
+        def attempt(student):
+            barrier.wait()
+            try:
+                for _ in range(50):
+                    try:
+                        enrollment.enroll(student, course)
+                        return
+                    except enrollment.EnrollmentError:
+                        return
+                    except OperationalError:
+                        # SQLite reports lock contention instead of waiting
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=attempt, args=(student,)) for student in students]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        course.refresh_from_db()
+        teacher.refresh_from_db()
+        enrolled = Enrollment.objects.filter(course=course).count()
+        self.assertEqual(enrolled, 4)
+        self.assertEqual(course.enrolled_count, enrolled)
+        self.assertEqual(teacher.student_load, enrolled)
+
+    @skipUnless(connection.vendor == 'postgresql', 'SQLite has no row locks')
+    def test_waits_for_a_teacher_when_all_are_locked(self):
+        department = Department.objects.create(name='Physics', code='PHY')
+        course = Course.objects.create(name='Optics', code='PHY330', department=department)
+        teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        teacher.department = department
+        teacher.save()
+        student = User.objects.create_user(username='student', password='pass', role=User.STUDENT).student
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold_teachers():
+            try:
+                with transaction.atomic():
+                    list(TeacherProfile.objects.select_for_update().filter(department=department))
+                    locked.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        holder = threading.Thread(target=hold_teachers)
+        holder.start()
+        locked.wait(5)
+        threading.Timer(0.2, release.set).start()
+        try:
+            created = enrollment.enroll(student, course)
+        finally:
+            release.set()
+            holder.join()
+        self.assertEqual(created.teacher, teacher)
+
+
+class GradeAnalyticsTests(TestCase):
+
+    def setUp(self):
+        department = Department.objects.create(name='History', code='HIST')
+        self.course = Course.objects.create(name='Modern Europe', code='HIST300', department=department)
+        teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        self.essay = Assignment.objects.create(
+            course=self.course, teacher=teacher, title='Essay', max_marks=50, due_date=timezone.now()
+        )
+        self.exam = Assignment.objects.create(
+            course=self.course, teacher=teacher, title='Exam', max_marks=100, due_date=timezone.now()
+        )
+        marks = [(45, 95), (40, 72), (20, 49.5)]
+        for number, (essay, exam) in enumerate(marks):
+            student = User.objects.create_user(username=f'student{number}', password='pass', role=User.STUDENT).student
+            Grade.objects.create(student=student, assignment=self.essay, marks_obtained=Decimal(essay), graded_by=teacher)
+            Grade.objects.create(student=student, assignment=self.exam, marks_obtained=Decimal(str(exam)), graded_by=teacher)
+
+    def test_sql_annotation_matches_the_python_properties(self):
+        expected = [(grade.percentage, grade.letter_grade) for grade in Grade.objects.order_by('pk')]
+        with self.assertNumQueries(1):
+            annotated = [
+                (grade.percentage, grade.letter_grade)
+                for grade in Grade.objects.with_letter_grades().order_by('pk')
+            ]
+        self.assertEqual([letter for _, letter in annotated], [letter for _, letter in expected])
+        self.assertEqual([letter for _, letter in annotated], ['A+', 'A+', 'A-', 'B', 'F', 'F'])
+        for (sql, _), (python, _) in zip(annotated, expected):
+            self.assertAlmostEqual(float(sql), float(python), places=2)
+        self.assertEqual(Grade.objects.with_letter_grades().filter(annotated_letter_grade='F').count(), 2)
+
+    def test_sql_and_python_letters_agree_at_cutoffs(self):
+        Grade.objects.all().delete()
+        final = Assignment.objects.create(
+            course=self.course, teacher=self.essay.teacher, title='Final', max_marks=200, due_date=timezone.now()
+        )
+        # 89.995%, 90%, 49.995% and 50%
+        for number, marks in enumerate(['179.99', '180', '99.99', '100']):
+            student = User.objects.create_user(username=f'boundary{number}', password='pass', role=User.STUDENT).student
+            Grade.objects.create(student=student, assignment=final, marks_obtained=Decimal(marks), graded_by=final.teacher)
+        python = [grade.letter_grade for grade in Grade.objects.order_by('pk')]
+        sql = [grade.letter_grade for grade in Grade.objects.with_letter_grades().order_by('pk')]
+        self.assertEqual(python, ['A', 'A+', 'F', 'C-'])
+        self.assertEqual(sql, python)
+
+    def test_vectorized_letter_grades(self):
+        # Marks in hundredths out of 100
+        self.assertEqual(
+            analytics.letter_grades([10000, 9000, 8999, 5000, 4999, 0], [100] * 6).tolist(),
+            ['A+', 'A+', 'A', 'C-', 'F', 'F'],
+        )
+
+    def test_analytics_letters_agree_with_sql_and_python_at_cutoffs(self):
+        Grade.objects.all().delete()
+        quiz = Assignment.objects.create(
+            course=self.course, teacher=self.essay.teacher, title='Quiz', max_marks=12, due_date=timezone.now()
+        )
+        # Exactly 85%, which float64 puts just below (84.99999999999999%), and 60%
+        for number, marks in enumerate(['10.20', '7.20']):
+            student = User.objects.create_user(username=f'boundary{number}', password='pass', role=User.STUDENT).student
+            Grade.objects.create(student=student, assignment=quiz, marks_obtained=Decimal(marks), graded_by=quiz.teacher)
+        python = [grade.letter_grade for grade in Grade.objects.order_by('pk')]
+        sql = [grade.letter_grade for grade in Grade.objects.with_letter_grades().order_by('pk')]
+        report = analytics.course_report(self.course.pk)
+        self.assertEqual(python, ['A', 'C+'])
+        self.assertEqual(sql, python)
+        for letters in (report['assignments'][0]['letter_grades'], report['course']['letter_grades']):
+            self.assertEqual((letters['A'], letters['C+'], letters['A-'], letters['C']), (1, 1, 0, 0))
+
+    def test_course_report_from_one_query(self):
+        with self.assertNumQueries(1):
+            report = analytics.course_report(self.course.pk)
+        self.assertEqual((report['grades'], report['students']), (6, 3))
+        essay = next(a for a in report['assignments'] if a['id'] == self.essay.pk)
+        self.assertEqual(essay['title'], 'Essay')
+        self.assertEqual(essay['mean'], 70.0)
+        self.assertEqual(essay['median'], 80.0)
+        self.assertEqual(essay['letter_grades']['A+'], 1)
+        self.assertEqual(sum(bucket['count'] for bucket in essay['histogram']), 3)
+        # Overall percentages: 140/150, 112/150, 69.5/150
+        self.assertEqual(report['course']['max'], 93.33)
+        self.assertEqual(report['course']['percentiles']['50'], 74.67)
+        self.assertEqual(analytics.course_report(0), {
+            'course_id': 0, 'grades': 0, 'students': 0, 'course': {'count': 0}, 'assignments': [],
         })
-        self.assertEqual(response.status_code, 302)  # Redirect after registration
-        self.assertTrue(Students.objects.filter(email='newstudent@example.com').exists())
 
-    def test_logout(self):
-        self.client.login(email='admin@example.com', password='hashed_password')
-        response = self.client.get(reverse('logout'))
+
+class StreamingExportTests(TestCase):
+
+    def setUp(self):
+        department = Department.objects.create(name='Geology', code='GEO')
+        self.course = Course.objects.create(name='Mineralogy', code='GEO150', department=department)
+        self.teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        assignment = Assignment.objects.create(
+            course=self.course, teacher=self.teacher, title='Field report', max_marks=20, due_date=timezone.now()
+        )
+        self.students = []
+        for number in range(3):
+            student = User.objects.create_user(
+                username=f'student{number}', password='pass', role=User.STUDENT, first_name=f'Name, {number}'
+            ).student
+            Enrollment.objects.create(student=student, course=self.course, teacher=self.teacher)
+            Grade.objects.create(student=student, assignment=assignment, marks_obtained=10 + number, graded_by=self.teacher)
+            self.students.append(student)
+
+    def test_transcript_and_gradebook_csv(self):
+        text = ''.join(exports.stream('grades', student=self.students[1]))
+        rows = list(csv.reader(StringIO(text)))
+        self.assertEqual(rows[0][:3], ['student_id', 'first_name', 'last_name'])
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][1], 'Name, 1')
+        self.assertEqual(rows[1][rows[0].index('marks_obtained')], '11.00')
+        self.assertEqual(len(list(csv.reader(StringIO(''.join(exports.stream('grades', course=self.course)))))), 4)
+
+    def test_jsonl_and_date_bounds(self):
+        lines = ''.join(exports.stream('enrollments', 'jsonl')).splitlines()
+        self.assertEqual([json.loads(line)['student_id'] for line in lines], [s.student_id for s in self.students])
+        self.assertEqual(''.join(exports.stream('enrollments', 'jsonl', end=date(2000, 1, 1))), '')
+        with self.assertRaises(ValueError):
+            exports.export_rows('users')
+
+    def test_export_builds_no_model_instances(self):
+        with mock.patch.object(Grade, '__init__', side_effect=AssertionError('instance built')):
+            self.assertEqual(len(list(exports.export_rows('grades')[1])), 3)
+
+    def test_memory_stays_flat_for_a_million_rows(self):
+        columns = [name for name, _ in exports.DATASETS['attendance'][1]]
+        row = ('STU_000001', 'GEO150', date(2026, 9, 1), True, 'EMP_000001', '')
+        size = 0
+        tracemalloc.start()
+        try:
+            for chunk in exports.stream_csv(columns, (row for _ in range(1000000))):
+                size += len(chunk)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(size, 40 * 1000000)
+        self.assertLess(peak, 2 * 1024 * 1024)
+
+    def test_export_views(self):
+        factory = RequestFactory()
+        request = factory.get('/', {'format': 'jsonl'})
+        request.user = self.students[0].user
+        response = views.export_transcript(request, self.students[0].pk)
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 1)
+        self.assertEqual(views.export_transcript(request, self.students[1].pk).status_code, 403)
+
+        request = factory.get('/', {'start': '2000-01-01'})
+        request.user = self.teacher.user
+        response = views.export_gradebook(request, self.course.pk)
+        self.assertIn('gradebook-GEO150.csv', response['Content-Disposition'])
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 4)
+
+        request.user = User.objects.create_user(username='registrar', password='pass', role=User.ADMIN)
+        self.assertEqual(views.export_dataset(request, 'attendance').status_code, 200)
+        self.assertEqual(views.export_dataset(request, 'users').status_code, 404)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command('export_data', 'grades', '--course', 'GEO150', '--format', 'jsonl', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+        with self.assertRaises(CommandError):
+            call_command('export_data', 'grades', '--start', 'soon', stdout=out)
+
+
+class AsyncDashboardTests(TestCase):
+
+    def setUp(self):
+        profiling.reset()
+        department = Department.objects.create(name='Music', code='MUS')
+        self.teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        self.student = User.objects.create_user(username='student', password='pass', role=User.STUDENT).student
+        self.admin = User.objects.create_user(username='admin', password='pass', role=User.ADMIN)
+        for number in range(2):
+            course = Course.objects.create(name=f'Harmony {number}', code=f'MUS{number}', department=department)
+            Enrollment.objects.create(student=self.student, course=course, teacher=self.teacher)
+            assignment = Assignment.objects.create(
+                course=course, teacher=self.teacher, title='Chorale', max_marks=10, due_date=timezone.now()
+            )
+            Grade.objects.create(student=self.student, assignment=assignment, marks_obtained=8, graded_by=self.teacher)
+        Announcement.objects.create(title='Recital', content='Friday', author=self.admin, target_audience='all')
+
+    def request(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        request.session = SessionStore()
+
+        async def auser():
+            return user
+
+        request.auser = auser
+        return request
+
+    def contexts(self, name, user):
+        with mock.patch('core.views.render', return_value=HttpResponse()) as render:
+            getattr(views, name)(self.request(user))
+            async_to_sync(getattr(views, f'{name}_async'))(self.request(user))
+        sync, concurrent = (call.args[2] for call in render.call_args_list)
+        return {key: list(value) if isinstance(value, QuerySet) else value for key, value in sync.items()}, concurrent
+
+    def test_async_dashboards_match_the_sync_ones(self):
+        sync, concurrent = self.contexts('student_dashboard', self.student.user)
+        self.assertEqual(sync, concurrent)
+        self.assertEqual([grade.letter_grade for grade in concurrent['grades']], ['A-', 'A-'])
+        sync, concurrent = self.contexts('teacher_dashboard', self.teacher.user)
+        self.assertEqual(sync, concurrent)
+        sync, concurrent = self.contexts('admin_dashboard', self.admin)
+        self.assertEqual(sync, concurrent)
+
+    def test_missing_profile_is_a_404(self):
+        user = User.objects.create_user(username='applicant', password='pass', role=User.STUDENT)
+        user.student.delete()
+        with self.assertRaises(Http404):
+            async_to_sync(views.student_dashboard_async)(self.request(user))
+
+    @override_settings(QUERY_BUDGET_ENFORCE=True)
+    def test_async_middleware_counts_every_query(self):
+        def get_response(request):
+            middleware.process_view(request, views.student_dashboard, (), {})
+            return views.student_dashboard(request)
+
+        async def aget_response(request):
+            await sync_to_async(middleware.process_view)(request, views.student_dashboard_async, (), {})
+            return await views.student_dashboard_async(request)
+
+        with mock.patch('core.views.render', side_effect=render_evaluating_context):
+            middleware = profiling.ProfilingMiddleware(get_response)
+            middleware(self.request(self.student.user))
+            for backend in caches.all():
+                backend.clear()
+            middleware = profiling.ProfilingMiddleware(aget_response)
+            self.assertTrue(asyncio.iscoroutinefunction(middleware))
+            response = async_to_sync(middleware)(self.request(self.student.user))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        # The same reads as the sync view, wherever they ran
+        snapshot = profiling.snapshot()
+        self.assertEqual(
+            snapshot['student_dashboard_async']['queries']['max'], snapshot['student_dashboard']['queries']['max'],
+        )
+
+
+class QueryFanOutTests(TransactionTestCase):
+
+    def test_reads_run_on_separate_threads_outside_transactions(self):
+        Department.objects.create(name='Art', code='ART')
+        # Only passed once all three reads are running at the same time; run
+        # one after another, the first would wait out the timeout and break it
+        overlap = threading.Barrier(3, timeout=5)
+
+        def read():
+            overlap.wait()
+            return threading.get_ident(), Department.objects.count()
+
+        results = async_to_sync(fanout.gather)(first=read, second=read, third=read)
+        self.assertEqual([count for _, count in results.values()], [1, 1, 1])
+        self.assertEqual(len({ident for ident, _ in results.values()}), 3)
+
+
+class SearchIndexTests(TestCase):
+
+    def setUp(self):
+        self.department = Department.objects.create(name='Linguistics', code='LING')
+        self.ada = User.objects.create_user(
+            username='alovelace', password='pass', role=User.STUDENT,
+            first_name='Ada', last_name='Lovelace', email='ada@example.edu',
+        ).student
+        self.grace = User.objects.create_user(
+            username='ghopper', password='pass', role=User.TEACHER, first_name='Grace', last_name='Hopper',
+        ).teacherprofile
+        self.course = Course.objects.create(name='Phonology', code='LING201', department=self.department)
+
+    def found(self, query, kinds=search.KINDS):
+        return [(kind, object_id) for kind, object_id, _, _ in search.search(query, kinds)]
+
+    def test_prefix_substring_and_id_matches(self):
+        self.assertEqual(self.found('lovel'), [('student', self.ada.pk)])
+        self.assertEqual(self.found('ada love'), [('student', self.ada.pk)])
+        self.assertEqual(self.found(self.ada.student_id), [('student', self.ada.pk)])
+        self.assertEqual(self.found('ling201'), [('course', self.course.pk)])
+        self.assertEqual(self.found('hopper', ['course']), [])
+        self.assertEqual(self.found('ad'), [])
+
+    def test_typos_still_match(self):
+        self.assertEqual(self.found('lovelcae')[0], ('student', self.ada.pk))
+        self.assertEqual(self.found('phonolgy')[0], ('course', self.course.pk))
+
+    def test_signals_keep_the_index_current(self):
+        user = self.ada.user
+        user.last_name = 'Byron'
+        user.save()
+        self.assertEqual(search.search('byron'), [('student', self.ada.pk, 'Ada Byron', self.ada.student_id)])
+        self.course.name = 'Morphology'
+        self.course.save()
+        self.assertEqual(self.found('morpho'), [('course', self.course.pk)])
+        self.grace.user.delete()
+        self.assertEqual(self.found('hopper'), [])
+
+    def test_department_and_login_changes(self):
+        self.department.code = 'LANG'
+        self.department.save()
+        self.assertEqual(self.found('lang'), [('course', self.course.pk)])
+        with mock.patch.object(search, '_write') as write:
+            self.ada.user.last_login = timezone.now()
+            self.ada.user.save(update_fields=['last_login'])
+        write.assert_not_called()
+
+    @mock.patch.object(search, 'CANDIDATES', 2)
+    def test_best_matches_survive_the_candidate_limit(self):
+        for n in range(4):
+            Course.objects.create(
+                name=f'Comparative xylophone repertoire seminar {n}', code=f'MUS{n}00', department=self.department,
+            )
+        phonetics = Course.objects.create(name='Phone', code='PHN100', department=self.department)
+        self.assertEqual(self.found('phone', ['course'])[0], ('course', phonetics.pk))
+
+    def test_rebuild_matches_incremental_index(self):
+        before = sorted(search.search('example', limit=50))
+        self.assertEqual(search.rebuild(), 3)
+        self.assertEqual(sorted(search.search('example', limit=50)), before)
+
+    def test_endpoint_and_admin_search(self):
+        request = RequestFactory().get('/search/', {'q': 'grace', 'kind': 'teacher'})
+        request.user = User.objects.create_user(username='admin', password='pass', role=User.ADMIN)
+        results = json.loads(views.search(request).content)['results']
+        self.assertEqual(results, [{
+            'kind': 'teacher', 'id': self.grace.pk, 'label': 'Grace Hopper', 'detail': self.grace.employee_id,
+        }])
+        request = RequestFactory().get('/search/', {'q': 'grace', 'kind': 'dean'})
+        request.user = User.objects.get(username='admin')
+        self.assertEqual(views.search(request).status_code, 400)
+
+        model_admin = core_admin.StudentAdmin(Student, core_admin.admin.site)
+        queryset, _ = model_admin.get_search_results(request, Student.objects.all(), 'lovelace')
+        self.assertEqual(list(queryset), [self.ada])
+        user_admin = core_admin.UserAdmin(User, core_admin.admin.site)
+        queryset, _ = user_admin.get_search_results(request, User.objects.all(), 'hopper')
+        self.assertEqual(list(queryset), [self.grace.user])
+        queryset, _ = user_admin.get_search_results(request, User.objects.all(), 'admin')
+        self.assertEqual(list(queryset), [request.user])
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        routing._pools.clear()
+        self.student = User.objects.create_user(username='student', password='pass', role=User.STUDENT).student
+        probes = mock.patch.object(routing.ReplicaPool, 'probe', autospec=True, return_value=True)
+        self.probe = probes.start()
+        self.addCleanup(probes.stop)
+
+    def request(self, cookies=None):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        request.user = self.student.user
+        return request
+
+    def routed(self, view, request=None):
+        return routing.replica_reads(view)(request or self.request())
+
+    def test_reads_outside_replica_views_use_the_primary(self):
+        self.assertEqual(Student.objects.all().db, 'default')
+        self.assertEqual(self.routed(lambda request: Student.objects.all().db), 'replica1')
+
+    def test_round_robin_sticks_to_one_replica_per_request(self):
+        def view(request):
+            return [Student.objects.all().db, Course.objects.all().db]
+
+        self.assertEqual([self.routed(view) for _ in range(3)], [['replica1'] * 2, ['replica2'] * 2, ['replica1'] * 2])
+        self.assertEqual(self.probe.call_count, 2)
+
+    def test_unhealthy_replicas_are_skipped(self):
+        self.probe.side_effect = lambda pool, alias: alias == 'replica2'
+        self.assertEqual([self.routed(lambda request: Student.objects.all().db) for _ in range(3)], ['replica2'] * 3)
+        routing._pools.clear()
+        self.probe.side_effect = lambda pool, alias: False
+        self.assertEqual(self.routed(lambda request: Student.objects.all().db), 'default')
+
+    def test_writes_and_pin_cookie_keep_reads_on_the_primary(self):
+        def view(request):
+            before = Student.objects.all().db
+            Department.objects.create(name='Law', code='LAW')
+            return HttpResponse(f'{before} {Student.objects.all().db}')
+
+        middleware = routing.ReplicaRoutingMiddleware(lambda request: self.routed(view, request))
+        response = middleware(self.request())
+        self.assertEqual(response.content, b'replica1 default')
+        self.assertEqual(response.cookies[routing.PIN_COOKIE]['max-age'], 5)
+        pinned = self.routed(lambda request: Student.objects.all().db, self.request({routing.PIN_COOKIE: '1'}))
+        self.assertEqual(pinned, 'default')
+
+    def test_sessions_stay_on_the_primary(self):
+        self.assertEqual(self.routed(lambda request: SessionStore().model.objects.all().db), 'default')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaDatabaseTests(TransactionTestCase):
+    # replica1 is a separate database in the test settings, not a mirror of
+    # default, so the student id read back shows which one served the read
+    databases = {'default', 'replica1'}
+
+    def setUp(self):
+        routing._pools.clear()
+        cache.clear()
+        user = User.objects.create_user(username='student', password='pass', role=User.STUDENT)
+        self.student = user.student
+        User.objects.using('replica1').bulk_create([user])
+        Student.objects.using('replica1').bulk_create(
+            [Student(pk=self.student.pk, user_id=user.pk, student_id='REPLICA')]
+        )
+
+    def request(self, cookies=None):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        request.user = User.objects.get(pk=self.student.user_id)
+        request.session = SessionStore()
+        return request
+
+    def test_dashboard_reads_from_the_replica(self):
+        request = self.request()
+        with CaptureQueriesContext(connections['replica1']) as replica, \
+                CaptureQueriesContext(connection) as primary, \
+                mock.patch('core.views.render', return_value=HttpResponse()) as render:
+            views.student_dashboard(request)
+        self.assertEqual(render.call_args.args[2]['student_profile'].student_id, 'REPLICA')
+        self.assertTrue([query for query in replica.captured_queries if 'core_' in query['sql']])
+        self.assertFalse([query for query in primary.captured_queries if 'core_' in query['sql']])
+
+    def test_writes_and_the_reads_after_them_stay_on_the_primary(self):
+        def view(request):
+            before = Student.objects.get().student_id
+            Department.objects.create(name='Physics', code='PHY')
+            return before, Student.objects.get().student_id, Department.objects.count()
+
+        self.assertEqual(routing.replica_reads(view)(self.request()), ('REPLICA', self.student.student_id, 1))
+        self.assertTrue(Department.objects.exists())
+        self.assertFalse(Department.objects.using('replica1').exists())
+
+    def test_pinned_clients_read_from_the_primary(self):
+        pinned = self.request({routing.PIN_COOKIE: '1'})
+        self.assertEqual(
+            routing.replica_reads(lambda request: Student.objects.get().student_id)(pinned), self.student.student_id,
+        )
+
+
+class BulkProvisioningTests(TestCase):
+
+    def setUp(self):
+        self.department = Department.objects.create(name='Physics', code='PHY')
+        User.objects.create_user(username='taken', password='pass', role=User.STUDENT)
+
+    def roster(self):
+        return [
+            {'username': 'ada', 'email': 'Ada@EXAMPLE.edu', 'first_name': 'Ada', 'last_name': 'Lovelace',
+             'role': 'student', 'password': 'secret', 'department': 'PHY', 'date_of_birth': '2004-12-10'},
+            {'username': 'emmy', 'first_name': 'Emmy', 'last_name': 'Noether', 'role': 'Teacher'},
+            {'username': 'taken', 'role': 'student'},
+            {'username': 'ada', 'role': 'student'},
+            {'username': 'bob', 'role': 'dean'},
+            {'username': 'carl', 'department': 'MTH'},
+            {'username': 'dora', 'date_of_birth': '10/12/2004'},
+        ]
+
+    def test_provisions_users_and_profiles_in_bulk(self):
+        with CaptureQueriesContext(connection) as queries, \
+                mock.patch('core.models.create_user_profile') as signal:
+            result = provisioning.provision_users(self.roster(), default_password='welcome', workers=1, batch_size=4)
+        signal.assert_not_called()
+        self.assertEqual((result['rows'], result['students'], result['teachers']), (7, 1, 1))
+        self.assertEqual([error['row'] for error in result['errors']], [3, 4, 5, 6, 7])
+        self.assertIn('Duplicate of row 1', result['errors'][1]['error'])
+        self.assertLess(len(queries), 20)
+
+        ada = User.objects.get(username='ada')
+        self.assertTrue(ada.check_password('secret'))
+        self.assertEqual(ada.email, 'Ada@example.edu')
+        self.assertEqual(ada.date_of_birth, date(2004, 12, 10))
+        self.assertEqual(ada.student.student_id, f'STU_{ada.id:06d}')
+        self.assertEqual(ada.student.department, self.department)
+        emmy = User.objects.get(username='emmy')
+        self.assertTrue(emmy.check_password('welcome'))
+        self.assertEqual(emmy.teacherprofile.employee_id, f'EMP_{emmy.id:06d}')
+        self.assertEqual(search.search_ids('teacher', 'noether'), [emmy.teacherprofile.pk])
+
+    def test_passwords_hash_in_a_process_pool(self):
+        result = provisioning.provision_users(
+            [{'username': f'user{n}', 'password': f'pw{n}'} for n in range(6)] + [{'username': 'nopass'}],
+            workers=2,
+        )
+        self.assertEqual(result['students'], 7)
+        for n in range(6):
+            self.assertTrue(User.objects.get(username=f'user{n}').check_password(f'pw{n}'))
+        self.assertFalse(User.objects.get(username='nopass').has_usable_password())
+
+    def test_single_user_creation_still_uses_the_signal(self):
+        user = User.objects.create_user(username='solo', password='pass', role=User.TEACHER)
+        self.assertEqual(user.teacherprofile.employee_id, f'EMP_{user.id:06d}')
+
+    def test_command_reports_throughput(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='') as roster:
+            writer = csv.DictWriter(roster, ['username', 'role', 'password'])
+            writer.writeheader()
+            writer.writerows([{'username': 'csv1', 'role': 'student', 'password': 'x'}, {'username': 'csv2', 'role': 'teacher'}])
+            roster.flush()
+            out = StringIO()
+            call_command('provision_users', roster.name, '--workers', '1', stdout=out)
+        self.assertIn('Created 1 students and 1 teachers from 2 rows (0 errors)', out.getvalue())
+        self.assertIn('users/s', out.getvalue())
+
+
+class FragmentCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        fragments.fragment_cache().clear()
+        self.department = Department.objects.create(name='History', code='HIS')
+        self.course = Course.objects.create(name='Antiquity', code='HIS101', department=self.department)
+        self.teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        self.teacher.department = self.department
+        self.teacher.save()
+        self.student = User.objects.create_user(username='student', password='pass', role=User.STUDENT).student
+        self.admin = User.objects.create_user(username='admin', password='pass', role=User.ADMIN)
+        Enrollment.objects.create(student=self.student, course=self.course, teacher=self.teacher)
+        self.assignment = Assignment.objects.create(
+            course=self.course, teacher=self.teacher, title='Essay', max_marks=10, due_date=timezone.now()
+        )
+        self.grade = Grade.objects.create(
+            student=self.student, assignment=self.assignment, marks_obtained=6, graded_by=self.teacher
+        )
+
+    def panels(self, view, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        request.session = SessionStore()
+        with mock.patch('core.views.render', return_value=HttpResponse()) as render:
+            getattr(views, view)(request)
+        template, context = render.call_args.args[1:]
+        with CaptureQueriesContext(connection) as queries:
+            html = render_to_string(template.replace('dashboard', '_dashboard_panels'), {**context, 'user': user})
+        return html, len(queries)
+
+    def test_hot_dashboards_render_from_cache(self):
+        for view, user in [
+            ('student_dashboard', self.student.user),
+            ('teacher_dashboard', self.teacher.user),
+            ('admin_dashboard', self.admin),
+        ]:
+            html, _ = self.panels(view, user)
+            self.assertIn('HIS101', html)
+            self.assertEqual(self.panels(view, user), (html, 0))
+
+    def test_writes_never_leave_stale_fragments(self):
+        self.panels('student_dashboard', self.student.user)
+        self.panels('teacher_dashboard', self.teacher.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.grade.marks_obtained = 9
+            self.grade.save()
+        self.assertIn('9.00 / 10', self.panels('student_dashboard', self.student.user)[0])
+        self.assertIn('9.00', self.panels('teacher_dashboard', self.teacher.user)[0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Announcement.objects.create(title='Exam moved', content='Room 4', author=self.admin)
+        self.assertIn('Exam moved', self.panels('student_dashboard', self.student.user)[0])
+        self.assertIn('Exam moved', self.panels('admin_dashboard', self.admin)[0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.code = 'HIS102'
+            self.course.save()
+        for view, user in [('student_dashboard', self.student.user), ('teacher_dashboard', self.teacher.user)]:
+            html = self.panels(view, user)[0]
+            self.assertIn('HIS102', html)
+            self.assertNotIn('HIS101', html)
+
+        other = Course.objects.create(name='Rome', code='HIS200', department=self.department)
+        with self.captureOnCommitCallbacks(execute=True):
+            enrollment.enroll_cohort(other, [self.student])
+        self.assertIn('HIS200', self.panels('student_dashboard', self.student.user)[0])
+
+    def test_versions_are_per_user_and_survive_logins(self):
+        other = User.objects.create_user(username='other', password='pass', role=User.STUDENT).student
+        mine, theirs = fragments.versions(grades=self.student.pk), fragments.versions(grades=other.pk)
+        self.assertNotEqual(mine, theirs)
+        with self.captureOnCommitCallbacks(execute=True):
+            Grade.objects.create(student=other, assignment=self.assignment, marks_obtained=3, graded_by=self.teacher)
+        self.assertEqual(fragments.versions(grades=self.student.pk), mine)
+        self.assertNotEqual(fragments.versions(grades=other.pk), theirs)
+
+        people = fragments.versions(people=None)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.last_login = timezone.now()
+            self.admin.save(update_fields=['last_login'])
+        self.assertEqual(fragments.versions(people=None), people)
+
+    def test_expiring_announcements_and_replica_reads_shorten_lifetimes(self):
+        Announcement.objects.create(
+            title='Soon gone', content='', author=self.admin, expires_at=timezone.now() + timezone.timedelta(seconds=90)
+        )
+        self.assertIn(fragments._announcements_timeout(), (90, 91))
+        self.assertEqual(fragments.context()['timeout'], 600)
+        with mock.patch('core.routing.read_alias', return_value='replica1'):
+            self.assertEqual(fragments.context()['timeout'], 5)
+
+    def test_file_backend(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'template_fragments': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+        }):
+            html, _ = self.panels('student_dashboard', self.student.user)
+            self.assertEqual(self.panels('student_dashboard', self.student.user), (html, 0))
+            with self.captureOnCommitCallbacks(execute=True):
+                self.grade.marks_obtained = 2
+                self.grade.save()
+            self.assertIn('2.00 / 10', self.panels('student_dashboard', self.student.user)[0])
+
+
+@override_settings(NOTIFICATION_DELIVERY='sync')
+class QueryPlanTests(TestCase):
+    # Plan problems of the hot views that are bounded by design, with the reason
+    ACCEPTED = {
+        ('teacher_dashboard', 'sort for ORDER BY'): "top 10 of the teacher's recent grades, merged across courses",
+        ('course_attendance', 'sort for ORDER BY'): "one course's roster, sorted by student code",
+        ('export_gradebook', 'sort for ORDER BY'): "one course's grades, streamed in primary key order",
+        ('export_transcript', 'sort for ORDER BY'): "one student's archived grades, streamed in primary key order",
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        synthetic.generate_university(students=60, courses=6, teachers=3, departments=2)
+        cls.admin = User.objects.create_user(username='planner', password='pass', role=User.ADMIN)
+        audiences = ['all', 'students', 'teachers', 'department', 'course']
+        for index, audience in enumerate(audiences * 2):
+            Announcement.objects.create(
+                title=f'Notice {index}', content='', author=cls.admin, target_audience=audience,
+                department=Department.objects.first() if audience == 'department' else None,
+                course=Course.objects.first() if audience == 'course' else None,
+            )
+        cls.student = Student.objects.order_by('pk').first()
+        cls.teacher = TeacherProfile.objects.filter(enrollment__isnull=False).order_by('pk').first()
+        cls.course_id = Enrollment.objects.filter(teacher=cls.teacher).values_list('course_id', flat=True).first()
+
+    def setUp(self):
+        # The admin dashboard takes its cold path, counting from the tables
+        cache.clear()
+        fragments.fragment_cache().clear()
+
+    def plan_problems(self, view, user, *args):
+        request = RequestFactory().get('/')
+        request.user = user
+        request.session = SessionStore()
+
+        def call():
+            with mock.patch('core.views.render', return_value=HttpResponse()) as render:
+                response = getattr(views, view)(request, *args)
+            if response.streaming:
+                list(response.streaming_content)
+            if render.called:
+                for value in render.call_args.args[2].values():
+                    if isinstance(value, QuerySet):
+                        list(value)
+
+        _, plans = queryplans.capture_plans(call)
+        self.assertTrue(plans)
+        return {(view, problem): plan['sql'] for plan in plans for problem in plan['problems']}
+
+    def test_hot_views_use_indexes(self):
+        hot = [
+            ('admin_dashboard', self.admin),
+            ('teacher_dashboard', self.teacher.user),
+            ('student_dashboard', self.student.user),
+            ('announcements', self.student.user),
+            ('announcements_feed', self.student.user),
+            ('notifications_unread_count', self.student.user),
+            ('course_enrollment', self.student.user),
+            ('grade_management', self.teacher.user),
+            ('course_attendance', self.teacher.user, self.course_id),
+            ('course_grade_report', self.teacher.user, self.course_id),
+            ('export_gradebook', self.teacher.user, self.course_id),
+            ('export_transcript', self.student.user, self.student.pk),
+        ]
+        for view, user, *args in hot:
+            with self.subTest(view=view):
+                unexpected = {
+                    problem: sql for problem, sql in self.plan_problems(view, user, *args).items()
+                    if problem not in self.ACCEPTED
+                }
+                self.assertEqual(unexpected, {})
+
+    def test_problems_from_sqlite_plans(self):
+        sql = 'SELECT * FROM "core_grade" WHERE "id" IN (SELECT U0."id" FROM "core_enrollment" U0)'
+        self.assertEqual(queryplans.problems(['SCAN core_grade'], sql), ['full scan of core_grade'])
+        self.assertEqual(queryplans.problems(['SCAN U0'], sql), ['full scan of core_enrollment'])
+        self.assertEqual(queryplans.problems(['SCAN core_department', 'SCAN subquery_1'], sql), [])
+        self.assertEqual(
+            queryplans.problems(['SEARCH core_grade USING INDEX grade_student_recent_idx (student_id=?)'], sql), []
+        )
+        self.assertEqual(queryplans.problems(['USE TEMP B-TREE FOR ORDER BY'], sql), ['sort for ORDER BY'])
+
+
+class TermArchivalTests(TestCase):
+
+    def setUp(self):
+        department = Department.objects.create(name='Music', code='MUS')
+        self.teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        self.teacher.department = department
+        self.teacher.save()
+        self.student = User.objects.create_user(username='student', password='pass', role=User.STUDENT).student
+        self.spring = Term.objects.create(name='Spring', code='2026S', start_date=date(2026, 1, 10), end_date=date(2026, 5, 30))
+        self.autumn = Term.objects.create(name='Autumn', code='2026A', start_date=date(2026, 9, 1), end_date=date(2026, 12, 20))
+        self.old = Course.objects.create(name='Harmony', code='MUS101', department=department)
+        self.new = Course.objects.create(name='Counterpoint', code='MUS201', department=department)
+        Enrollment.objects.create(student=self.student, course=self.old, teacher=self.teacher, term=self.spring)
+        Enrollment.objects.create(student=self.student, course=self.new, teacher=self.teacher, term=self.autumn)
+        for course in (self.old, self.new):
+            for number in range(3):
+                assignment = Assignment.objects.create(
+                    course=course, teacher=self.teacher, title=f'Exercise {number}', max_marks=10, due_date=timezone.now()
+                )
+                Grade.objects.create(
+                    student=self.student, assignment=assignment, marks_obtained=5 + number, graded_by=self.teacher
+                )
+            Attendance.objects.create(student=self.student, course=course, date=date(2026, 3, 2), marked_by=self.teacher)
+
+    def test_closed_term_moves_in_batches_and_stays_readable(self):
+        with self.assertRaises(archive.ArchiveError):
+            archive.archive_term(self.spring)
+        self.spring.is_closed = True
+        self.spring.save()
+        before = Student.objects.get(pk=self.student.pk).gpa
+        transcript = ''.join(exports.stream('grades', student=self.student))
+
+        self.assertEqual(archive.archive_term(self.spring, batch_size=2), {'grades': 3, 'attendance': 1})
+        self.assertEqual(Grade.objects.filter(assignment__course=self.old).count(), 0)
+        self.assertEqual(Grade.objects.filter(assignment__course=self.new).count(), 3)
+        self.assertEqual(GradeArchive.objects.filter(term=self.spring).count(), 3)
+        self.assertEqual(list(AttendanceArchive.objects.values_list('course_id', flat=True)), [self.old.pk])
+        self.assertIsNotNone(Term.objects.get(pk=self.spring.pk).archived_at)
+
+        # The GPA and transcript read the same before and after
+        self.assertEqual(Student.objects.get(pk=self.student.pk).gpa, before)
+        self.assertEqual(gpa.compute_gpas([self.student.pk]), {self.student.pk: before})
+        self.assertEqual(
+            sorted(''.join(exports.stream('grades', student=self.student)).splitlines()), sorted(transcript.splitlines())
+        )
+        history = archive.grade_history(student=self.student).order_by('-marks_obtained')
+        self.assertEqual([row['marks_obtained'] for row in history], [7, 7, 6, 6, 5, 5])
+        self.assertEqual(archive.attendance_history(student=self.student).count(), 2)
+
+        # Nothing is left to move, and the run is not repeated for archived terms
+        self.assertEqual(archive.archive_term(self.spring), {'grades': 0, 'attendance': 0})
+        self.assertEqual(archive.archive_closed_terms(), {})
+
+    def test_interrupted_batch_is_copied_again(self):
+        self.spring.is_closed = True
+        self.spring.save()
+        grade = Grade.objects.filter(assignment__course=self.old).order_by('pk').first()
+        # A copy that committed without its delete, as if the run had stopped in between
+        GradeArchive.objects.create(
+            id=grade.pk, term=self.spring, student=self.student, assignment=grade.assignment,
+            marks_obtained=grade.marks_obtained, graded_by=self.teacher, graded_at=grade.graded_at,
+        )
+        self.assertEqual(archive.archive_term(self.spring)['grades'], 3)
+        self.assertEqual(GradeArchive.objects.count(), 3)
+
+    def test_grading_an_archived_pair_again_replaces_it(self):
+        self.spring.is_closed = True
+        self.spring.save()
+        archive.archive_term(self.spring)
+        before = Student.objects.get(pk=self.student.pk).gpa
+        exercise = Assignment.objects.filter(course=self.old).order_by('pk').first()
+
+        Grade.objects.create(student=self.student, assignment=exercise, marks_obtained=9, graded_by=self.teacher)
+        # The archived absence counts until the session is marked again
+        self.assertEqual(attendance.course_matrix(self.old.pk).totals, [(1, 0)])
+        attendance.mark_session(
+            self.teacher, self.old.pk, date(2026, 3, 2), [{'student_id': self.student.student_id, 'is_present': True}]
+        )
+        self.assertEqual(GradeArchive.objects.filter(assignment=exercise).count(), 0)
+        self.assertEqual(AttendanceArchive.objects.count(), 0)
+
+        report = analytics.course_report(self.old.pk)
+        self.assertEqual((report['grades'], report['course']['mean']), (3, 73.33))
+        total = CourseGradeTotal.objects.get(student=self.student, course=self.old)
+        self.assertEqual((total.marks_obtained_total, total.max_marks_total, total.graded_count), (22, 30, 3))
+        gpas = gpa.compute_gpas([self.student.pk])
+        self.assertEqual(Student.objects.get(pk=self.student.pk).gpa, gpas[self.student.pk])
+        self.assertGreater(gpas[self.student.pk], before)
+        matrix = attendance.course_matrix(self.old.pk)
+        self.assertEqual((matrix.as_dict()['students'][0]['row'], matrix.totals), ('1', [(1, 1)]))
+
+        # An import regrading another archived pair
+        second = Assignment.objects.filter(course=self.old).order_by('pk')[1]
+        gradebook.import_grades(
+            [{'student_id': self.student.student_id, 'assignment_id': second.pk, 'marks_obtained': '10'}], self.teacher
+        )
+        self.assertEqual(GradeArchive.objects.filter(student=self.student).count(), 1)
+        self.assertEqual(analytics.course_report(self.old.pk)['grades'], 3)
+        self.assertEqual(Student.objects.get(pk=self.student.pk).gpa, gpa.compute_gpas([self.student.pk])[self.student.pk])
+
+    def test_current_term_and_command(self):
+        self.assertEqual(Term.objects.current(date(2026, 10, 1)), self.autumn)
+        self.assertIsNone(Term.objects.current(date(2026, 7, 1)))
+
+        user = self.student.user
+        old = Notification.objects.create(recipient=user, title='Old', message='', is_read=True)
+        Notification.objects.filter(pk=old.pk).update(created_at=timezone.now() - timezone.timedelta(days=400))
+        unread = Notification.objects.create(recipient=user, title='Unread', message='')
+        Notification.objects.filter(pk=unread.pk).update(created_at=timezone.now() - timezone.timedelta(days=400))
+        Notification.objects.create(recipient=user, title='Recent', message='', is_read=True)
+
+        self.spring.is_closed = True
+        self.spring.save()
+        out = StringIO()
+        call_command('archive_terms', stdout=out)
+        self.assertIn('2026S: archived 3 grades and 1 attendance records', out.getvalue())
+        self.assertIn('pruned 1 read notifications', out.getvalue())
+        self.assertEqual(set(Notification.objects.values_list('title', flat=True)), {'Unread', 'Recent'})
+        with self.assertRaises(CommandError):
+            call_command('archive_terms', term='2026A', stdout=StringIO())
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        fragments.fragment_cache().clear()
+        profiling.reset()
+        department = Department.objects.create(name='Physics', code='PHY')
+        course = Course.objects.create(name='Optics', code='PHY210', department=department)
+        self.teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        self.student = User.objects.create_user(username='student', password='pass', role=User.STUDENT).student
+        self.admin = User.objects.create_user(username='admin', password='pass', role=User.ADMIN)
+        Enrollment.objects.create(student=self.student, course=course, teacher=self.teacher)
+        assignment = Assignment.objects.create(
+            course=course, teacher=self.teacher, title='Lenses', max_marks=10, due_date=timezone.now()
+        )
+        self.grade = Grade.objects.create(
+            student=self.student, assignment=assignment, marks_obtained=8, graded_by=self.teacher
+        )
+        Announcement.objects.create(title='Welcome', content='', author=self.admin)
+        self.session = SessionStore()
+
+    def get(self, view, user, **headers):
+        request = RequestFactory().get('/', headers=headers)
+        request.user = user
+        request.session = self.session
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            with mock.patch('core.views.render', return_value=HttpResponse('page')):
+                return view(request)
+
+        middleware = profiling.ProfilingMiddleware(get_response)
+        return middleware(request)
+
+    def test_unchanged_dashboard_is_not_modified(self):
+        first = self.get(views.student_dashboard, self.student.user)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('private', first['Cache-Control'])
+        self.assertIn('no-cache', first['Cache-Control'])
+        with self.assertNumQueries(1):
+            again = self.get(views.student_dashboard, self.student.user, if_none_match=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(
+            self.get(views.student_dashboard, self.student.user, if_modified_since=first['Last-Modified']).status_code, 304
+        )
+        # Another user's validators are their own
+        self.assertNotEqual(self.get(views.teacher_dashboard, self.teacher.user)['ETag'], first['ETag'])
+
+        metrics = profiling.snapshot()['student_dashboard']
+        self.assertEqual((metrics['requests'], metrics['not_modified'], metrics['not_modified_pct']), (3, 2, 66.67))
+
+    def test_writes_without_newer_timestamps_change_the_etag(self):
+        etag = self.get(views.student_dashboard, self.student.user)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.grade.delete()
+        changed = self.get(views.student_dashboard, self.student.user, if_none_match=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+        etag = self.get(views.announcements_feed, self.student.user)['ETag']
+        self.assertEqual(self.get(views.announcements_feed, self.student.user, if_none_match=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Announcement.objects.all().delete()
+        self.assertEqual(self.get(views.announcements_feed, self.student.user, if_none_match=etag).status_code, 200)
+
+    def test_pending_messages_render_in_full(self):
+        etag = self.get(views.student_dashboard, self.student.user)['ETag']
+        with mock.patch('core.conditional.get_messages', return_value=['Saved']):
+            response = self.get(views.student_dashboard, self.student.user, if_none_match=etag)
         self.assertEqual(response.status_code, 200)
-        self.assertTemplateUsed(response, 'core/logout.html')
\ No newline at end of file
+        self.assertFalse(response.has_header('ETag'))
+
+
+class IdentityCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.department = Department.objects.create(name='Chemistry', code='CHEM')
+        self.course = Course.objects.create(name='Organic', code='CHEM200', department=self.department)
+        self.teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        self.student = User.objects.create_user(username='student', password='pass', role=User.STUDENT).student
+        Student.objects.filter(pk=self.student.pk).update(department=self.department)
+        User.objects.create_user(username='admin', password='pass', role=User.ADMIN)
+        Enrollment.objects.create(student=self.student, course=self.course, teacher=self.teacher)
+
+    def test_identity_is_loaded_once_with_profile_and_department(self):
+        with self.assertNumQueries(1):
+            user = identity.get_identity(self.student.user_id)
+        with self.assertNumQueries(0):
+            user = identity.CachedModelBackend().get_user(self.student.user_id)
+            profile = identity.profile_or_404(user, Student)
+            self.assertEqual(profile.department.code, 'CHEM')
+            with self.assertRaises(Http404):
+                identity.profile_or_404(user, TeacherProfile)
+        # Users loaded elsewhere may hold stale profiles and are read from the database
+        with self.assertNumQueries(1):
+            identity.profile_or_404(self.student.user, Student)
+
+    def test_writes_drop_cached_identities(self):
+        identity.get_identity(self.student.user_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.department.name = 'Applied Chemistry'
+            self.department.save()
+        self.assertEqual(identity.get_identity(self.student.user_id).student.department.name, 'Applied Chemistry')
+
+        assignment = Assignment.objects.create(
+            course=self.course, teacher=self.teacher, title='Titration', max_marks=10, due_date=timezone.now()
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            Grade.objects.create(student=self.student, assignment=assignment, marks_obtained=9, graded_by=self.teacher)
+        self.assertEqual(identity.get_identity(self.student.user_id).student.gpa, Decimal('3.60'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.get(pk=self.student.user_id)
+            user.is_active = False
+            user.save()
+        self.assertIsNone(identity.CachedModelBackend().get_user(self.student.user_id))
+
+    @override_settings(
+        ROOT_URLCONF='core.benchmark',
+        QUERY_BUDGET_ENFORCE=True,
+        SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+        AUTHENTICATION_BACKENDS=['core.identity.CachedModelBackend'],
+    )
+    def test_dashboards_load_the_identity_in_zero_or_one_query(self):
+        users = {
+            'admin_dashboard': User.objects.get(username='admin'),
+            'teacher_dashboard': self.teacher.user,
+            'student_dashboard': self.student.user,
+        }
+        with mock.patch('core.views.render', side_effect=render_evaluating_context):
+            for name, user in users.items():
+                url = f'/wsgi/{name}/'
+                self.client.force_login(user)
+                self.client.get(url)
+                with CaptureQueriesContext(connection) as warm:
+                    self.client.get(url)
+                # A returning user's session and identity come from the cache
+                self.assertEqual(
+                    [sql for sql in (query['sql'] for query in warm) if 'FROM "django_session"' in sql or 'FROM "core_user"' in sql],
+                    [],
+                )
+                # and a new identity costs one query
+                cache.delete(identity.IDENTITY_KEY.format(user.pk))
+                with self.assertNumQueries(len(warm) + 1):
+                    self.client.get(url)
+
+    def test_dashboards_skip_session_and_identity_queries(self):
+        results = benchmark.compare_identity(requests=2)
+        self.assertEqual(results['admin_dashboard']['cached']['queries'], results['admin_dashboard']['baseline']['queries'] - 2)
+        for name in ('teacher_dashboard', 'student_dashboard'):
+            # Session, user and role profile
+            self.assertEqual(results[name]['cached']['queries'], results[name]['baseline']['queries'] - 3)
+
+
+class AdminURLs:
+    urlpatterns = [path('admin/', core_admin.admin.site.urls)]
+
+
+@override_settings(ROOT_URLCONF=AdminURLs)
+class LargeTableAdminTests(TestCase):
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(username='root', password='pass', role=User.ADMIN)
+        self.department = Department.objects.create(name='Economics', code='ECO')
+        self.teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        self.teacher.department = self.department
+        self.teacher.save()
+        self.courses = [
+            Course.objects.create(name=f'Economics {n}', code=f'ECO{n}', department=self.department) for n in range(2)
+        ]
+        self.client.force_login(self.superuser)
+
+    def add_students(self, count):
+        for _ in range(count):
+            number = Student.objects.count()
+            student = User.objects.create_user(username=f'student{number}', password='pass', role=User.STUDENT).student
+            for course in self.courses:
+                enrollment.enroll(student, course)
+
+    def changelist_queries(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(captured)
+
+    def test_changelists_do_not_grow_with_rows(self):
+        assignment = Assignment.objects.create(
+            course=self.courses[0], teacher=self.teacher, title='Supply', max_marks=10, due_date=timezone.now()
+        )
+        self.add_students(2)
+        for student in Student.objects.all():
+            Grade.objects.get_or_create(student=student, assignment=assignment, marks_obtained=5, graded_by=self.teacher)
+        urls = ['/admin/core/enrollment/', '/admin/core/grade/', '/admin/core/assignment/', '/admin/core/notification/']
+        self.client.get(urls[0])  # loads the cached identity
+        few = [self.changelist_queries(url) for url in urls]
+        self.add_students(6)
+        for student in Student.objects.all():
+            Grade.objects.get_or_create(student=student, assignment=assignment, marks_obtained=5, graded_by=self.teacher)
+        self.assertEqual([self.changelist_queries(url) for url in urls], few)
+        self.assertEqual(self.client.get('/admin/core/grade/add/').status_code, 200)
+
+    def test_large_counts_come_from_the_planner(self):
+        self.add_students(3)
+        paginator = core_admin.EstimatedCountPaginator(Enrollment.objects.order_by('pk'), 50)
+        with mock.patch('core.queryplans.estimated_rows', return_value=25_000_000), self.assertNumQueries(0):
+            self.assertEqual(paginator.count, 25_000_000)
+        paginator = core_admin.EstimatedCountPaginator(Enrollment.objects.order_by('pk'), 50)
+        with mock.patch('core.queryplans.estimated_rows', return_value=40):
+            self.assertEqual(paginator.count, 6)
+        # SQLite has no planner estimates
+        self.assertIsNone(queryplans.estimated_rows(Enrollment.objects.all()))
+
+    def test_bulk_actions_are_single_updates(self):
+        self.add_students(3)
+        closing = Enrollment.objects.filter(course=self.courses[0])
+        model_admin = core_admin.EnrollmentAdmin(Enrollment, core_admin.admin.site)
+        request = RequestFactory().post('/')
+        with mock.patch.object(model_admin, 'message_user') as message, \
+                CaptureQueriesContext(connection) as captured, self.captureOnCommitCallbacks(execute=True):
+            model_admin.close_selected(request, closing)
+        updates = [q['sql'] for q in captured if q['sql'].startswith('UPDATE "core_enrollment"')]
+        self.assertEqual(len(updates), 1)
+        message.assert_called_once_with(request, 'Closed 3 enrollments', core_admin.messages.SUCCESS)
+        self.courses[0].refresh_from_db()
+        self.teacher.refresh_from_db()
+        self.assertEqual((self.courses[0].enrolled_count, self.teacher.student_load), (0, 3))
+
+        Assignment.objects.create(course=self.courses[1], teacher=self.teacher, title='Rent', max_marks=10, due_date=timezone.now())
+        model_admin = core_admin.AssignmentAdmin(Assignment, core_admin.admin.site)
+        with mock.patch.object(model_admin, 'message_user'), self.assertNumQueries(1):
+            model_admin.deactivate_selected(request, Assignment.objects.all())
+        self.assertFalse(Assignment.objects.filter(is_active=True).exists())
+
+
+class PrerequisiteGraphTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.department = Department.objects.create(name='Mathematics', code='MATH')
+        self.teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        self.teacher.department = self.department
+        self.teacher.save()
+        self.student = User.objects.create_user(username='student', password='pass', role=User.STUDENT).student
+        self.student.department = self.department
+        self.student.save()
+        self.calculus, self.analysis, self.topology = [
+            Course.objects.create(name=name, code=code, department=self.department)
+            for name, code in [('Calculus', 'MATH101'), ('Analysis', 'MATH201'), ('Topology', 'MATH301')]
+        ]
+
+    def require(self, course, prerequisite):
+        with self.captureOnCommitCallbacks(execute=True):
+            return CoursePrerequisite.objects.create(course=course, prerequisite=prerequisite)
+
+    def complete(self, course, marks):
+        CourseGradeTotal.objects.create(student=self.student, course=course, marks_obtained_total=marks, max_marks_total=100)
+
+    def test_closure_follows_added_and_removed_edges(self):
+        graph = prerequisites.PrerequisiteGraph([(3, 2), (2, 1), (4, 1)])
+        self.assertEqual(graph.chain(3), {1, 2})
+        self.assertEqual(graph.descendants[1], {2, 3, 4})
+        with self.assertRaises(prerequisites.PrerequisiteCycle):
+            graph.add(1, 3)
+        graph.add(3, 1)
+        graph.remove(2, 1)
+        self.assertEqual(graph.chain(2), set())
+        self.assertEqual(graph.chain(3), {1, 2})
+        graph.remove(3, 1)
+        self.assertEqual(graph.chain(3), {2})
+        self.assertEqual(graph.descendants[1], {4})
+        self.assertEqual(graph.eligible([2, 3, 4], {2}), [2, 3])
+
+    def test_cycles_are_rejected(self):
+        self.require(self.analysis, self.calculus)
+        self.require(self.topology, self.analysis)
+        with self.assertRaises(prerequisites.PrerequisiteCycle):
+            CoursePrerequisite.objects.create(course=self.calculus, prerequisite=self.topology)
+        self.assertEqual(prerequisites.graph().chain(self.topology.pk), {self.calculus.pk, self.analysis.pk})
+
+    def test_other_processes_reload_after_a_change(self):
+        self.require(self.analysis, self.calculus)
+        stale = prerequisites.graph()
+        cache.delete(prerequisites.VERSION_KEY)
+        self.require(self.topology, self.analysis)
+        with mock.patch.object(prerequisites, '_graph', stale), mock.patch.object(prerequisites, '_graph_version', 'old'):
+            with self.assertNumQueries(1):
+                current = prerequisites.graph()
+        self.assertEqual(current.chain(self.topology.pk), {self.calculus.pk, self.analysis.pk})
+        link = CoursePrerequisite.objects.get(course=self.analysis)
+        with self.captureOnCommitCallbacks(execute=True):
+            link.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(prerequisites.graph().chain(self.topology.pk), {self.analysis.pk})
+
+    def test_a_stale_graph_is_reloaded_rather_than_edited(self):
+        self.require(self.analysis, self.calculus)
+        prerequisites.graph()
+        # Another process adds an edge and publishes its version
+        CoursePrerequisite.objects.bulk_create([CoursePrerequisite(course=self.topology, prerequisite=self.analysis)])
+        cache.set(prerequisites.VERSION_KEY, 'elsewhere', None)
+        link = CoursePrerequisite.objects.get(course=self.analysis)
+        with self.captureOnCommitCallbacks(execute=True):
+            link.delete()
+        self.assertEqual(prerequisites.graph().chain(self.topology.pk), {self.analysis.pk})
+
+    def test_available_courses_need_completed_chains(self):
+        self.require(self.analysis, self.calculus)
+        self.require(self.topology, self.analysis)
+        other = User.objects.create_user(username='other', password='pass', role=User.STUDENT).student
+        other.department = self.department
+        other.save()
+        self.complete(self.calculus, 72)
+        CourseGradeTotal.objects.create(student=other, course=self.calculus, marks_obtained_total=30, max_marks_total=100)
+        with self.assertNumQueries(3):
+            available = prerequisites.available_courses([self.student, other])
+        self.assertEqual(sorted(available[self.student.pk]), [self.calculus.pk, self.analysis.pk])
+        self.assertEqual(available[other.pk], [self.calculus.pk])
+        self.complete(self.analysis, 50)
+        Enrollment.objects.create(student=self.student, course=self.calculus, teacher=self.teacher)
+        self.assertEqual(prerequisites.eligible_courses(self.student, [self.analysis, self.topology]), [self.analysis, self.topology])
+        self.assertEqual(sorted(prerequisites.available_courses([self.student])[self.student.pk]), [self.analysis.pk, self.topology.pk])
+
+    def test_enroll_requires_prerequisites(self):
+        self.require(self.analysis, self.calculus)
+        with self.assertRaises(enrollment.MissingPrerequisites):
+            enrollment.enroll(self.student, self.analysis)
+        self.analysis.refresh_from_db()
+        self.assertEqual(self.analysis.enrolled_count, 0)
+        self.complete(self.calculus, 90)
+        enrollment.enroll(self.student, self.analysis)
+
+    def test_admin_inline_rejects_cycles(self):
+        self.require(self.analysis, self.calculus)
+        admin_user = User.objects.create_superuser(username='admin', password='pass', email='admin@example.com')
+        request = RequestFactory().post('/')
+        request.user = admin_user
+        inline = core_admin.PrerequisiteInline(Course, core_admin.admin.site)
+        FormSet = inline.get_formset(request, self.calculus)
+        data = {
+            'prerequisite_links-TOTAL_FORMS': '1', 'prerequisite_links-INITIAL_FORMS': '0',
+            'prerequisite_links-0-prerequisite': str(self.analysis.pk),
+        }
+        self.assertFalse(FormSet(data, instance=self.calculus, prefix='prerequisite_links').is_valid())
+        data['prerequisite_links-0-prerequisite'] = str(self.topology.pk)
+        self.assertTrue(FormSet(data, instance=self.calculus, prefix='prerequisite_links').is_valid())
+
+
+class TimetableTests(TestCase):
+
+    def setUp(self):
+        today = timezone.localdate()
+        self.term = Term.objects.create(
+            name='Current', code='CUR', start_date=today - timezone.timedelta(days=30),
+            end_date=today + timezone.timedelta(days=60),
+        )
+        self.department = Department.objects.create(name='History', code='HIST')
+        self.teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        self.teacher.department = self.department
+        self.teacher.save()
+        self.students = [
+            User.objects.create_user(username=f'student{n}', password='pass', role=User.STUDENT).student
+            for n in range(3)
+        ]
+        self.ancient, self.medieval, self.modern = [
+            Course.objects.create(name=name, code=code, department=self.department)
+            for name, code in [('Ancient', 'HIST101'), ('Medieval', 'HIST102'), ('Modern', 'HIST103')]
+        ]
+
+    def slot(self, course, weekday, start, end, room='', teacher=None):
+        return MeetingSlot.objects.create(
+            term=self.term, course=course, weekday=weekday, room=room, teacher=teacher,
+            start_time=timezone.datetime.strptime(start, '%H:%M').time(),
+            end_time=timezone.datetime.strptime(end, '%H:%M').time(),
+        )
+
+    def test_weekly_index_and_sweep(self):
+        intervals = [(0, 60, 'a'), (30, 90, 'b'), (90, 120, 'c'), (200, 300, 'd'), (10, 20, 'e')]
+        index = timetable.WeeklyIndex(intervals)
+        self.assertTrue(index.overlaps(100, 110))
+        self.assertFalse(index.overlaps(120, 200))
+        self.assertEqual(sorted(index.conflicts(15, 40)), ['a', 'b', 'e'])
+        self.assertEqual(index.conflicts(300, 400), [])
+        self.assertEqual(
+            sorted(tuple(sorted(pair)) for pair in timetable.sweep(intervals)),
+            [('a', 'b'), ('a', 'e')],
+        )
+        start, end = timetable.interval(1, timezone.datetime(2026, 1, 1, 9).time(), timezone.datetime(2026, 1, 1, 10).time())
+        self.assertEqual((start, end), (24 * 3600 + 9 * 3600, 24 * 3600 + 10 * 3600))
+
+    def test_enroll_rejects_clashes(self):
+        self.slot(self.ancient, 0, '09:00', '10:00')
+        self.slot(self.medieval, 0, '09:30', '10:30')
+        self.slot(self.modern, 0, '10:00', '11:00')
+        self.slot(self.modern, 2, '09:00', '10:00')
+        enrollment.enroll(self.students[0], self.ancient)
+        with self.assertNumQueries(2):
+            clashes = timetable.enrollment_conflicts([self.students[0].pk], self.medieval, self.term)
+        self.assertEqual(len(clashes[self.students[0].pk]), 1)
+        with self.assertRaises(enrollment.ScheduleConflict):
+            enrollment.enroll(self.students[0], self.medieval)
+        self.medieval.refresh_from_db()
+        self.assertEqual(self.medieval.enrolled_count, 0)
+        enrollment.enroll(self.students[0], self.modern)
+        enrollment.enroll(self.students[1], self.medieval)
+
+    def test_cohort_is_all_or_nothing_on_clashes(self):
+        self.slot(self.ancient, 3, '14:00', '16:00')
+        self.slot(self.medieval, 3, '15:00', '16:00')
+        enrollment.enroll(self.students[2], self.ancient)
+        with self.assertRaises(enrollment.ScheduleConflict):
+            enrollment.enroll_cohort(self.medieval, self.students)
+        self.assertFalse(Enrollment.objects.filter(course=self.medieval).exists())
+        self.assertEqual(len(enrollment.enroll_cohort(self.medieval, self.students[:2])), 2)
+
+    def test_validate_term_reports_every_kind(self):
+        other = User.objects.create_user(username='other', password='pass', role=User.TEACHER).teacherprofile
+        first = self.slot(self.ancient, 1, '09:00', '10:00', room='A1', teacher=self.teacher)
+        second = self.slot(self.medieval, 1, '09:30', '10:30', room='B2', teacher=self.teacher)
+        third = self.slot(self.modern, 1, '09:45', '10:15', room='A1', teacher=other)
+        self.slot(self.modern, 4, '09:00', '10:00', room='B2', teacher=self.teacher)
+        for course in (self.ancient, self.modern):
+            Enrollment.objects.create(student=self.students[0], course=course, teacher=self.teacher, term=self.term)
+        Enrollment.objects.create(student=self.students[1], course=self.medieval, teacher=self.teacher, term=self.term)
+        with self.assertNumQueries(2):
+            report = timetable.validate_term(self.term)
+        self.assertEqual(report['slots'], 4)
+        self.assertEqual([set(pair) for pair in report['teacher']], [{first.pk, second.pk}])
+        self.assertEqual([set(pair) for pair in report['room']], [{first.pk, third.pk}])
+        self.assertEqual(
+            [(student_id, {a, b}) for student_id, a, b in report['student']],
+            [(self.students[0].pk, {first.pk, third.pk})],
+        )
+        with self.assertRaisesMessage(CommandError, '1 teacher, 1 room and 1 student conflicts'):
+            call_command('check_timetable', stdout=StringIO())
+
+    def test_validate_term_allows_overlapping_slots_of_one_course(self):
+        lecture = self.slot(self.ancient, 2, '09:00', '11:00', room='A1', teacher=self.teacher)
+        self.slot(self.ancient, 2, '10:00', '12:00', room='Lab')
+        clash = self.slot(self.modern, 2, '10:30', '11:30', room='B2')
+        for student in self.students[:2]:
+            Enrollment.objects.create(student=student, course=self.ancient, teacher=self.teacher, term=self.term)
+        Enrollment.objects.create(student=self.students[0], course=self.modern, teacher=self.teacher, term=self.term)
+        report = timetable.validate_term(self.term)
+        # The modern slot clashes with both ancient slots, the ancient slots not with each other
+        self.assertEqual(len(report['student']), 2)
+        self.assertEqual({student_id for student_id, _, _ in report['student']}, {self.students[0].pk})
+        self.assertIn((self.students[0].pk, {lecture.pk, clash.pk}), [(s, {a, b}) for s, a, b in report['student']])
+
+    def test_admin_form_rejects_double_booking(self):
+        self.slot(self.ancient, 0, '09:00', '10:00', room='A1')
+        data = {
+            'term': self.term.pk, 'course': self.medieval.pk, 'room': 'A1', 'weekday': 0,
+            'start_time': '09:30', 'end_time': '11:00',
+        }
+        form = core_admin.MeetingSlotForm(data)
+        self.assertFalse(form.is_valid())
+        self.assertIn('HIST101', str(form.errors))
+        data['room'] = 'A2'
+        self.assertTrue(core_admin.MeetingSlotForm(data).is_valid())
+
+
+class ClassRankingTests(TestCase):
+
+    def setUp(self):
+        self.physics = Department.objects.create(name='Physics', code='PHYS')
+        self.chemistry = Department.objects.create(name='Chemistry', code='CHEM')
+        self.teacher = User.objects.create_user(username='teacher', password='pass', role=User.TEACHER).teacherprofile
+        self.mechanics = Course.objects.create(name='Mechanics', code='PHYS101', department=self.physics)
+        self.optics = Course.objects.create(name='Optics', code='PHYS201', department=self.physics)
+        self.exam = self.assignment(self.mechanics)
+        self.students = []
+        for n, department in enumerate([self.physics] * 4 + [self.chemistry]):
+            student = User.objects.create_user(username=f'student{n}', password='pass', role=User.STUDENT).student
+            student.department = department
+            student.save()
+            self.students.append(student)
+        for student, marks in zip(self.students, [90, 70, 70, 40, 60]):
+            self.grade(student, self.exam, marks)
+
+    def assignment(self, course):
+        return Assignment.objects.create(
+            course=course, teacher=self.teacher, title=course.code, assignment_type='final',
+            max_marks=100, due_date=timezone.now(),
+        )
+
+    def grade(self, student, assignment, marks):
+        return Grade.objects.create(student=student, assignment=assignment, marks_obtained=marks, graded_by=self.teacher)
+
+    def ranks(self, scope, scope_id):
+        return list(ClassRank.objects.filter(scope=scope, scope_id=scope_id).order_by('student_id').values_list(
+            'rank', 'dense_rank', 'percent_rank', 'decile', 'cohort_size'
+        ))
+
+    def test_refresh_ranks_the_queued_partitions(self):
+        self.assertEqual(
+            set(RankingRefresh.objects.values_list('scope', 'scope_id')),
+            {('department', self.physics.pk), ('department', self.chemistry.pk), ('course', self.mechanics.pk)},
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            written = rankings.refresh()
+        self.assertEqual(written, {'department': 5, 'course': 5})
+        self.assertFalse(RankingRefresh.objects.exists())
+        self.assertEqual(self.ranks('department', self.physics.pk), [
+            (1, 1, 0.0, 1, 4), (2, 2, 1 / 3, 2, 4), (2, 2, 1 / 3, 3, 4), (4, 3, 1.0, 4, 4),
+        ])
+        self.assertEqual(self.ranks('department', self.chemistry.pk), [(1, 1, 0.0, 1, 1)])
+        self.assertEqual(
+            [rank for rank, *_ in self.ranks('course', self.mechanics.pk)], [1, 2, 2, 5, 4],
+        )
+        self.assertEqual(ClassRank.objects.get(student=self.students[0], scope='course').score, Decimal('90.00'))
+
+    def test_only_changed_partitions_are_recomputed(self):
+        rankings.refresh()
+        untouched = ClassRank.objects.get(student=self.students[4], scope='department').computed_at
+        self.grade(self.students[3], self.assignment(self.optics), 100)
+        self.assertEqual(
+            set(RankingRefresh.objects.values_list('scope', 'scope_id')),
+            {('department', self.physics.pk), ('course', self.optics.pk)},
+        )
+        self.assertEqual(rankings.refresh(), {'department': 4, 'course': 1})
+        self.assertEqual(ClassRank.objects.get(student=self.students[4], scope='department').computed_at, untouched)
+        self.assertEqual(ClassRank.objects.get(student=self.students[3], scope='department').rank, 2)
+
+    def test_moving_department_reranks_both(self):
+        rankings.refresh()
+        self.students[3].department = self.chemistry
+        self.students[3].save()
+        rankings.refresh()
+        self.assertEqual([size for *_, size in self.ranks('department', self.physics.pk)], [3, 3, 3])
+        self.assertEqual([rank for rank, *_ in self.ranks('department', self.chemistry.pk)], [2, 1])
+
+    @override_settings(DEANS_LIST_SIZE=2)
+    def test_dashboard_and_deans_list_read_the_snapshot(self):
+        rankings.refresh()
+        with self.assertNumQueries(1):
+            ranks = rankings.ranks_for(self.students[1])
+        self.assertEqual((ranks['department'].rank, list(ranks['courses'])), (2, [self.mechanics.pk]))
+        self.assertEqual([rank.student for rank in rankings.deans_list(self.physics)], self.students[:3])
+        request = RequestFactory().get('/student-dashboard/')
+        request.user = self.students[1].user
+        with mock.patch('core.views.render', return_value=HttpResponse()) as render:
+            views.student_dashboard(request)
+        context = render.call_args[0][2]
+        self.assertEqual((context['ranks']['department'].rank, context['deans_list_size']), (2, 2))
+        get_template('student/dashboard.html')
+        output = StringIO()
+        call_command('refresh_rankings', '--full', '--deans-list', 'PHYS', stdout=output)
+        self.assertIn('Ranked 5 students in departments and 5 in courses', output.getvalue())
+        self.assertIn(self.students[2].student_id, output.getvalue())
@@ -0,0 +1,182 @@
+# Timetable conflict detection
+#
+# A MeetingSlot repeats every week, so each one is placed on a single axis of
+# seconds from Monday 00:00, and two slots clash when their half-open
+# intervals overlap. Conflicts are never found by comparing slots pairwise:
+#
+# - WeeklyIndex keeps one timetable's intervals sorted by start, with a
+#   running maximum of their ends, so whether a new interval overlaps any of
+#   them takes a binary search.
+# - sweep() finds every overlapping pair among a set of intervals in
+#   O(n log n + k): it visits them by start and keeps a heap of the ones
+#   still running, each of which clashes with the interval being visited.
+#
+# enroll() and enroll_cohort() check the course's slots against each
+# student's WeeklyIndex. validate_term() checks a whole term's timetable:
+# two queries load the slots and the active enrollments, then each teacher's,
+# each room's and each student's slots are swept. Two slots of the same course
+# may overlap, e.g. a lecture and its lab sections; that is not a clash for
+# the students of the course.
+
+import heapq
+from bisect import bisect_left
+from itertools import accumulate, count
+
+from django.db.models import Q
+
+from .models import Enrollment, MeetingSlot
+
+SECONDS_PER_DAY = 24 * 3600
+
+SLOT_FIELDS = ('pk', 'weekday', 'start_time', 'end_time')
+
+
+def _seconds(time):
+    return time.hour * 3600 + time.minute * 60 + time.second
+
+
+def interval(weekday, start_time, end_time):
+    """A weekly slot as (start, end) seconds from Monday 00:00"""
+    day = weekday * SECONDS_PER_DAY
+    return day + _seconds(start_time), day + _seconds(end_time)
+
+
+class WeeklyIndex:
+    """One timetable's (start, end, slot) intervals, answering overlap queries in O(log n)"""
+
+    def __init__(self, intervals=()):
+        self.intervals = sorted(intervals, key=lambda item: item[:2])
+        self.starts = [start for start, _, _ in self.intervals]
+        # reach[i] is the latest end among the first i + 1 intervals
+        self.reach = list(accumulate((end for _, end, _ in self.intervals), max))
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def overlaps(self, start, end):
+        """Whether any interval overlaps [start, end)"""
+        earlier = bisect_left(self.starts, end)
+        return earlier > 0 and self.reach[earlier - 1] > start
+
+    def conflicts(self, start, end):
+        """The slots of the intervals overlapping [start, end)"""
+        found = []
+        position = bisect_left(self.starts, end) - 1
+        while position >= 0 and self.reach[position] > start:
+            if self.intervals[position][1] > start:
+                found.append(self.intervals[position][2])
+            position -= 1
+        return found
+
+
+def sweep(intervals):
+    """Every overlapping pair among (start, end, slot) intervals, as (slot, slot)"""
+    running = []
+    order = count()
+    pairs = []
+    for start, end, slot in sorted(intervals, key=lambda item: item[:2]):
+        while running and running[0][0] <= start:
+            heapq.heappop(running)
+        pairs.extend((other, slot) for _, _, other in running)
+        heapq.heappush(running, (end, next(order), slot))
+    return pairs
+
+
+def _intervals(rows):
+    return [(*interval(weekday, start_time, end_time), pk) for pk, weekday, start_time, end_time in rows]
+
+
+def enrollment_conflicts(student_ids, course, term):
+    """Slots of course that clash with each student's timetable in term
+
+    Returns {student id: [(course slot, clashing slot)]} for the students
+    with a clash, from two queries.
+    """
+    slots = _intervals(MeetingSlot.objects.filter(term=term, course=course).values_list(*SLOT_FIELDS))
+    if not slots or not student_ids:
+        return {}
+    timetables = {}
+    for student_id, *row in MeetingSlot.objects.filter(
+        term=term,
+        course__enrollment__student_id__in=student_ids,
+        course__enrollment__term=term,
+        course__enrollment__is_active=True,
+    ).exclude(course=course).values_list('course__enrollment__student_id', *SLOT_FIELDS):
+        timetables.setdefault(student_id, []).extend(_intervals([row]))
+
+    clashes = {}
+    for student_id, intervals in timetables.items():
+        index = WeeklyIndex(intervals)
+        found = [(slot, other) for start, end, slot in slots for other in index.conflicts(start, end)]
+        if found:
+            clashes[student_id] = found
+    return clashes
+
+
+def slot_conflicts(slot):
+    """Other slots of the term that share the slot's teacher or room while it runs"""
+    shared = Q()
+    if slot.teacher_id:
+        shared |= Q(teacher_id=slot.teacher_id)
+    if slot.room:
+        shared |= Q(room=slot.room)
+    if not shared:
+        return MeetingSlot.objects.none()
+    return MeetingSlot.objects.filter(
+        shared,
+        term_id=slot.term_id,
+        weekday=slot.weekday,
+        start_time__lt=slot.end_time,
+        end_time__gt=slot.start_time,
+    ).exclude(pk=slot.pk)
+
+
+def validate_term(term):
+    """Teacher, room and student conflicts in a term's timetable, from two queries
+
+    Returns {'slots': count, 'teacher': [(slot, slot)], 'room': [(slot, slot)],
+    'student': [(student id, slot, slot)]} with slot primary keys.
+    """
+    by_course, by_teacher, by_room = {}, {}, {}
+    course_of = {}
+    rows = MeetingSlot.objects.filter(term=term).values_list(
+        'pk', 'course_id', 'teacher_id', 'room', 'weekday', 'start_time', 'end_time'
+    )
+    total = 0
+    for pk, course_id, teacher_id, room, weekday, start_time, end_time in rows.iterator(chunk_size=5000):
+        item = (*interval(weekday, start_time, end_time), pk)
+        by_course.setdefault(course_id, []).append(item)
+        course_of[pk] = course_id
+        if teacher_id is not None:
+            by_teacher.setdefault(teacher_id, []).append(item)
+        if room:
+            by_room.setdefault(room, []).append(item)
+        total += 1
+
+    courses = {}
+    for student_id, course_id in Enrollment.objects.filter(term=term, is_active=True).values_list(
+        'student_id', 'course_id'
+    ).iterator(chunk_size=5000):
+        if course_id in by_course:
+            courses.setdefault(student_id, []).append(course_id)
+
+    # Students taking the same courses share their clashes
+    swept = {}
+    students = []
+    for student_id, course_ids in courses.items():
+        if len(course_ids) < 2:
+            continue
+        key = tuple(sorted(course_ids))
+        if key not in swept:
+            swept[key] = [
+                pair for pair in sweep(item for course_id in key for item in by_course[course_id])
+                if course_of[pair[0]] != course_of[pair[1]]
+            ]
+        students.extend((student_id, *pair) for pair in swept[key])
+
+    return {
+        'slots': total,
+        'teacher': [pair for intervals in by_teacher.values() for pair in sweep(intervals)],
+        'room': [pair for intervals in by_room.values() for pair in sweep(intervals)],
+        'student': students,
+    }
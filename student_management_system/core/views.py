@@ -1,13 +1,34 @@
+import csv
+import json
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Avg, Count, Q
-from django.core.paginator import Paginator
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from django.db.models import Count, Max, OuterRef, Q, Subquery
 from django.utils import timezone
-from .models import User, Department, Course, StudentProfile, TeacherProfile, Enrollment, Grade, Announcement, Assignment
+from django.utils.dateparse import parse_date
+from . import exports, fragments, rankings
+from . import search as search_index
+from .models import User, Department, Course, Student, TeacherProfile, Enrollment, Grade, Announcement, Assignment, Term
 from .forms import GradeForm, AnnouncementForm, CourseForm
+from .analytics import course_report
+from .attendance import course_matrix, mark_session
+from .audience import announcements_for, get_audience
+from .conditional import conditional_page
+from .enrollment import AlreadyEnrolled, EnrollmentError, enroll
+from .fanout import gather
+from .gradebook import import_grades, read_upload
+from .identity import profile_or_404
+from .notifications import unread_count
+from .pagination import InvalidCursor, keyset_page, page_size_from
+from .prerequisites import eligible_courses
+from .profiling import query_budget, snapshot
+from .routing import read_alias, replica_reads
+from .stats import aget_dashboard_stats, get_dashboard_stats
 
 # Authentication Views
 def login_view(request):
@@ -45,23 +66,65 @@ def is_student(user):
     return user.is_authenticated and user.role == User.STUDENT
 
 # Dashboard Views
+# The templates cache their panels under version tokens from core.fragments,
+# read before anything the panels show. Global groups used by each dashboard:
+ADMIN_FRAGMENTS = dict(enrollment_activity=None, announcements=None, courses=None, people=None)
+TEACHER_FRAGMENTS = dict(courses=None, people=None)
+STUDENT_FRAGMENTS = dict(announcements=None, courses=None, people=None, rankings=None)
+
+# Conditional GET validators (core.conditional): the fragment groups, newest
+# row timestamps and audience behind each page, read in a single query.
+def _newest(queryset, owner, field):
+    # Max(field) over the owner's rows as a correlated subquery
+    return Subquery(queryset.values(owner).annotate(newest=Max(field)).values('newest')[:1])
+
+def _newest_announcement(request):
+    # Walks announcement_updated_idx down to the first visible announcement
+    return Subquery(announcements_for(get_audience(request)).order_by('-updated_at').values('updated_at')[:1])
+
+def _student_dashboard_validators(request):
+    row = Student.objects.filter(user=request.user).annotate(
+        graded_at=_newest(Grade.objects.filter(student=OuterRef('pk')), 'student', 'updated_at'),
+        enrolled_at=_newest(Enrollment.objects.filter(student=OuterRef('pk')), 'student', 'enrolled_date'),
+        announced_at=_newest_announcement(request),
+    ).values_list('pk', 'graded_at', 'enrolled_at', 'announced_at').first()
+    if row is None:
+        return None
+    pk, *changed = row
+    return dict(grades=pk, enrollments=pk, **STUDENT_FRAGMENTS), changed, None
+
+def _teacher_dashboard_validators(request):
+    row = TeacherProfile.objects.filter(user=request.user).annotate(
+        graded_at=_newest(Grade.objects.filter(graded_by=OuterRef('pk')), 'graded_by', 'updated_at'),
+        enrolled_at=_newest(Enrollment.objects.filter(teacher=OuterRef('pk')), 'teacher', 'enrolled_date'),
+    ).values_list('pk', 'graded_at', 'enrolled_at').first()
+    if row is None:
+        return None
+    pk, *changed = row
+    return dict(teaching=pk, **TEACHER_FRAGMENTS), changed, None
+
+def _announcements_validators(request):
+    audience = get_audience(request)
+    newest = announcements_for(audience).order_by('-updated_at').values_list('updated_at', flat=True).first()
+    return dict(announcements=None, people=None), [newest], audience
+
+@query_budget(8)
 @login_required
 @user_passes_test(is_admin)
+@replica_reads
 def admin_dashboard(request):
-    stats = {
-        'total_students': User.objects.filter(role=User.STUDENT).count(),
-        'total_teachers': User.objects.filter(role=User.TEACHER).count(),
-        'total_courses': Course.objects.count(),
-        'total_departments': Department.objects.count(),
-        'recent_enrollments': Enrollment.objects.select_related('student__user', 'course').order_by('-enrolled_date')[:5],
-        'recent_announcements': Announcement.objects.order_by('-created_at')[:5],
-    }
-    return render(request, 'admin/dashboard.html', stats)
+    fragment_versions = fragments.context(**ADMIN_FRAGMENTS)
+    stats = get_dashboard_stats()
+    return render(request, 'admin/dashboard.html', {**stats, 'fragments': fragment_versions})
 
+@query_budget(7)
 @login_required
 @user_passes_test(is_teacher)
+@replica_reads
+@conditional_page(_teacher_dashboard_validators)
 def teacher_dashboard(request):
-    teacher_profile = get_object_or_404(TeacherProfile, user=request.user)
+    teacher_profile = profile_or_404(request.user, TeacherProfile)
+    fragment_versions = fragments.context(teaching=teacher_profile.pk, **TEACHER_FRAGMENTS)
     
     enrollments = Enrollment.objects.filter(teacher=teacher_profile).select_related('course', 'student__user')
     courses = Course.objects.filter(enrollment__teacher=teacher_profile).distinct()
@@ -69,43 +132,118 @@ def teacher_dashboard(request):
     stats = {
         'total_courses': courses.count(),
         'total_students': enrollments.count(),
-        'recent_grades': Grade.objects.filter(assignment__course__in=courses).order_by('-graded_at')[:10],
+        'recent_grades': Grade.objects.filter(assignment__course__in=courses).select_related(
+            'student__user', 'assignment__course'
+        ).with_letter_grades().order_by('-graded_at')[:10],
         'courses': courses,
         'teacher_profile': teacher_profile,
+        'fragments': fragment_versions,
     }
     return render(request, 'teacher/dashboard.html', stats)
 
+@query_budget(10)
 @login_required
 @user_passes_test(is_student)
+@replica_reads
+@conditional_page(_student_dashboard_validators)
 def student_dashboard(request):
-    student_profile = get_object_or_404(StudentProfile, user=request.user)
+    student_profile = profile_or_404(request.user, Student)
+    fragment_versions = fragments.context(
+        grades=student_profile.pk, enrollments=student_profile.pk, **STUDENT_FRAGMENTS
+    )
     
     enrollments = Enrollment.objects.filter(student=student_profile).select_related('course', 'teacher__user')
-    grades = Grade.objects.filter(student=student_profile).select_related('assignment__course')
-    
-    # Calculate GPA
-    if grades.exists():
-        avg_percentage = grades.aggregate(avg=Avg('marks_obtained'))['avg'] or 0
-        gpa = (avg_percentage / 100) * 4.0
-        student_profile.gpa = round(gpa, 2)
-        student_profile.save()
+    grades = Grade.objects.filter(student=student_profile).select_related('assignment__course').with_letter_grades()
     
     stats = {
         'enrollments': enrollments,
         'grades': grades.order_by('-graded_at'),
         'gpa': student_profile.gpa,
+        'ranks': rankings.ranks_for(student_profile),
+        'deans_list_size': rankings.deans_list_size(),
         'student_profile': student_profile,
-        'recent_announcements': Announcement.objects.filter(
-            Q(target_audience='all') | Q(target_audience='students')
-        ).order_by('-created_at')[:5],
+        'recent_announcements': announcements_for(get_audience(request)).order_by('-created_at')[:5],
+        'fragments': fragment_versions,
     }
     return render(request, 'student/dashboard.html', stats)
 
+# Async Dashboard Views
+# The same dashboards for ASGI deployments: independent reads run concurrently
+# through core.fanout instead of one after another.
+async def _aget_or_404(model, **lookup):
+    try:
+        return await model.objects.aget(**lookup)
+    except model.DoesNotExist:
+        raise Http404(f'No {model._meta.verbose_name} matches the given query.')
+
+@query_budget(8)
+@login_required
+@user_passes_test(is_admin)
+@replica_reads
+async def admin_dashboard_async(request):
+    fragment_versions = await sync_to_async(fragments.context)(**ADMIN_FRAGMENTS)
+    stats = await aget_dashboard_stats()
+    return await sync_to_async(render)(request, 'admin/dashboard.html', {**stats, 'fragments': fragment_versions})
+
+@query_budget(6)
+@login_required
+@user_passes_test(is_teacher)
+@replica_reads
+async def teacher_dashboard_async(request):
+    teacher_profile = await _aget_or_404(TeacherProfile, user=await request.auser())
+    fragment_versions = await sync_to_async(fragments.context)(teaching=teacher_profile.pk, **TEACHER_FRAGMENTS)
+    courses = Course.objects.filter(enrollment__teacher=teacher_profile).distinct()
+    reads = await gather(
+        courses=lambda: list(courses),
+        total_students=Enrollment.objects.filter(teacher=teacher_profile).count,
+        recent_grades=lambda: list(
+            Grade.objects.filter(assignment__course__in=courses).select_related(
+                'student__user', 'assignment__course'
+            ).with_letter_grades().order_by('-graded_at')[:10]
+        ),
+    )
+    return await sync_to_async(render)(request, 'teacher/dashboard.html', {
+        **reads,
+        'total_courses': len(reads['courses']),
+        'teacher_profile': teacher_profile,
+        'fragments': fragment_versions,
+    })
+
+@query_budget(10)
+@login_required
+@user_passes_test(is_student)
+@replica_reads
+async def student_dashboard_async(request):
+    user = await request.auser()
+    student_profile = await _aget_or_404(Student, user=user)
+    fragment_versions = await sync_to_async(fragments.context)(
+        grades=student_profile.pk, enrollments=student_profile.pk, **STUDENT_FRAGMENTS
+    )
+    audience = await sync_to_async(get_audience)(request, user)
+    reads = await gather(
+        enrollments=lambda: list(
+            Enrollment.objects.filter(student=student_profile).select_related('course', 'teacher__user')
+        ),
+        grades=lambda: list(
+            Grade.objects.filter(student=student_profile).select_related('assignment__course')
+            .with_letter_grades().order_by('-graded_at')
+        ),
+        recent_announcements=lambda: list(announcements_for(audience).order_by('-created_at')[:5]),
+        ranks=lambda: rankings.ranks_for(student_profile),
+    )
+    return await sync_to_async(render)(request, 'student/dashboard.html', {
+        **reads,
+        'gpa': student_profile.gpa,
+        'deans_list_size': rankings.deans_list_size(),
+        'student_profile': student_profile,
+        'fragments': fragment_versions,
+    })
+
 # Grade Management
 @login_required
 @user_passes_test(is_teacher)
 def grade_management(request):
-    teacher_profile = get_object_or_404(TeacherProfile, user=request.user)
+    teacher_profile = profile_or_404(request.user, TeacherProfile)
     
     if request.method == 'POST':
         student_id = request.POST.get('student_id')
@@ -113,7 +251,7 @@ def grade_management(request):
         marks_obtained = request.POST.get('marks_obtained')
         feedback = request.POST.get('feedback')
         
-        student = get_object_or_404(StudentProfile, student_id=student_id)
+        student = get_object_or_404(Student, student_id=student_id)
         assignment = get_object_or_404(Assignment, id=assignment_id)
         
         Grade.objects.update_or_create(
@@ -136,39 +274,172 @@ def grade_management(request):
         'enrollments': enrollments,
     })
 
+@login_required
+@user_passes_test(is_teacher)
+@require_POST
+def grade_bulk_upload(request):
+    """Upsert a batch of grades posted as JSON: {"grades": [{...}, ...]}"""
+    teacher_profile = profile_or_404(request.user, TeacherProfile)
+    try:
+        rows = json.loads(request.body)['grades']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected a JSON object with a "grades" list'}, status=400)
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        return JsonResponse({'error': 'Expected a JSON object with a "grades" list'}, status=400)
+    return JsonResponse(import_grades(rows, teacher_profile))
+
+@login_required
+@user_passes_test(is_teacher)
+@require_POST
+def grade_import(request):
+    """Upsert grades from an uploaded CSV or XLSX file"""
+    teacher_profile = profile_or_404(request.user, TeacherProfile)
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'error': 'No file uploaded'}, status=400)
+    try:
+        result = import_grades(read_upload(upload), teacher_profile)
+    except (ValueError, UnicodeDecodeError, csv.Error) as exc:
+        return JsonResponse({'error': f'Could not read {upload.name}: {exc}'}, status=400)
+    return JsonResponse(result)
+
+# Attendance
+@login_required
+@user_passes_test(is_teacher)
+@require_POST
+def attendance_bulk_mark(request):
+    """Record a class session posted as JSON: {"course_id", "date", "records": [...]}"""
+    teacher_profile = profile_or_404(request.user, TeacherProfile)
+    try:
+        payload = json.loads(request.body)
+        course_id = int(payload['course_id'])
+        day = parse_date(payload['date'])
+        records = payload['records']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected course_id, date (YYYY-MM-DD) and a records list'}, status=400)
+    if day is None or not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        return JsonResponse({'error': 'Expected course_id, date (YYYY-MM-DD) and a records list'}, status=400)
+    return JsonResponse(mark_session(teacher_profile, course_id, day, records))
+
+@login_required
+@user_passes_test(lambda u: u.role in [User.ADMIN, User.TEACHER])
+def course_attendance(request, course_id):
+    """A course's attendance matrix and per-student percentages, optionally within ?start=&end="""
+    if request.user.role == User.TEACHER and not Enrollment.objects.filter(
+        course_id=course_id, teacher__user=request.user
+    ).exists():
+        return JsonResponse({'error': 'You do not teach this course'}, status=403)
+    try:
+        start = parse_date(request.GET.get('start') or '')
+        end = parse_date(request.GET.get('end') or '')
+    except ValueError:
+        return JsonResponse({'error': 'start and end must be YYYY-MM-DD dates'}, status=400)
+    return JsonResponse(course_matrix(course_id, start, end).as_dict())
+
+@login_required
+@user_passes_test(lambda u: u.role in [User.ADMIN, User.TEACHER])
+def course_grade_report(request, course_id):
+    """Grade distribution statistics for a course, per assignment and overall"""
+    if request.user.role == User.TEACHER and not Enrollment.objects.filter(
+        course_id=course_id, teacher__user=request.user
+    ).exists():
+        return JsonResponse({'error': 'You do not teach this course'}, status=403)
+    return JsonResponse(course_report(course_id))
+
+# Exports
+def _export_response(request, dataset, filename, **filters):
+    """Stream a dataset as ?format=csv (default) or jsonl, limited to ?start=&end= dates"""
+    format = request.GET.get('format', 'csv')
+    if format not in exports.FORMATS:
+        return JsonResponse({'error': f'format must be one of {", ".join(exports.FORMATS)}'}, status=400)
+    try:
+        start = parse_date(request.GET.get('start') or '')
+        end = parse_date(request.GET.get('end') or '')
+    except ValueError:
+        return JsonResponse({'error': 'start and end must be YYYY-MM-DD dates'}, status=400)
+    response = StreamingHttpResponse(
+        exports.stream(dataset, format, start=start, end=end, using=read_alias(), **filters),
+        content_type=exports.FORMATS[format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{format}"'
+    return response
+
+@login_required
+@replica_reads
+def export_transcript(request, student_id):
+    """Every grade of one student; students may only export their own transcript"""
+    student = get_object_or_404(Student, pk=student_id)
+    if request.user.role != User.ADMIN and student.user_id != request.user.pk:
+        return JsonResponse({'error': 'You may only export your own transcript'}, status=403)
+    return _export_response(request, 'grades', f'transcript-{student.student_id}', student=student)
+
+@login_required
+@user_passes_test(lambda u: u.role in [User.ADMIN, User.TEACHER])
+@replica_reads
+def export_gradebook(request, course_id):
+    """Every grade in one course"""
+    course = get_object_or_404(Course, pk=course_id)
+    if request.user.role == User.TEACHER and not Enrollment.objects.filter(
+        course=course, teacher__user=request.user
+    ).exists():
+        return JsonResponse({'error': 'You do not teach this course'}, status=403)
+    return _export_response(request, 'grades', f'gradebook-{course.code}', course=course)
+
+@login_required
+@user_passes_test(is_admin)
+@replica_reads
+def export_dataset(request, dataset):
+    """A whole grades, enrollments or attendance dump, usually bounded to a term with ?start=&end="""
+    if dataset not in exports.DATASETS:
+        return JsonResponse({'error': f'dataset must be one of {", ".join(exports.DATASETS)}'}, status=404)
+    return _export_response(request, dataset, dataset)
+
+# Search
+@login_required
+@user_passes_test(is_admin)
+def search(request):
+    """Typeahead search over students, teachers and courses: ?q=&kind=student,course&limit="""
+    kinds = [kind for kind in request.GET.get('kind', '').split(',') if kind] or list(search_index.KINDS)
+    unknown = set(kinds) - set(search_index.KINDS)
+    if unknown:
+        return JsonResponse({'error': f'kind must be among {", ".join(search_index.KINDS)}'}, status=400)
+    limit = page_size_from(request.GET.get('limit'), default=search_index.DEFAULT_LIMIT)
+    rows = search_index.search(request.GET.get('q', ''), kinds, limit)
+    return JsonResponse({
+        'results': [
+            {'kind': kind, 'id': object_id, 'label': label, 'detail': detail}
+            for kind, object_id, label, detail in rows
+        ],
+    })
+
 # Course Enrollment
+@query_budget(10)
 @login_required
 @user_passes_test(is_student)
 def course_enrollment(request):
-    student_profile = get_object_or_404(StudentProfile, user=request.user)
+    student_profile = profile_or_404(request.user, Student)
     
     if request.method == 'POST':
         course_id = request.POST.get('course_id')
         course = get_object_or_404(Course, id=course_id)
         
-        if not Enrollment.objects.filter(student=student_profile, course=course).exists():
-            teacher = TeacherProfile.objects.filter(department=course.department).first()
-            if teacher:
-                Enrollment.objects.create(
-                    student=student_profile,
-                    course=course,
-                    teacher=teacher
-                )
-                messages.success(request, f'Successfully enrolled in {course.name}!')
-            else:
-                messages.error(request, 'No teacher available for this course.')
-        else:
+        try:
+            enroll(student_profile, course)
+        except AlreadyEnrolled:
             messages.warning(request, 'Already enrolled in this course.')
+        except EnrollmentError as exc:
+            messages.error(request, str(exc))
+        else:
+            messages.success(request, f'Successfully enrolled in {course.name}!')
         
         return redirect('course_enrollment')
     
-    available_courses = Course.objects.filter(
+    # Courses taken in earlier terms can be taken again
+    available_courses = eligible_courses(student_profile, Course.objects.filter(
         department=student_profile.department,
-        semester=student_profile.semester,
-        is_active=True
     ).exclude(
-        enrollment__student=student_profile
-    )
+        pk__in=Enrollment.objects.filter(student=student_profile, term=Term.objects.current()).values('course_id')
+    ))
     
     enrolled_courses = Enrollment.objects.filter(
         student=student_profile,
@@ -182,21 +453,36 @@ def course_enrollment(request):
 
 # Announcements
 @login_required
+@replica_reads
+@conditional_page(_announcements_validators)
 def announcements(request):
-    if request.user.role == User.STUDENT:
-        announcements = Announcement.objects.filter(
-            Q(target_audience='all') | Q(target_audience='students'),
-            is_active=True
-        ).order_by('-created_at')
-    elif request.user.role == User.TEACHER:
-        announcements = Announcement.objects.filter(
-            Q(target_audience='all') | Q(target_audience='teachers'),
-            is_active=True
-        ).order_by('-created_at')
-    else:
-        announcements = Announcement.objects.filter(is_active=True).order_by('-created_at')
+    try:
+        page, next_cursor = keyset_page(
+            announcements_for(get_audience(request)),
+            cursor=request.GET.get('cursor'),
+            page_size=page_size_from(request.GET.get('page_size')),
+        )
+    except InvalidCursor as exc:
+        return HttpResponseBadRequest(str(exc))
     
-    return render(request, 'announcements.html', {'announcements': announcements})
+    return render(request, 'announcements.html', {'announcements': page, 'next_cursor': next_cursor})
+
+@login_required
+@replica_reads
+@conditional_page(_announcements_validators)
+def announcements_feed(request):
+    """JSON feed of the announcements page, paged with ?cursor="""
+    try:
+        page, next_cursor = keyset_page(
+            announcements_for(get_audience(request)).values(
+                'id', 'title', 'content', 'priority', 'target_audience', 'created_at', 'expires_at',
+            ),
+            cursor=request.GET.get('cursor'),
+            page_size=page_size_from(request.GET.get('page_size')),
+        )
+    except InvalidCursor as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({'results': page, 'next_cursor': next_cursor})
 
 @login_required
 @user_passes_test(lambda u: u.role in [User.ADMIN, User.TEACHER])
@@ -214,6 +500,16 @@ def create_announcement(request):
     
     return render(request, 'create_announcement.html', {'form': form})
 
+@login_required
+def notifications_unread_count(request):
+    return JsonResponse({'unread': unread_count(request.user)})
+
+@login_required
+@user_passes_test(is_admin)
+def profiling_metrics(request):
+    """Rolling per-view query and latency statistics from ProfilingMiddleware"""
+    return JsonResponse(snapshot())
+
 @login_required
 def logout_view(request):
     logout(request)
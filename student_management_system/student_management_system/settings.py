@@ -20,6 +20,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.profiling.ProfilingMiddleware',
+    'core.routing.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -27,13 +29,16 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.profiling.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'university_system.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for core.profiling
+        'BACKEND': 'core.profiling.TimedDjangoTemplates',
+        'NAME': 'django',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -58,12 +63,77 @@ DATABASES = {
         'PASSWORD': os.environ.get('DB_PASSWORD', 'password'),
         'HOST': os.environ.get('DB_HOST', 'localhost'),
         'PORT': os.environ.get('DB_PORT', '5432'),
+        # Persistent connections, checked before reuse
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas (comma-separated hosts), used by views decorated with core.routing.replica_reads
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    alias = f'replica{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'CONN_MAX_AGE': int(os.environ.get('DB_REPLICA_CONN_MAX_AGE', DATABASES['default']['CONN_MAX_AGE'])),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['core.routing.ReplicaRouter']
+# Seconds a client keeps reading from the primary after a request that wrote
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '5'))
+
+# Cache configuration
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'university-system'),
+    }
+}
+
+# Dashboard template fragments and their version tokens (core.fragments).
+# FRAGMENT_CACHE picks the backend: locmem (single process only), file, or
+# redis (any Redis-compatible server, e.g. a local one; needs redis-py).
+FRAGMENT_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'university-fragments'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'fragment_cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+_fragment_backend, _fragment_location = FRAGMENT_CACHE_BACKENDS[os.environ.get('FRAGMENT_CACHE', 'locmem')]
+CACHES['template_fragments'] = {
+    'BACKEND': _fragment_backend,
+    'LOCATION': os.environ.get('FRAGMENT_CACHE_LOCATION', _fragment_location),
+    'KEY_PREFIX': 'fragments',
+}
+# Seconds a rendered fragment is kept; writes retire fragments sooner
+FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('FRAGMENT_CACHE_TIMEOUT', '600'))
+
+# Admin dashboard statistics are kept current by signals and reconciled
+# periodically (manage.py reconcile_dashboard_stats); None keeps them forever.
+DASHBOARD_STATS_TIMEOUT = None
+
+# Views decorated with core.profiling.query_budget raise when they exceed
+# their budget instead of only logging a warning. Off unless set; the test
+# settings turn it on.
+QUERY_BUDGET_ENFORCE = os.environ.get('QUERY_BUDGET_ENFORCE', 'False').lower() == 'true'
+
+# Notifications for urgent announcements are written by an in-process worker
+# thread ('thread') or inline during the request ('sync').
+NOTIFICATION_DELIVERY = os.environ.get('NOTIFICATION_DELIVERY', 'thread')
+# Read notifications older than this are deleted by manage.py archive_terms
+NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', '180'))
+# Students ranked this high in their department by GPA make the dean's list
+DEANS_LIST_SIZE = int(os.environ.get('DEANS_LIST_SIZE', '10'))
+
 # Custom User Model
 AUTH_USER_MODEL = 'core.User'
 
+# request.user comes from a cached copy of the user and its role profile
+# (core.identity), kept for IDENTITY_CACHE_TIMEOUT seconds
+AUTHENTICATION_BACKENDS = ['core.identity.CachedModelBackend']
+IDENTITY_CACHE_TIMEOUT = int(os.environ.get('IDENTITY_CACHE_TIMEOUT', '300'))
+
 # Static files configuration
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
@@ -79,6 +149,8 @@ SECURE_CONTENT_TYPE_NOSNIFF = True
 X_FRAME_OPTIONS = 'DENY'
 
 # Session settings
+# Sessions are read from the cache and written through to the database
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
 SESSION_COOKIE_AGE = 86400
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 
@@ -0,0 +1,21 @@
+# Settings for the test suite
+#
+#   python manage.py test --settings=student_management_system.test_settings
+#
+# SQLite instead of PostgreSQL, plus a second SQLite database, replica1,
+# standing in for a read replica. It is a database of its own rather than a
+# test mirror of 'default', so the routing tests can tell which one a query
+# went to. DATABASE_REPLICAS stays empty; those tests turn it on with
+# override_settings. Views over their query budget fail the tests.
+
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'db.sqlite3'},
+    'replica1': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'replica1.sqlite3'},
+}
+DATABASE_REPLICAS = []
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+QUERY_BUDGET_ENFORCE = True
@@ -19,20 +19,45 @@ urlpatterns = [
     path('admin-dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('teacher-dashboard/', views.teacher_dashboard, name='teacher_dashboard'),
     path('student-dashboard/', views.student_dashboard, name='student_dashboard'),
+    path('async/admin-dashboard/', views.admin_dashboard_async, name='admin_dashboard_async'),
+    path('async/teacher-dashboard/', views.teacher_dashboard_async, name='teacher_dashboard_async'),
+    path('async/student-dashboard/', views.student_dashboard_async, name='student_dashboard_async'),
     
     # Course Management
     path('course-enrollment/', views.course_enrollment, name='course_enrollment'),
     
     # Grade Management
     path('grade-management/', views.grade_management, name='grade_management'),
+    path('grade-management/bulk/', views.grade_bulk_upload, name='grade_bulk_upload'),
+    path('grade-management/import/', views.grade_import, name='grade_import'),
+    path('grade-management/course/<int:course_id>/report/', views.course_grade_report, name='course_grade_report'),
     path('student-grades/', views.student_grades, name='student_grades'),
     
+    # Attendance
+    path('attendance/mark/', views.attendance_bulk_mark, name='attendance_bulk_mark'),
+    path('attendance/course/<int:course_id>/', views.course_attendance, name='course_attendance'),
+
+    # Search
+    path('search/', views.search, name='search'),
+
+    # Exports
+    path('exports/transcript/<int:student_id>/', views.export_transcript, name='export_transcript'),
+    path('exports/gradebook/<int:course_id>/', views.export_gradebook, name='export_gradebook'),
+    path('exports/<str:dataset>/', views.export_dataset, name='export_dataset'),
+
     # Announcements
     path('announcements/', views.announcements, name='announcements'),
+    path('announcements/feed/', views.announcements_feed, name='announcements_feed'),
     path('create-announcement/', views.create_announcement, name='create_announcement'),
+
+    # Notifications
+    path('notifications/unread-count/', views.notifications_unread_count, name='notifications_unread_count'),
     
     # Profile
     path('profile/', views.profile, name='profile'),
+
+    # Monitoring
+    path('metrics/profiling/', views.profiling_metrics, name='profiling_metrics'),
 ]
 
 if settings.DEBUG: